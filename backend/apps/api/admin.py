@@ -59,3 +59,16 @@ class DevolucionesAdmin(admin.ModelAdmin):
 class UsuarioAdmin(admin.ModelAdmin):
     list_display = ("id", "user", "role")
     list_filter = ("role",)
+
+
+@admin.register(models.IdempotencyKey)
+class IdempotencyKeyAdmin(admin.ModelAdmin):
+    list_display = ("id", "scope", "key", "status_code", "created_at", "expires_at")
+    search_fields = ("key",)
+    list_filter = ("scope",)
+
+
+@admin.register(models.DocumentoSerie)
+class DocumentoSerieAdmin(admin.ModelAdmin):
+    list_display = ("id", "documento_tipo", "serie", "siguiente", "updated_at")
+    list_filter = ("documento_tipo",)
@@ -0,0 +1,364 @@
+from __future__ import annotations
+
+from collections import defaultdict
+from datetime import datetime, timedelta
+from decimal import Decimal, InvalidOperation, ROUND_HALF_UP
+from typing import List, Optional
+
+from django.conf import settings
+from django.utils import timezone
+
+from . import (
+    credits,
+    customers,
+    idempotency,
+    models,
+    movimientos,
+    numbering,
+    pricing,
+    product_sales,
+    rollup,
+    timing,
+)
+
+
+PAYMENT_METHOD_MAP = {
+    "CASH": "efectivo",
+    "CARD": "tarjeta",
+    "TRANSFER": "transferencia",
+}
+
+IDEMPOTENCY_SCOPE = "pos-checkout"
+
+
+class CheckoutError(Exception):
+    """A sale that cannot be written; ``as_dict`` is the response body."""
+
+    def __init__(self, detail: str, status: int = 400, **extra):
+        super().__init__(detail)
+        self.detail = detail
+        self.status = status
+        self.extra = extra
+
+    def as_dict(self) -> dict:
+        return {"detail": self.detail, **self.extra}
+
+
+def request_fingerprint(payload) -> str:
+    """Hash of a checkout payload, the same for ``pos/checkout`` and a batch
+    entry: the ``idempotencyKey`` a batch entry carries is left out."""
+    return idempotency.fingerprint({k: v for k, v in payload.items() if k != "idempotencyKey"})
+
+
+def _money(value) -> Decimal:
+    return Decimal(str(value)).quantize(pricing.CENT, rounding=ROUND_HALF_UP)
+
+
+def parse_cart_items(items) -> List[dict]:
+    """Normalize the raw ``items`` payload of ``pos/checkout``.
+
+    Raises ``KeyError``/``TypeError``/``ValueError``/``InvalidOperation`` on
+    malformed lines so callers can answer with a 400.
+    """
+    parsed = []
+    for it in items:
+        price = it.get("unit_price")
+        qty = Decimal(str(it["qty"]))
+        if qty <= 0:
+            raise ValueError("qty")
+        parsed.append(
+            {
+                "product_id": int(it["productId"]),
+                "qty": qty,
+                "price": Decimal(str(price)) if price is not None else None,
+                "override": bool(it.get("override")),
+            }
+        )
+    return parsed
+
+
+def _parse_sold_at(value, now) -> datetime:
+    """Sale time of an offline sale: never in the future, at most
+    ``POS_OFFLINE_MAX_AGE`` seconds old."""
+    if not value:
+        return now
+    sold_at = datetime.fromisoformat(str(value).replace("Z", "+00:00"))
+    if timezone.is_naive(sold_at):
+        sold_at = timezone.make_aware(sold_at)
+    if sold_at < now - timedelta(seconds=settings.POS_OFFLINE_MAX_AGE):
+        raise CheckoutError("Venta offline demasiado antigua")
+    return min(sold_at, now)
+
+
+def known_customer_ids(customer_ids) -> set:
+    ids = {cid for cid in customer_ids if cid}
+    if not ids:
+        return set()
+    return set(models.Clientes.objects.filter(id__in=ids).values_list("id", flat=True))
+
+
+def normalize_customer_id(value) -> Optional[int]:
+    if not value:
+        return None
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        raise CheckoutError("Cliente no existe")
+
+
+def parse_sale(d, now) -> dict:
+    """Parse a checkout payload without touching the database."""
+    try:
+        sale = {
+            "is_credit": d["saleType"] == "CREDIT",
+            "client_total": _money(d["totals"]["total"]),
+            "paid": _money(d.get("paidAmount", 0)),
+            "customer_id": normalize_customer_id(d.get("customerId")),
+            "method": PAYMENT_METHOD_MAP[d["paymentMethod"]],
+            "observaciones": d.get("observaciones"),
+            "fecha": _parse_sold_at(d.get("soldAt"), now),
+            "documento_tipo": d.get("documentType") or "ticket",
+            "documento_serie": str(d.get("documentSeries") or settings.DOCUMENTO_SERIE),
+            "override_token": d.get("overrideToken") or None,
+        }
+    except (KeyError, TypeError, ValueError, InvalidOperation) as exc:
+        raise CheckoutError(f"Venta inválida: {exc}")
+    if sale["documento_tipo"] not in numbering.DOCUMENTO_TIPOS:
+        raise CheckoutError("Tipo de documento inválido")
+
+    items = d.get("items", [])
+    if not items:
+        raise CheckoutError("La venta debe tener items y total mayor a 0")
+    try:
+        sale["lines"] = parse_cart_items(items)
+    except (KeyError, TypeError, ValueError, InvalidOperation):
+        raise CheckoutError("Item inválido")
+    return sale
+
+
+def price_sale(sale, products, known_customers, override_granted: bool) -> dict:
+    """Validate a parsed sale against the catalog and its customer.
+
+    Returns the sale with ``total`` (server side) and priced ``lines``.
+    """
+    cust_id = sale["customer_id"]
+    if cust_id and cust_id not in known_customers:
+        raise CheckoutError("Cliente no existe")
+
+    missing = [line["product_id"] for line in sale["lines"] if line["product_id"] not in products]
+    if missing:
+        raise CheckoutError(f"Producto {missing[0]} no existe")
+
+    try:
+        quote = pricing.price_cart(
+            sale["lines"], products, override_granted=override_granted, at=sale["fecha"]
+        )
+    except pricing.PricingError as exc:
+        raise CheckoutError(str(exc))
+    if quote["has_override"] and not override_granted:
+        raise CheckoutError("Cambio de precio no autorizado", status=403)
+    if quote["mismatches"]:
+        raise CheckoutError(
+            "Precio no coincide con el catálogo", mismatches=quote["mismatches"]
+        )
+    tot = quote["total"]
+    if not pricing.totals_match(sale["client_total"], tot):
+        raise CheckoutError("Total no coincide", total=tot)
+    if tot <= 0:
+        raise CheckoutError("La venta debe tener items y total mayor a 0")
+
+    paid = sale["paid"]
+    method = sale["method"]
+    if sale["is_credit"]:
+        if not cust_id:
+            raise CheckoutError("Cliente requerido para crédito")
+        if not (Decimal("0") <= paid <= tot):
+            raise CheckoutError("Abono inválido")
+    else:
+        if method == "efectivo" and paid < tot:
+            raise CheckoutError("Efectivo debe cubrir total")
+        if method != "efectivo" and paid != tot:
+            raise CheckoutError("Pago debe cubrir total")
+
+    return {
+        **sale,
+        **pricing.iva_breakdown(tot),
+        "total": tot,
+        "lines": quote["lines"],
+        "has_override": quote["has_override"],
+    }
+
+
+def assign_document_numbers(sales) -> None:
+    """Allocate ``documento_numero`` for every sale, one call per series.
+
+    Runs before the checkout transaction; see ``numbering.allocate_many``.
+    """
+    by_series = defaultdict(list)
+    for sale in sales:
+        if not sale.get("documento_numero"):
+            by_series[(sale["documento_tipo"], sale["documento_serie"])].append(sale)
+    for (tipo, serie), group in by_series.items():
+        for sale, numero in zip(group, numbering.allocate_many(tipo, serie, len(group))):
+            sale["documento_numero"] = str(numero)
+
+
+def build_detalle_rows(venta, lines, snapshots, now) -> List[models.DetalleVenta]:
+    """Build unsaved ``DetalleVenta`` rows ready for ``bulk_create``.
+
+    ``lines`` are the priced lines returned by ``pricing.price_cart``. Snapshot
+    fields are filled from ``snapshots`` so the insert does not depend on the
+    per-row trigger lookup.
+    """
+    rows = []
+    for line in lines:
+        snap = snapshots.get(line["product_id"]) or {}
+        rows.append(
+            models.DetalleVenta(
+                venta=venta,
+                producto_id=line["product_id"],
+                cantidad=line["qty"],
+                precio_unitario=line["unit_price"],
+                subtotal=line["subtotal"],
+                fecha_venta=venta.fecha,
+                producto_codigo_snapshot=snap.get("codigo"),
+                producto_nombre_snapshot=snap.get("nombre"),
+                producto_categoria_id_snapshot=snap.get("categoria_id"),
+                producto_categoria_nombre_snapshot=snap.get("categoria__nombre"),
+                override=line["override"],
+                created_at=now,
+                updated_at=now,
+            )
+        )
+    return rows
+
+
+def sale_response(venta) -> dict:
+    return {"id": venta.id, "documento_numero": venta.documento_numero}
+
+
+def write_sales(sales, products, now, timer=None) -> List[models.Ventas]:
+    """Insert priced sales with one bulk insert per table.
+
+    Each sale may carry ``idempotency_key``/``request_hash``; those keys are
+    recorded in the same transaction. Must run inside ``transaction.atomic``.
+    ``timer`` (a ``timing.Timer``) gets one lap per table group.
+    """
+    timer = timer or timing.NULL_TIMER
+    ventas = models.Ventas.objects.bulk_create(
+        [
+            models.Ventas(
+                fecha=sale["fecha"],
+                cliente_id=sale["customer_id"],
+                total=sale["total"],
+                iva_monto=sale["iva_monto"],
+                iva_porcentaje=sale["iva_porcentaje"],
+                estado="completada",
+                metodo_pago=sale["method"],
+                documento_tipo=sale["documento_tipo"],
+                documento_serie=sale["documento_serie"],
+                documento_numero=sale.get("documento_numero"),
+                created_at=now,
+                updated_at=now,
+            )
+            for sale in sales
+        ]
+    )
+
+    keys = [
+        (sale["idempotency_key"], sale["request_hash"], sale_response(venta), 201)
+        for sale, venta in zip(sales, ventas)
+        if sale.get("idempotency_key")
+    ]
+    if keys:
+        idempotency.store_many(IDEMPOTENCY_SCOPE, keys, now)
+    timer.lap("venta")
+
+    detalles = []
+    for sale, venta in zip(sales, ventas):
+        detalles.extend(build_detalle_rows(venta, sale["lines"], products, now))
+    models.DetalleVenta.objects.bulk_create(detalles)
+    timer.lap("lineas")
+
+    credit_sales = [(sale, venta) for sale, venta in zip(sales, ventas) if sale["is_credit"]]
+    pagos = []
+    if credit_sales:
+        splits = rollup.line_splits(detalles)
+        for sale, venta in credit_sales:
+            sale["split"] = splits.get(venta.id, (Decimal("0"), Decimal("0")))
+        if settings.CREDITO_CUENTA_UNICA:
+            creditos = credits.charge_accounts(credit_sales, now)
+        else:
+            creditos = models.Creditos.objects.bulk_create(
+                [
+                    models.Creditos(
+                        cliente_id=sale["customer_id"],
+                        total_deuda=sale["total"],
+                        pagado=sale["paid"],
+                        pagos_total=sale["paid"],
+                        saldo=sale["total"] - sale["paid"],
+                        monto_nuevo=sale["split"][0],
+                        monto_usado=sale["split"][1],
+                        fecha_ultima_compra=venta.fecha,
+                        estado="pendiente",
+                        observaciones=sale["observaciones"],
+                        created_at=now,
+                        updated_at=now,
+                    )
+                    for sale, venta in credit_sales
+                ]
+            )
+        models.CreditosHistorialCompras.objects.bulk_create(
+            [
+                models.CreditosHistorialCompras(
+                    credito=credito,
+                    venta=venta,
+                    fecha=venta.fecha,
+                    monto=sale["total"],
+                    pagado=sale["paid"],
+                    saldo=sale["total"] - sale["paid"],
+                    estado="pendiente",
+                    created_at=now,
+                    updated_at=now,
+                )
+                for (sale, venta), credito in zip(credit_sales, creditos)
+            ]
+        )
+        pagos = [
+            models.PagosCredito(
+                credito=credito,
+                fecha=venta.fecha,
+                monto=sale["paid"],
+                concepto="Abono inicial",
+                metodo_pago=sale["method"],
+                created_at=now,
+                updated_at=now,
+            )
+            for (sale, venta), credito in zip(credit_sales, creditos)
+            if sale["paid"] > 0
+        ]
+        if pagos:
+            rollup.assign_splits(pagos, rollup.credit_splits(creditos))
+            models.PagosCredito.objects.bulk_create(pagos)
+        timer.lap("credito")
+
+    # Customers, then the daily rollup, the product counters and the history
+    # rows: locks follow locking.LOCK_ORDER.
+    customers.record_purchases(sales)
+    timer.lap("cliente_stats")
+
+    deltas = rollup.new_deltas()
+    rollup.add_lines(deltas, detalles, {venta.id for _, venta in credit_sales})
+    if pagos:
+        rollup.add_payments(deltas, pagos)
+    rollup.apply(deltas, now)
+    productos = product_sales.new_deltas()
+    product_sales.add_lines(productos, detalles)
+    product_sales.apply(productos, now)
+    credit_ids = {venta.id for _, venta in credit_sales}
+    movimientos.insert(
+        movimientos.sale_rows(venta for venta in ventas if venta.id not in credit_ids)
+        + movimientos.payment_rows(pagos, {pago.credito_id: pago.credito for pago in pagos})
+    )
+    timer.lap("resumen")
+    return ventas
@@ -0,0 +1,102 @@
+from __future__ import annotations
+
+from decimal import Decimal
+from typing import Iterable, List
+
+from . import models
+
+
+ACCOUNT_FIELDS = [
+    "total_deuda",
+    "pagado",
+    "saldo",
+    "pagos_total",
+    "devuelto_total",
+    "ingreso_revertido",
+    "monto_nuevo",
+    "monto_usado",
+    "fecha_ultima_compra",
+    "estado",
+    "updated_at",
+]
+
+
+def estado_for(saldo: Decimal) -> str:
+    return "pagado" if saldo <= 0 else "pendiente"
+
+
+PAYMENT_FIELDS = ["pagado", "saldo", "pagos_total", "estado", "updated_at"]
+
+
+def apply_payment(credito, monto: Decimal, now) -> None:
+    """Add a payment to ``credito`` in memory; a negative ``monto`` takes one back."""
+    credito.pagado += monto
+    credito.saldo -= monto
+    credito.pagos_total += monto
+    credito.estado = estado_for(credito.saldo)
+    credito.updated_at = now
+
+
+def open_accounts(customer_ids: Iterable[int], now) -> dict:
+    """Lock the open credit account of each customer, creating missing ones.
+
+    The partial unique index on ``creditos (cliente_id) WHERE cuenta`` makes the
+    insert safe under concurrency; rows are locked in ``cliente_id`` order.
+    Must run inside ``transaction.atomic``.
+    """
+    ids = sorted(set(customer_ids))
+    models.Creditos.objects.bulk_create(
+        [
+            models.Creditos(
+                cliente_id=cid, cuenta=True, estado="pagado", created_at=now, updated_at=now
+            )
+            for cid in ids
+        ],
+        ignore_conflicts=True,
+    )
+    accounts = (
+        models.Creditos.objects.select_for_update()
+        .filter(cliente_id__in=ids, cuenta=True)
+        .order_by("cliente_id")
+    )
+    return {account.cliente_id: account for account in accounts}
+
+
+def apply_charge(account, total: Decimal, paid: Decimal, fecha, now, split=None) -> None:
+    """Add a credit sale to ``account`` in memory.
+
+    ``split`` is the sale's ``(new, used)`` amount; without it the whole
+    sale counts as new.
+    """
+    nuevo, usado = split or (total, Decimal("0"))
+    account.monto_nuevo += nuevo
+    account.monto_usado += usado
+    account.total_deuda += total
+    account.pagado += paid
+    account.pagos_total += paid
+    account.saldo += total - paid
+    if account.fecha_ultima_compra is None or fecha > account.fecha_ultima_compra:
+        account.fecha_ultima_compra = fecha
+    account.estado = estado_for(account.saldo)
+    account.updated_at = now
+
+
+def charge_accounts(credit_sales, now) -> List[models.Creditos]:
+    """Append ``(sale, venta)`` pairs to their customers' accounts.
+
+    A sale's ``observaciones`` are appended to the account's, as
+    consolidar_creditos does for merged credits. Returns the account of each
+    pair, aligned with ``credit_sales``.
+    """
+    accounts = open_accounts((sale["customer_id"] for sale, _ in credit_sales), now)
+    result = []
+    for sale, venta in credit_sales:
+        account = accounts[sale["customer_id"]]
+        apply_charge(account, sale["total"], sale["paid"], venta.fecha, now, sale.get("split"))
+        if sale.get("observaciones"):
+            notas = [account.observaciones] if account.observaciones else []
+            account.observaciones = "\n".join(notas + [sale["observaciones"]])
+        result.append(account)
+    for account in accounts.values():
+        account.save(update_fields=ACCOUNT_FIELDS + ["observaciones"])
+    return result
@@ -0,0 +1,82 @@
+from __future__ import annotations
+
+from collections import defaultdict
+from typing import Iterable
+
+from django.db import connection
+from django.db.models import F, Value
+from django.db.models.functions import Greatest
+
+from . import models
+
+
+# Ventas with this estado (case-insensitive) do not count as purchases.
+VOID_ESTADO = "anulada"
+
+# Voided sales count for neither column; the stored date is only kept for a
+# customer with no sales at all (an imported one).
+_REFRESH_SQL = """
+UPDATE clientes c
+   SET fecha_ultima_compra = CASE WHEN s.ventas > 0 THEN s.ultima ELSE c.fecha_ultima_compra END,
+       compras_count = s.n
+  FROM (
+    SELECT cl.id,
+           MAX(v.fecha) FILTER (WHERE lower(v.estado) <> %(anulada)s) AS ultima,
+           COUNT(v.id) FILTER (WHERE lower(v.estado) <> %(anulada)s) AS n,
+           COUNT(v.id) AS ventas
+      FROM clientes cl
+      LEFT JOIN ventas v ON v.cliente_id = cl.id
+     WHERE {where}
+     GROUP BY cl.id
+  ) s
+ WHERE c.id = s.id
+"""
+
+
+def record_purchases(sales) -> None:
+    """Bump ``fecha_ultima_compra``/``compras_count`` for freshly written sales.
+
+    ``sales`` need ``customer_id`` and ``fecha``. One UPDATE per customer, in
+    id order, inside the caller's transaction.
+    """
+    per_customer = defaultdict(lambda: [None, 0])
+    for sale in sales:
+        if not sale["customer_id"]:
+            continue
+        entry = per_customer[sale["customer_id"]]
+        entry[0] = sale["fecha"] if entry[0] is None else max(entry[0], sale["fecha"])
+        entry[1] += 1
+    for customer_id in sorted(per_customer):
+        fecha, count = per_customer[customer_id]
+        # GREATEST ignores NULL in PostgreSQL, so a first purchase sets the date.
+        models.Clientes.objects.filter(id=customer_id).update(
+            fecha_ultima_compra=Greatest("fecha_ultima_compra", Value(fecha)),
+            compras_count=F("compras_count") + count,
+        )
+
+
+def refresh_stats(customer_ids: Iterable[int]) -> int:
+    """Recompute the purchase stats of ``customer_ids`` from ``ventas``.
+
+    Used when a sale is created, voided, deleted or moved to another customer
+    outside checkout. A customer left without sales keeps the stored date, as
+    imported customers do.
+    """
+    ids = sorted({cid for cid in customer_ids if cid})
+    if not ids:
+        return 0
+    with connection.cursor() as cursor:
+        cursor.execute(
+            _REFRESH_SQL.format(where="cl.id = ANY(%(ids)s)"), {"anulada": VOID_ESTADO, "ids": ids}
+        )
+        return cursor.rowcount
+
+
+def refresh_range(start_id: int, end_id: int) -> int:
+    """Recompute stats for customers with ``start_id <= id < end_id``."""
+    with connection.cursor() as cursor:
+        cursor.execute(
+            _REFRESH_SQL.format(where="cl.id >= %(start)s AND cl.id < %(end)s"),
+            {"anulada": VOID_ESTADO, "start": start_id, "end": end_id},
+        )
+        return cursor.rowcount
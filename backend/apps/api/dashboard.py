@@ -0,0 +1,362 @@
+from __future__ import annotations
+
+import calendar
+import threading
+import uuid
+from collections import defaultdict
+from datetime import date, timedelta
+from decimal import Decimal
+from typing import Optional
+
+import pandas as pd
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Count, F, Q, Sum
+from django.db.models.functions import Coalesce
+from django.db.models.signals import post_delete, post_save
+
+from . import models, product_sales
+
+
+# reportes_dashboard in a fixed number of queries: the daily rollup is read
+# once as a (day, condition) grid and every period of the chart is derived
+# from it in pandas; the other sections are one query each.
+SECTIONS = ("all", "new", "used")
+PERIODS = ("diario", "quincenal", "mensual", "todos")
+ROLLUP_COLUMNS = ["dia", "condicion", "ventas", "ventas_total", "costo_total", "devoluciones"]
+TOTALS = ["ventas", "price_total", "cost_total", "devoluciones"]
+ZERO = Decimal("0")
+
+SALES_VERSION_KEY = "dashboard:sales_version"
+
+_STATS: dict = defaultdict(lambda: defaultdict(lambda: {"hits": 0, "misses": 0}))
+_LOCK = threading.Lock()
+
+
+def _dec(value) -> Decimal:
+    return value if isinstance(value, Decimal) else Decimal(value)
+
+
+def condition_filter(section: str, prefix: str = "") -> Q:
+    """Sold lines of a section; lines without a condition count as new."""
+    used = Q(**{f"{prefix}producto_condicion_snapshot__iexact": "used"})
+    if section == "used":
+        return used
+    if section == "new":
+        return ~used
+    return Q()
+
+
+def load_rollup(section: str, desde: Optional[date] = None) -> pd.DataFrame:
+    """One row per (day, condition) of ventas_resumen_diario, channels merged,
+    from ``desde`` on when given."""
+    qs = models.VentasResumenDiario.objects.all()
+    if desde is not None:
+        qs = qs.filter(dia__gte=desde)
+    if section != "all":
+        qs = qs.filter(condicion=section)
+    rows = (
+        qs.values("dia", "condicion")
+        .annotate(
+            ventas=Sum(F("ingreso") - F("ingreso_revertido")),
+            ventas_total_sum=Sum("ventas_total"),
+            costo_total_sum=Sum("costo_total"),
+            devoluciones=Sum("devoluciones_total"),
+        )
+        .values_list(
+            "dia", "condicion", "ventas", "ventas_total_sum", "costo_total_sum", "devoluciones"
+        )
+    )
+    return pd.DataFrame.from_records(list(rows), columns=ROLLUP_COLUMNS)
+
+
+def _prepare(frame: pd.DataFrame, section: str) -> pd.DataFrame:
+    frame = frame.copy()
+    frame["dia"] = pd.to_datetime(frame["dia"])
+    # Profit for "all" only covers new items.
+    in_profit = frame["condicion"] == "new" if section == "all" else frame["condicion"].notna()
+    frame["price_total"] = frame["ventas_total"].where(in_profit, ZERO)
+    frame["cost_total"] = frame["costo_total"].where(in_profit, ZERO)
+    return frame
+
+
+def _totals(frame: pd.DataFrame) -> dict:
+    return {col: _dec(frame[col].sum()) for col in TOTALS}
+
+
+def _grouped(frame: pd.DataFrame, key) -> dict:
+    if frame.empty:
+        return {}
+    sums = frame.groupby(key)[TOTALS].sum()
+    return {idx: {col: _dec(row[col]) for col in TOTALS} for idx, row in sums.iterrows()}
+
+
+def _period_row(periodo, data: dict) -> dict:
+    profit = data["price_total"] - data["cost_total"]
+    return {
+        "periodo": periodo,
+        "ventas": data["ventas"],
+        "utilidad": profit,
+        "price_total": data["price_total"],
+        "cost_total": data["cost_total"],
+        "profit_total": profit,
+    }
+
+
+def period_start(period: str, today: date):
+    """First rollup day a chart period needs; ``None`` for the whole history."""
+    if period == "diario":
+        return today - timedelta(days=6)
+    if period == "quincenal":
+        return today.replace(day=1)
+    if period == "mensual":
+        return today.replace(month=1, day=1)
+    return None
+
+
+def sales_stats(frame: pd.DataFrame, today: date) -> dict:
+    """Today's sales and this month's refunds from a prepared frame."""
+    month_start = pd.Timestamp(today.replace(day=1))
+    this_month = frame[frame["dia"] >= month_start]
+    return {
+        "ventas_hoy": _totals(frame[frame["dia"] == pd.Timestamp(today)])["ventas"],
+        "devoluciones_mensuales": _totals(
+            this_month[this_month["dia"] < month_start + pd.offsets.MonthBegin(1)]
+        )["devoluciones"],
+    }
+
+
+def chart_series(frame: pd.DataFrame, period: str, today: date) -> list:
+    """The rows of one chart period from a prepared frame."""
+    empty = dict.fromkeys(TOTALS, ZERO)
+    start = period_start(period, today)
+    if start is not None:
+        frame = frame[frame["dia"] >= pd.Timestamp(start)]
+
+    if period == "diario":
+        by_day = _grouped(frame, "dia")
+        days = [start + timedelta(days=offset) for offset in range(7)]
+        return [
+            _period_row(day.strftime("%Y-%m-%d"), by_day.get(pd.Timestamp(day), empty))
+            for day in days
+        ]
+    if period == "quincenal":
+        month_end = pd.Timestamp(start) + pd.offsets.MonthBegin(1)
+        this_month = frame[frame["dia"] < month_end]
+        halves = _grouped(this_month, this_month["dia"].dt.day > 15)
+        last_day = calendar.monthrange(today.year, today.month)[1]
+        return [
+            _period_row("1-15", halves.get(False, empty)),
+            _period_row(f"16-{last_day}", halves.get(True, empty)),
+        ]
+    if period == "mensual":
+        this_year = frame[frame["dia"].dt.year == today.year]
+        return [
+            _period_row(date(today.year, int(month), 1).strftime("%b"), data)
+            for month, data in sorted(_grouped(this_year, this_year["dia"].dt.month).items())
+        ]
+    return [
+        _period_row(int(year), data)
+        for year, data in sorted(_grouped(frame, frame["dia"].dt.year).items())
+    ]
+
+
+def sales_chart(frame: pd.DataFrame, section: str, today: date) -> tuple:
+    """``(stats, sales_chart)`` sales figures derived from the rollup frame."""
+    frame = _prepare(frame, section)
+    return sales_stats(frame, today), {
+        period: chart_series(frame, period, today) for period in PERIODS
+    }
+
+
+def _sold_ventas(section: str):
+    return models.DetalleVenta.objects.filter(condition_filter(section)).values("venta_id")
+
+
+def catalog_stats(section: str) -> dict:
+    # Products no longer carry stock, cost or condition, so the catalog
+    # figures cover the whole catalog and there is no inventory to value.
+    creditos_qs = models.CreditosHistorialCompras.objects.all()
+    if section != "all":
+        creditos_qs = creditos_qs.filter(venta_id__in=_sold_ventas(section))
+    return {
+        "total_productos": models.Productos.objects.count(),
+        "creditos_pendientes": creditos_qs.aggregate(total=Coalesce(Sum("saldo"), ZERO))["total"],
+        "valor_inventario": ZERO,
+    }
+
+
+def category_data() -> list:
+    return [
+        {"name": c.nombre, "value": c.value}
+        for c in models.Categorias.objects.annotate(value=Count("productos"))
+        .filter(value__gt=0)
+        .order_by("-value")
+    ]
+
+
+def recent_sales(section: str) -> list:
+    ventas_qs = models.Ventas.objects.select_related("cliente")
+    if section != "all":
+        ventas_qs = ventas_qs.filter(id__in=_sold_ventas(section))
+    return [
+        {
+            "id": v.id,
+            "customer": (v.cliente.razon_social or v.cliente.nombre) if v.cliente else "Sin cliente",
+            "amount": v.total,
+            "status": v.estado,
+        }
+        for v in ventas_qs.order_by("-fecha")[:5]
+    ]
+
+
+def top_products(section: str) -> list:
+    # Top products for "all" only covers new items, like profit.
+    return product_sales.top_products("new" if section == "all" else section)
+
+
+def _stats_payload(sales: dict, catalog: dict) -> dict:
+    return {
+        "total_productos": catalog["total_productos"],
+        "ventas_hoy": sales["ventas_hoy"],
+        "creditos_pendientes": catalog["creditos_pendientes"],
+        "valor_inventario": catalog["valor_inventario"],
+        "devoluciones_mensuales": sales["devoluciones_mensuales"],
+    }
+
+
+def build(section: str, today: date) -> dict:
+    """The full reportes_dashboard payload for ``section``."""
+    stats, chart = sales_chart(load_rollup(section), section, today)
+    return {
+        "stats": _stats_payload(stats, catalog_stats(section)),
+        "sales_chart": chart,
+        "recent_sales": recent_sales(section),
+        "low_stock_items": [],
+        "category_data": category_data(),
+        "top_products": top_products(section),
+    }
+
+
+def build_stats(section: str, today: date) -> dict:
+    """Summary cards: only this month of the rollup is read."""
+    frame = _prepare(load_rollup(section, today.replace(day=1)), section)
+    return {
+        "stats": _stats_payload(sales_stats(frame, today), catalog_stats(section)),
+        "low_stock_items": [],
+        "category_data": category_data(),
+    }
+
+
+def build_chart(section: str, today: date, period: str = "diario") -> dict:
+    """One chart period, reading only the rollup days it covers."""
+    frame = _prepare(load_rollup(section, period_start(period, today)), section)
+    return {"period": period, "data": chart_series(frame, period, today)}
+
+
+def build_top_products(section: str, today: date) -> dict:
+    return {"top_products": top_products(section)}
+
+
+def build_recent(section: str, today: date) -> dict:
+    return {"recent_sales": recent_sales(section)}
+
+
+# Each part is cached on its own, under its own TTL (settings.DASHBOARD_CACHE_TTLS),
+# so the page can fetch them concurrently; "dashboard" is the combined payload.
+BUILDERS = {
+    "dashboard": build,
+    "stats": build_stats,
+    "chart": build_chart,
+    "top_products": build_top_products,
+    "recent": build_recent,
+}
+
+
+def cache_version(key: str) -> str:
+    """Current value of a version key, created on first use."""
+    version = cache.get(key)
+    if version is None:
+        cache.add(key, uuid.uuid4().hex, None)
+        version = cache.get(key)
+    return version
+
+
+def bump_cache_version(key: str) -> None:
+    cache.set(key, uuid.uuid4().hex, None)
+
+
+def sales_version() -> str:
+    """Shared version of the data behind the dashboard; any write changes it."""
+    return cache_version(SALES_VERSION_KEY)
+
+
+def bump_sales_version() -> None:
+    bump_cache_version(SALES_VERSION_KEY)
+
+
+def invalidate() -> None:
+    """Bump the sales version once the current transaction commits."""
+    transaction.on_commit(bump_sales_version)
+
+
+def cached(part: str, section: str, today: date, **params) -> tuple:
+    """``(payload, hit)``: a dashboard part cached per section, parameters,
+    day and sales version.
+
+    The version is read before building, so a write that lands meanwhile
+    stores the payload under a version nobody asks for any more.
+    """
+    extra = "".join(f":{name}={value}" for name, value in sorted(params.items()))
+    key = f"dashboard:{part}:{section}{extra}:{today.isoformat()}:{sales_version()}"
+    payload = cache.get(key)
+    hit = payload is not None
+    if not hit:
+        payload = BUILDERS[part](section, today, **params)
+        ttl = settings.DASHBOARD_CACHE_TTLS.get(part, settings.DASHBOARD_CACHE_TTL)
+        cache.set(key, payload, ttl)
+    with _LOCK:
+        _STATS[part][section]["hits" if hit else "misses"] += 1
+    return payload, hit
+
+
+def cached_build(section: str, today: date) -> tuple:
+    return cached("dashboard", section, today)
+
+
+def cache_stats() -> dict:
+    with _LOCK:
+        return {
+            part: {section: dict(counts) for section, counts in sections.items()}
+            for part, sections in _STATS.items()
+        }
+
+
+def reset_cache_stats() -> None:
+    with _LOCK:
+        _STATS.clear()
+
+
+# Bulk writers (checkout, refunds, payments) invalidate through rollup.apply;
+# these catch single-row edits from the CRUD endpoints and the admin.
+_WATCHED = (
+    models.Productos,
+    models.Categorias,
+    models.Clientes,
+    models.Ventas,
+    models.DetalleVenta,
+    models.Creditos,
+    models.CreditosHistorialCompras,
+    models.PagosCredito,
+    models.Devoluciones,
+)
+
+
+def _invalidate_dashboard(sender, **kwargs):
+    invalidate()
+
+
+for _model in _WATCHED:
+    post_save.connect(_invalidate_dashboard, sender=_model)
+    post_delete.connect(_invalidate_dashboard, sender=_model)
@@ -0,0 +1,95 @@
+from __future__ import annotations
+
+import base64
+from datetime import datetime
+from typing import Optional, Tuple
+
+from django.db.models import Q
+from django.utils import timezone
+
+from . import models, movimientos
+
+
+# historial_ventas reads the movimientos table, newest first, in the order of
+# its (fecha DESC, id) index. A cursor is the key of the last row shown, so a
+# page reads ``page_size + 1`` index entries past it at any depth.
+
+
+class CursorError(ValueError):
+    pass
+
+
+def encode_cursor(key: Tuple[datetime, int]) -> str:
+    fecha, pk = key
+    raw = f"{fecha.isoformat()}|{pk}"
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+
+def decode_cursor(value: str) -> Tuple[datetime, int]:
+    try:
+        raw = base64.urlsafe_b64decode(value + "=" * (-len(value) % 4)).decode()
+        fecha, pk = raw.split("|")
+        key = (datetime.fromisoformat(fecha), int(pk))
+    except ValueError as exc:
+        raise CursorError("Cursor inválido") from exc
+    if timezone.is_naive(key[0]):
+        raise CursorError("Cursor inválido")
+    return key
+
+
+def after(cursor) -> Q:
+    """Rows that sort after ``cursor`` in (fecha DESC, id) order."""
+    fecha, pk = cursor
+    return Q(fecha__lt=fecha) | Q(fecha=fecha, id__gt=pk)
+
+
+def queryset(period, search: str = ""):
+    """History rows for the period and search term, in page order."""
+    qs = period.filter(models.Movimientos.objects.select_related("cliente", "venta"))
+    if search:
+        q = Q(cliente__nombre__icontains=search)
+        if search.isdigit():
+            q |= Q(venta_id=int(search))
+        qs = qs.filter(q)
+    return qs.order_by("-fecha", "id")
+
+
+def cliente_nombre(cliente) -> str:
+    if cliente is None:
+        return "Cliente General"
+    return cliente.nombre or cliente.razon_social or cliente.nombre_comercial or "Cliente General"
+
+
+def row(mov) -> dict:
+    return {
+        "id": mov.origen_id,
+        "fecha": mov.fecha,
+        "monto": float(mov.monto),
+        "venta_id": mov.venta_id,
+        "cliente": cliente_nombre(mov.cliente),
+        "tipo": mov.tipo,
+        "nota": mov.nota,
+        "ingreso_afectado": float(mov.ingreso_afectado),
+        "venta_numero": (
+            mov.venta.documento_numero
+            if mov.venta is not None and mov.tipo != movimientos.ABONO
+            else None
+        ),
+    }
+
+
+def page(qs, page_size: int, cursor=None, offset: int = 0) -> Tuple[list, Optional[str]]:
+    """``(rows, next_cursor)``: one page of ``qs``.
+
+    With ``cursor`` the page starts after it; without it ``offset`` rows are
+    skipped (numbered page jumps).
+    """
+    if cursor is not None:
+        qs = qs.filter(after(cursor))
+        offset = 0
+    movs = list(qs[offset : offset + page_size + 1])
+    next_cursor = None
+    if len(movs) > page_size:
+        last = movs[page_size - 1]
+        next_cursor = encode_cursor((last.fecha, last.id))
+    return [row(mov) for mov in movs[:page_size]], next_cursor
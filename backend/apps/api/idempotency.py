@@ -0,0 +1,115 @@
+from __future__ import annotations
+
+import hashlib
+import json
+import time
+from datetime import timedelta
+from typing import Optional
+
+from django.conf import settings
+from django.db import transaction
+from rest_framework.response import Response
+
+from . import models
+
+
+HEADER = "Idempotency-Key"
+MAX_KEY_LENGTH = 255
+
+_LAST_PURGE: float = 0.0
+
+
+def get_key(request) -> Optional[str]:
+    key = (request.headers.get(HEADER) or "").strip()
+    if not key:
+        return None
+    return key[:MAX_KEY_LENGTH]
+
+
+def fingerprint(payload) -> str:
+    """Stable hash of a JSON payload, used to detect a key reused for another request."""
+    raw = json.dumps(payload, sort_keys=True, separators=(",", ":"), default=str)
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+def _replay_response(record: models.IdempotencyKey) -> Response:
+    response = Response(record.response, status=record.status_code)
+    response["Idempotent-Replayed"] = "true"
+    return response
+
+
+def lookup(scope: str, key: str, request_hash: str, now) -> Optional[Response]:
+    """Return the stored response for ``key`` or ``None`` if the request must run.
+
+    Expired records are removed so the key can be used again.
+    """
+    record = models.IdempotencyKey.objects.filter(scope=scope, key=key).first()
+    if record is None:
+        return None
+    if record.expires_at <= now:
+        record.delete()
+        return None
+    if record.request_hash != request_hash:
+        return Response(
+            {"detail": f"{HEADER} ya fue usada con otra solicitud"}, status=422
+        )
+    return _replay_response(record)
+
+
+def find_many(scope: str, keys, now) -> dict:
+    """Return the live records for ``keys`` in one query, keyed by key."""
+    keys = [key for key in keys if key]
+    if not keys:
+        return {}
+    records = models.IdempotencyKey.objects.filter(
+        scope=scope, key__in=keys, expires_at__gt=now
+    )
+    return {record.key: record for record in records}
+
+
+def store(scope: str, key: str, request_hash: str, payload, status_code: int, now) -> None:
+    """Record the response of a request.
+
+    Must run inside the same transaction as the write it protects: a concurrent
+    retry with the same key blocks on the unique index and then fails with
+    ``IntegrityError``, after which ``lookup`` returns the committed response.
+    """
+    store_many(scope, [(key, request_hash, payload, status_code)], now)
+
+
+def store_many(scope: str, entries, now) -> None:
+    """Bulk variant of ``store``; ``entries`` are ``(key, hash, payload, status)`` tuples.
+
+    Expired records for the same keys are replaced, so a key retried after its
+    TTL does not trip the unique index.
+    """
+    expires_at = now + timedelta(seconds=settings.IDEMPOTENCY_KEY_TTL)
+    models.IdempotencyKey.objects.filter(
+        scope=scope, key__in=[entry[0] for entry in entries], expires_at__lte=now
+    ).delete()
+    models.IdempotencyKey.objects.bulk_create(
+        [
+            models.IdempotencyKey(
+                scope=scope,
+                key=key,
+                request_hash=request_hash,
+                response=payload,
+                status_code=status_code,
+                created_at=now,
+                expires_at=expires_at,
+            )
+            for key, request_hash, payload, status_code in entries
+        ]
+    )
+    transaction.on_commit(lambda: purge_expired(now))
+
+
+def purge_expired(now, force: bool = False) -> int:
+    """Delete expired keys, at most once per ``IDEMPOTENCY_PURGE_INTERVAL`` per process."""
+    global _LAST_PURGE
+    current = time.monotonic()
+    if not force and current - _LAST_PURGE < settings.IDEMPOTENCY_PURGE_INTERVAL:
+        return 0
+    _LAST_PURGE = current
+    deleted, _ = models.IdempotencyKey.objects.filter(expires_at__lte=now).delete()
+    return deleted
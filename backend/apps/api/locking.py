@@ -0,0 +1,127 @@
+from __future__ import annotations
+
+import random
+import threading
+import time
+from collections import defaultdict
+from typing import Iterable, Optional, Sequence, Tuple
+
+from django.conf import settings
+from django.db import DatabaseError, connection, transaction
+from rest_framework.exceptions import APIException
+
+from . import timing
+
+
+# Every write path takes row locks in this table order, and by id inside a
+# table, so two transactions can never wait on each other in a cycle. The
+# daily rollup and the product counters are upserted last, in key order (see
+# rollup.apply and product_sales.apply; edits lock their keys the same way in
+# rollup.rebuild_days and product_sales.rebuild_months), then the history rows
+# are written. productos is not locked: since migration 0016 removed stock,
+# checkout and refunds only read the catalog and never update product rows.
+LOCK_ORDER = (
+    "ventas",
+    "detalle_venta",
+    "creditos",
+    "clientes",
+    "ventas_resumen_diario",
+    "ventas_producto_mensual",
+    "movimientos",
+)
+
+RETRYABLE = {
+    "40001": "serialization_failures",
+    "40P01": "deadlocks",
+    "55P03": "lock_timeouts",
+}
+
+_STATS: dict = defaultdict(lambda: defaultdict(int))
+_LOCK = threading.Lock()
+
+
+class TransactionConflict(APIException):
+    status_code = 409
+    default_detail = "Conflicto con otra operación en curso; intente de nuevo"
+    default_code = "transaction_conflict"
+
+
+def _count(endpoint: str, key: str) -> None:
+    with _LOCK:
+        _STATS[endpoint][key] += 1
+
+
+def sqlstate(exc: BaseException) -> Optional[str]:
+    cause = exc.__cause__ or exc
+    return getattr(cause, "pgcode", None) or getattr(cause, "sqlstate", None)
+
+
+def backoff(attempt: int) -> float:
+    """Seconds to sleep before retry ``attempt`` (full jitter)."""
+    cap = settings.TX_RETRY_BASE_MS * (2 ** attempt)
+    return random.uniform(0, cap) / 1000
+
+
+def run_atomic(endpoint: str, fn, *args, **kwargs):
+    """Run ``fn`` in ``transaction.atomic`` and retry it on deadlock,
+    serialization failure or lock timeout.
+
+    ``fn`` must be safe to re-run from scratch. Inside an outer transaction
+    there is nothing to retry, so ``fn`` just runs once.
+    """
+    if connection.in_atomic_block:
+        with transaction.atomic():
+            return fn(*args, **kwargs)
+
+    attempts = settings.TX_MAX_RETRIES + 1
+    for attempt in range(attempts):
+        try:
+            with transaction.atomic():
+                if settings.TX_LOCK_TIMEOUT_MS:
+                    with connection.cursor() as cursor:
+                        cursor.execute(
+                            "SELECT set_config('lock_timeout', %s, true)",
+                            [f"{settings.TX_LOCK_TIMEOUT_MS}ms"],
+                        )
+                result = fn(*args, **kwargs)
+            _count(endpoint, "transactions")
+            return result
+        except DatabaseError as exc:
+            reason = RETRYABLE.get(sqlstate(exc))
+            if reason is None:
+                raise
+            _count(endpoint, reason)
+            if attempt == attempts - 1:
+                _count(endpoint, "conflicts")
+                raise TransactionConflict() from exc
+            _count(endpoint, "retries")
+            time.sleep(backoff(attempt))
+
+
+def lock_rows(endpoint: str, requests: Iterable[Tuple[type, Sequence]]) -> dict:
+    """``SELECT ... FOR UPDATE`` the given rows in canonical order.
+
+    ``requests`` are ``(Model, ids)`` pairs; the result maps each model to an
+    ``{id: instance}`` dict. Time spent waiting is recorded as the
+    ``lock_wait`` phase of ``endpoint``.
+    """
+    pending = [(model, sorted({pk for pk in ids if pk is not None})) for model, ids in requests]
+    pending.sort(key=lambda item: LOCK_ORDER.index(item[0]._meta.db_table))
+    start = time.perf_counter()
+    locked = {}
+    for model, ids in pending:
+        rows = model.objects.select_for_update().filter(id__in=ids).order_by("id") if ids else []
+        locked[model] = {row.id: row for row in rows}
+    timing.record(endpoint, [("lock_wait", (time.perf_counter() - start) * 1000)])
+    return locked
+
+
+def snapshot() -> dict:
+    with _LOCK:
+        return {endpoint: dict(counts) for endpoint, counts in _STATS.items()}
+
+
+def reset() -> None:
+    with _LOCK:
+        _STATS.clear()
+
@@ -0,0 +1,33 @@
+"""Recalcula fecha_ultima_compra y compras_count de clientes desde ventas.
+
+Se ejecuta una vez tras la migración 0019; recorre clientes por rangos de id,
+cada rango en su propia transacción para no bloquear la tabla completa.
+
+    python manage.py backfill_clientes_compras --batch-size 1000
+"""
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Max, Min
+
+from apps.api import customers, models
+
+
+class Command(BaseCommand):
+    help = "Recalcula fecha_ultima_compra y compras_count de todos los clientes."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=1000)
+
+    def handle(self, *args, **opts):
+        bounds = models.Clientes.objects.aggregate(lo=Min("id"), hi=Max("id"))
+        if bounds["lo"] is None:
+            self.stdout.write("No hay clientes")
+            return
+        size = max(opts["batch_size"], 1)
+        updated = 0
+        for start in range(bounds["lo"], bounds["hi"] + 1, size):
+            with transaction.atomic():
+                updated += customers.refresh_range(start, start + size)
+            if opts["verbosity"] > 1:
+                self.stdout.write(f"  ids {start}-{start + size - 1}: {updated}")
+        self.stdout.write(self.style.SUCCESS(f"Clientes actualizados: {updated}"))
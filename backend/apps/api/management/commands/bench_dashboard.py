@@ -0,0 +1,363 @@
+"""Presupuesto de consultas y latencia del dashboard de reportes.
+
+Siembra años de ventas, créditos, abonos y devoluciones sintéticos, reconstruye
+los resúmenes y mide reportes/dashboard (y sus partes) para cada sección: número
+de consultas SQL y p95 de latencia, con la caché fría y caliente. Falla si se
+pasa de los límites. Escribe datos reales: usar sólo contra una base PostgreSQL
+local de pruebas.
+
+    python manage.py bench_dashboard --years 3 --sales-per-day 150
+    python manage.py bench_dashboard --skip-seed --runs 50 --json
+"""
+from __future__ import annotations
+
+import json
+import random
+import time
+import uuid
+from datetime import datetime, time as dt_time, timedelta
+from decimal import Decimal, ROUND_HALF_UP
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from apps.api import dashboard, models, movimientos, pricing, product_sales, rollup, timing
+
+
+LOCAL_HOSTS = ("", "localhost", "127.0.0.1", "::1")
+
+# SQL queries allowed per request with a cold cache; a warm hit needs none.
+# Adding one more aggregate to a dashboard part must fail this check.
+QUERY_BUDGETS = {
+    "dashboard": 6,
+    "stats": 4,
+    "chart": 1,
+    "top_products": 1,
+    "recent": 1,
+}
+ENDPOINTS = {
+    "dashboard": ("reportes-dashboard", {}),
+    "stats": ("reportes-dashboard-stats", {}),
+    "chart": ("reportes-dashboard-chart", {"period": "todos"}),
+    "top_products": ("reportes-dashboard-top-products", {}),
+    "recent": ("reportes-dashboard-recent", {}),
+}
+
+CATEGORIES = 8
+PRODUCTS = 300
+CUSTOMERS = 60
+USED_RATIO = 0.25
+CREDIT_RATIO = 0.2
+REFUND_RATIO = 0.02
+BATCH = 2000
+
+
+def _money(value) -> Decimal:
+    return Decimal(value).quantize(pricing.CENT, rounding=ROUND_HALF_UP)
+
+
+def _at(day, rng) -> datetime:
+    moment = dt_time(rng.randint(8, 19), rng.randint(0, 59), rng.randint(0, 59))
+    return timezone.make_aware(datetime.combine(day, moment))
+
+
+def seed_history(years: int, sales_per_day: int, seed: int, today=None) -> dict:
+    """Insert ``years`` of synthetic history ending ``today`` and rebuild the
+    rollups. Returns row counts by table."""
+    rng = random.Random(seed)
+    today = today or timezone.localdate()
+    now = timezone.now()
+    tag = uuid.uuid4().hex[:8]
+
+    categorias = models.Categorias.objects.bulk_create(
+        [models.Categorias(nombre=f"bench {tag} {n}") for n in range(CATEGORIES)]
+    )
+    productos = models.Productos.objects.bulk_create(
+        [
+            models.Productos(
+                codigo=f"BD-{tag}-{n}",
+                nombre=f"Producto {tag} {n}",
+                categoria=rng.choice(categorias),
+                precio=_money(rng.uniform(1, 200)),
+            )
+            for n in range(PRODUCTS)
+        ]
+    )
+    catalog = [(p, "used" if rng.random() < USED_RATIO else "new") for p in productos]
+    clientes = models.Clientes.objects.bulk_create(
+        [models.Clientes(nombre=f"Cliente {tag} {n}") for n in range(CUSTOMERS)]
+    )
+
+    counts = dict.fromkeys(("ventas", "detalle_venta", "creditos", "pagos_credito", "devoluciones"), 0)
+    day = today - timedelta(days=365 * years)
+    while day <= today:
+        month_end = min((day.replace(day=1) + timedelta(days=32)).replace(day=1), today + timedelta(days=1))
+        with transaction.atomic():
+            _seed_days(rng, day, month_end, sales_per_day, catalog, clientes, now, counts)
+        day = month_end
+
+    with transaction.atomic():
+        rollup.rebuild(now=now)
+        product_sales.rebuild(now=now)
+        movimientos.rebuild()
+    return counts
+
+
+def _seed_days(rng, first, end, sales_per_day, catalog, clientes, now, counts):
+    sales = []  # (venta, lines, credit)
+    day = first
+    while day < end:
+        for _ in range(rng.randint(sales_per_day // 2, sales_per_day * 3 // 2)):
+            fecha = _at(day, rng)
+            lines = []
+            for producto, condicion in rng.sample(catalog, rng.choice((1, 1, 1, 2, 2, 3, 4))):
+                qty = Decimal(rng.choice((1, 1, 1, 2, 3)))
+                lines.append((producto, condicion, qty, _money(qty * producto.precio)))
+            total = sum(line[3] for line in lines)
+            credit = rng.random() < CREDIT_RATIO
+            iva = pricing.iva_breakdown(total)
+            venta = models.Ventas(
+                fecha=fecha,
+                cliente=rng.choice(clientes) if credit or rng.random() < 0.3 else None,
+                total=total,
+                estado="completada",
+                metodo_pago="credito" if credit else "efectivo",
+                iva_monto=iva["iva_monto"],
+                iva_porcentaje=iva["iva_porcentaje"],
+                created_at=now,
+                updated_at=now,
+            )
+            sales.append((venta, lines, credit))
+        day += timedelta(days=1)
+    if not sales:
+        return
+
+    models.Ventas.objects.bulk_create([venta for venta, _, _ in sales], batch_size=BATCH)
+    detalles, devoluciones, creditos, pendientes = [], [], [], []
+    for venta, lines, credit in sales:
+        refunded = Decimal("0")
+        sale_dets = []
+        for producto, condicion, qty, subtotal in lines:
+            det = models.DetalleVenta(
+                venta=venta,
+                producto=producto,
+                cantidad=qty,
+                precio_unitario=producto.precio,
+                subtotal=subtotal,
+                fecha_venta=venta.fecha,
+                producto_codigo_snapshot=producto.codigo,
+                producto_nombre_snapshot=producto.nombre,
+                producto_costo_snapshot=_money(producto.precio * Decimal("0.6")),
+                producto_condicion_snapshot=condicion,
+                producto_categoria_id_snapshot=producto.categoria_id,
+                created_at=now,
+                updated_at=now,
+            )
+            detalles.append(det)
+            sale_dets.append(det)
+            # Only cash sales get refunds, so credits need no reallocation.
+            if not credit and rng.random() < REFUND_RATIO:
+                det.devuelto = qty
+                refunded += subtotal
+                devoluciones.append((det, min(venta.fecha + timedelta(days=rng.randint(0, 10)), now)))
+        if refunded:
+            venta.devuelto_total = venta.ingreso_revertido = refunded
+        if credit:
+            split = rollup.line_splits(sale_dets)[venta.id]
+            paid = _money(venta.total * Decimal(rng.choice((0, 0, 0.25, 0.5, 1))))
+            creditos.append(
+                models.Creditos(
+                    cliente=venta.cliente,
+                    total_deuda=venta.total,
+                    pagado=paid,
+                    pagos_total=paid,
+                    saldo=venta.total - paid,
+                    estado="pagado" if paid == venta.total else "pendiente",
+                    monto_nuevo=split[0],
+                    monto_usado=split[1],
+                    fecha_ultima_compra=venta.fecha,
+                    created_at=now,
+                    updated_at=now,
+                )
+            )
+            pendientes.append((venta, paid))
+
+    models.DetalleVenta.objects.bulk_create(detalles, batch_size=BATCH)
+    models.Ventas.objects.bulk_update(
+        [venta for venta, _, _ in sales if venta.devuelto_total],
+        ["devuelto_total", "ingreso_revertido"],
+        batch_size=BATCH,
+    )
+    models.Devoluciones.objects.bulk_create(
+        [
+            models.Devoluciones(
+                fecha=fecha,
+                producto_id=det.producto_id,
+                venta=det.venta,
+                detalle_venta=det,
+                cantidad=det.cantidad,
+                precio_unitario=det.precio_unitario,
+                total=det.subtotal,
+                motivo="bench_dashboard",
+                ingreso_afectado=det.subtotal,
+                producto_codigo_snapshot=det.producto_codigo_snapshot,
+                producto_nombre_snapshot=det.producto_nombre_snapshot,
+                producto_costo_snapshot=det.producto_costo_snapshot,
+                producto_condicion_snapshot=det.producto_condicion_snapshot,
+                created_at=now,
+                updated_at=now,
+            )
+            for det, fecha in devoluciones
+        ],
+        batch_size=BATCH,
+    )
+    models.Creditos.objects.bulk_create(creditos, batch_size=BATCH)
+    models.CreditosHistorialCompras.objects.bulk_create(
+        [
+            models.CreditosHistorialCompras(
+                credito=credito,
+                venta=venta,
+                fecha=venta.fecha,
+                monto=venta.total,
+                pagado=paid,
+                saldo=venta.total - paid,
+                estado=credito.estado,
+                created_at=now,
+                updated_at=now,
+            )
+            for credito, (venta, paid) in zip(creditos, pendientes)
+        ],
+        batch_size=BATCH,
+    )
+    pagos = [
+        models.PagosCredito(
+            credito=credito,
+            fecha=min(venta.fecha + timedelta(days=rng.randint(0, 30)), now),
+            monto=paid,
+            concepto="bench_dashboard",
+            metodo_pago="efectivo",
+            created_at=now,
+            updated_at=now,
+        )
+        for credito, (venta, paid) in zip(creditos, pendientes)
+        if paid > 0
+    ]
+    rollup.assign_splits(pagos, rollup.credit_splits(creditos))
+    models.PagosCredito.objects.bulk_create(pagos, batch_size=BATCH)
+
+    counts["ventas"] += len(sales)
+    counts["detalle_venta"] += len(detalles)
+    counts["creditos"] += len(creditos)
+    counts["pagos_credito"] += len(pagos)
+    counts["devoluciones"] += len(devoluciones)
+
+
+def measure(runs: int, parts=tuple(ENDPOINTS), sections=dashboard.SECTIONS) -> dict:
+    """Query count and latency of each dashboard part and section.
+
+    "cold" requests bump the sales version first so the payload is rebuilt;
+    "warm" requests are served from the cache.
+    """
+    client = APIClient(HTTP_HOST="localhost")
+    report = {}
+    for part in parts:
+        name, params = ENDPOINTS[part]
+        url = reverse(name)
+        for section in sections:
+            stats = {}
+            for mode in ("cold", "warm"):
+                latencies, queries = [], []
+                for _ in range(runs):
+                    if mode == "cold":
+                        dashboard.bump_sales_version()
+                    with CaptureQueriesContext(connection) as ctx:
+                        start = time.perf_counter()
+                        response = client.get(url, {"section": section, **params})
+                        latencies.append((time.perf_counter() - start) * 1000)
+                    if response.status_code != 200:
+                        raise CommandError(f"{url} ({section}): status {response.status_code}")
+                    queries.append(len(ctx.captured_queries))
+                latencies.sort()
+                stats[mode] = {
+                    "queries": max(queries),
+                    "p50": round(timing.percentile(latencies, 50), 2),
+                    "p95": round(timing.percentile(latencies, 95), 2),
+                }
+            report.setdefault(part, {})[section] = stats
+    return report
+
+
+def violations(report: dict, p95_ms: float) -> list:
+    """Budget violations in ``report`` as human-readable lines."""
+    found = []
+    for part, sections in report.items():
+        for section, stats in sections.items():
+            label = f"{part}/{section}"
+            if stats["cold"]["queries"] > QUERY_BUDGETS[part]:
+                found.append(
+                    f"{label}: {stats['cold']['queries']} consultas (máximo {QUERY_BUDGETS[part]})"
+                )
+            if stats["warm"]["queries"]:
+                found.append(f"{label}: {stats['warm']['queries']} consultas con la caché caliente")
+            if stats["cold"]["p95"] > p95_ms:
+                found.append(f"{label}: p95 {stats['cold']['p95']} ms (máximo {p95_ms} ms)")
+    return found
+
+
+class Command(BaseCommand):
+    help = "Mide consultas SQL y latencia del dashboard de reportes sobre un historial sintético."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--years", type=int, default=3)
+        parser.add_argument("--sales-per-day", type=int, default=150)
+        parser.add_argument("--seed", type=int, default=None)
+        parser.add_argument("--skip-seed", action="store_true", help="Medir sobre los datos existentes")
+        parser.add_argument("--runs", type=int, default=20, help="Peticiones por parte, sección y modo")
+        parser.add_argument(
+            "--p95-ms", type=float, default=settings.DASHBOARD_P95_BUDGET_MS, help="Máximo p95 en frío"
+        )
+        parser.add_argument("--json", action="store_true", help="Imprimir el resultado como JSON")
+        parser.add_argument("--allow-remote", action="store_true")
+
+    def handle(self, *args, **opts):
+        db = settings.DATABASES["default"]
+        if connection.vendor != "postgresql":
+            raise CommandError("El benchmark requiere PostgreSQL")
+        if db.get("HOST", "") not in LOCAL_HOSTS and not opts["allow_remote"]:
+            raise CommandError("La base no es local; usar --allow-remote para continuar")
+
+        if not opts["skip_seed"]:
+            seed = opts["seed"] if opts["seed"] is not None else random.randrange(1 << 30)
+            started = time.monotonic()
+            counts = seed_history(opts["years"], opts["sales_per_day"], seed)
+            self.stdout.write(
+                f"Semilla {seed}: "
+                + ", ".join(f"{table} {n}" for table, n in counts.items())
+                + f" en {time.monotonic() - started:.1f} s"
+            )
+
+        report = measure(opts["runs"])
+        found = violations(report, opts["p95_ms"])
+        if opts["json"]:
+            self.stdout.write(json.dumps({"report": report, "violations": found}, indent=2))
+        else:
+            self._print(report)
+        if found:
+            raise CommandError("Presupuesto excedido:\n" + "\n".join(found))
+        self.stdout.write(self.style.SUCCESS("Dentro del presupuesto"))
+
+    def _print(self, report: dict) -> None:
+        w = self.stdout.write
+        w(f"{'parte':<14}{'sección':<9}{'sql':>5}{'p50':>9}{'p95':>9}{'sql hit':>9}{'p95 hit':>9}  (ms)")
+        for part, sections in report.items():
+            for section, stats in sections.items():
+                cold, warm = stats["cold"], stats["warm"]
+                w(
+                    f"{part:<14}{section:<9}{cold['queries']:>5}{cold['p50']:>9}{cold['p95']:>9}"
+                    f"{warm['queries']:>9}{warm['p95']:>9}"
+                )
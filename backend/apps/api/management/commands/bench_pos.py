@@ -0,0 +1,314 @@
+"""Benchmark de concurrencia para el camino de escritura del POS.
+
+Simula N terminales (hilos, cada uno con su propia conexión) que envían
+ventas, abonos y devoluciones contra la base configurada. Escribe datos reales:
+usar sólo contra una base PostgreSQL local de pruebas.
+
+    python manage.py bench_pos --terminals 8 --duration 60
+"""
+from __future__ import annotations
+
+import json
+import random
+import threading
+import time
+import uuid
+from collections import defaultdict
+from decimal import Decimal, ROUND_HALF_UP
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, connections
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from apps.api import models, pricing, timing
+
+
+# Lines per ticket and units per line, weighted towards small counter sales.
+CART_SIZES = (1, 1, 1, 1, 2, 2, 2, 3, 3, 4, 5, 6, 8, 12, 20)
+LINE_QTYS = (1, 1, 1, 1, 1, 2, 2, 3)
+LOCAL_HOSTS = ("", "localhost", "127.0.0.1", "::1")
+OPERATIONS = ("checkout", "pago", "devolucion")
+
+
+def build_cart(rng: random.Random, catalog, credit_customer=None) -> dict:
+    """Checkout payload priced from ``catalog`` rows (``id``/``precio``)."""
+    size = min(rng.choice(CART_SIZES), len(catalog))
+    items = []
+    total = Decimal("0")
+    for product in rng.sample(catalog, size):
+        qty = rng.choice(LINE_QTYS)
+        items.append({"productId": product["id"], "qty": qty, "unit_price": str(product["precio"])})
+        total += (qty * product["precio"]).quantize(pricing.CENT, rounding=ROUND_HALF_UP)
+    payload = {
+        "items": items,
+        "totals": {"total": str(total)},
+        "paymentMethod": "CASH",
+        "saleType": "CASH",
+        "paidAmount": str(total),
+    }
+    if credit_customer:
+        payload.update(saleType="CREDIT", customerId=credit_customer, paidAmount="0")
+    return payload
+
+
+class Results:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.latencies = defaultdict(list)
+        self.errors = defaultdict(lambda: defaultdict(int))
+        self.deadlock_responses = 0
+
+    def add(self, op: str, elapsed_ms: float, response) -> None:
+        with self.lock:
+            if response.status_code < 300:
+                self.latencies[op].append(elapsed_ms)
+            else:
+                self.errors[op][response.status_code] += 1
+                if b"deadlock" in response.content:
+                    self.deadlock_responses += 1
+
+
+class LockMonitor(threading.Thread):
+    """Samples sessions waiting on heavyweight locks in ``pg_stat_activity``."""
+
+    def __init__(self, interval: float):
+        super().__init__(daemon=True)
+        self.interval = interval
+        self.samples = []
+        self.stop = threading.Event()
+
+    def run(self):
+        try:
+            while not self.stop.is_set():
+                with connection.cursor() as cursor:
+                    cursor.execute(
+                        "SELECT count(*) FROM pg_stat_activity "
+                        "WHERE datname = current_database() AND wait_event_type = 'Lock'"
+                    )
+                    self.samples.append(cursor.fetchone()[0])
+                self.stop.wait(self.interval)
+        finally:
+            connection.close()
+
+
+def _deadlocks() -> int:
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT deadlocks FROM pg_stat_database WHERE datname = current_database()")
+        return cursor.fetchone()[0]
+
+
+class Command(BaseCommand):
+    help = "Simula terminales concurrentes contra pos/checkout, pagos-credito y devoluciones."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--terminals", type=int, default=8)
+        parser.add_argument("--duration", type=float, default=30.0, help="Segundos")
+        parser.add_argument(
+            "--mix",
+            default="checkout=70,pago=20,devolucion=10",
+            help="Pesos por operación",
+        )
+        parser.add_argument("--credit-ratio", type=float, default=0.2)
+        parser.add_argument("--customers", type=int, default=20, help="Clientes usados para crédito")
+        parser.add_argument("--seed", type=int, default=None)
+        parser.add_argument("--lock-interval", type=float, default=0.2)
+        parser.add_argument("--json", action="store_true", help="Imprimir el resultado como JSON")
+        parser.add_argument("--allow-remote", action="store_true")
+
+    def handle(self, *args, **opts):
+        db = settings.DATABASES["default"]
+        if connection.vendor != "postgresql":
+            raise CommandError("El benchmark requiere PostgreSQL")
+        if db.get("HOST", "") not in LOCAL_HOSTS and not opts["allow_remote"]:
+            raise CommandError("La base no es local; usar --allow-remote para continuar")
+
+        mix = self._parse_mix(opts["mix"])
+        catalog = list(
+            models.Productos.objects.filter(status="active", precio__gt=0).values("id", "precio")
+        )
+        if not catalog:
+            raise CommandError("No hay productos activos con precio")
+        customers = list(
+            models.Clientes.objects.order_by("id").values_list("id", flat=True)[: opts["customers"]]
+        )
+        seed = opts["seed"] if opts["seed"] is not None else random.randrange(1 << 30)
+
+        results = Results()
+        timing.reset()
+        deadlocks_before = _deadlocks()
+        monitor = LockMonitor(opts["lock_interval"])
+        deadline = time.monotonic() + opts["duration"]
+        terminals = [
+            threading.Thread(
+                target=self._terminal,
+                args=(random.Random(seed + n), deadline, mix, catalog, customers, opts, results),
+            )
+            for n in range(opts["terminals"])
+        ]
+        started = time.monotonic()
+        monitor.start()
+        for thread in terminals:
+            thread.start()
+        for thread in terminals:
+            thread.join()
+        elapsed = time.monotonic() - started
+        monitor.stop.set()
+        monitor.join()
+
+        report = self._report(results, monitor.samples, _deadlocks() - deadlocks_before, elapsed, opts, seed)
+        if opts["json"]:
+            self.stdout.write(json.dumps(report, indent=2))
+        else:
+            self._print(report)
+
+    def _parse_mix(self, raw: str) -> dict:
+        mix = {}
+        for part in raw.split(","):
+            name, _, weight = part.partition("=")
+            name = name.strip()
+            if name not in OPERATIONS:
+                raise CommandError(f"Operación desconocida: {name}")
+            mix[name] = float(weight or 1)
+        return mix
+
+    def _terminal(self, rng, deadline, mix, catalog, customers, opts, results):
+        client = APIClient(HTTP_HOST="localhost")
+        client.raise_request_exception = False
+        names, weights = list(mix), list(mix.values())
+        sales = []  # (venta_id, is_credit) created by this terminal
+        try:
+            while time.monotonic() < deadline:
+                op = rng.choices(names, weights)[0]
+                prepared = None
+                if op == "pago":
+                    prepared = self._prepare_pago(rng, sales)
+                elif op == "devolucion":
+                    prepared = self._prepare_devolucion(rng, sales)
+                if prepared is None:
+                    op = "checkout"
+                    customer = None
+                    if customers and rng.random() < opts["credit_ratio"]:
+                        customer = rng.choice(customers)
+                    prepared = (
+                        reverse("pos-checkout"),
+                        build_cart(rng, catalog, customer),
+                        {"HTTP_IDEMPOTENCY_KEY": uuid.uuid4().hex},
+                    )
+                url, payload, headers = prepared
+
+                start = time.perf_counter()
+                response = client.post(url, payload, format="json", **headers)
+                results.add(op, (time.perf_counter() - start) * 1000, response)
+
+                if op == "checkout" and response.status_code == 201:
+                    sales.append((response.data["id"], payload["saleType"] == "CREDIT"))
+        finally:
+            connections.close_all()
+
+    def _prepare_pago(self, rng, sales):
+        credit_sales = [venta_id for venta_id, is_credit in sales if is_credit]
+        if not credit_sales:
+            return None
+        credito = (
+            models.Creditos.objects.filter(
+                historial__venta_id=rng.choice(credit_sales), saldo__gt=0
+            )
+            .values("id", "saldo")
+            .first()
+        )
+        if not credito:
+            return None
+        monto = min(credito["saldo"], Decimal(rng.choice((1, 2, 5, 10, 20))))
+        now = timezone.now().isoformat()
+        payload = {
+            "credito": credito["id"],
+            "fecha": now,
+            "monto": str(monto),
+            "concepto": "bench_pos",
+            "metodo_pago": "efectivo",
+            "created_at": now,
+            "updated_at": now,
+        }
+        return reverse("pagoscredito-list"), payload, {}
+
+    def _prepare_devolucion(self, rng, sales):
+        if not sales:
+            return None
+        venta_id, _ = rng.choice(sales)
+        lines = [
+            line
+            for line in models.DetalleVenta.objects.filter(venta_id=venta_id).values(
+                "id", "cantidad", "devuelto"
+            )
+            if line["cantidad"] - (line["devuelto"] or 0) >= 1
+        ]
+        if not lines:
+            return None
+        items = [
+            {"detalle_id": line["id"], "qty": 1, "motivo": "bench_pos"}
+            for line in rng.sample(lines, min(len(lines), rng.choice((1, 1, 2))))
+        ]
+        return reverse("devoluciones-list"), {"venta_id": venta_id, "items": items}, {}
+
+    def _report(self, results, lock_samples, deadlocks, elapsed, opts, seed) -> dict:
+        operations = {}
+        for op in OPERATIONS:
+            values = sorted(results.latencies.get(op, []))
+            errors = dict(results.errors.get(op, {}))
+            if not values and not errors:
+                continue
+            operations[op] = {
+                "ok": len(values),
+                "errors": errors,
+                "throughput": round(len(values) / elapsed, 2),
+                "p50": round(timing.percentile(values, 50), 2),
+                "p95": round(timing.percentile(values, 95), 2),
+                "p99": round(timing.percentile(values, 99), 2),
+                "max": round(values[-1], 2) if values else 0.0,
+            }
+        total_ok = sum(op["ok"] for op in operations.values())
+        waiting = [n for n in lock_samples if n]
+        return {
+            "terminals": opts["terminals"],
+            "seconds": round(elapsed, 2),
+            "seed": seed,
+            "throughput": round(total_ok / elapsed, 2),
+            "operations": operations,
+            "lock_waits": {
+                "samples": len(lock_samples),
+                "samples_waiting": len(waiting),
+                "max_waiting": max(lock_samples, default=0),
+                "avg_waiting": round(sum(lock_samples) / len(lock_samples), 2) if lock_samples else 0.0,
+            },
+            "deadlocks": deadlocks,
+            "deadlock_responses": results.deadlock_responses,
+            "server_phases": timing.snapshot(),
+        }
+
+    def _print(self, report: dict) -> None:
+        w = self.stdout.write
+        w(
+            f"Terminales: {report['terminals']}  Duración: {report['seconds']} s  "
+            f"Semilla: {report['seed']}  Throughput: {report['throughput']} op/s"
+        )
+        w(f"{'operación':<12}{'ok':>8}{'errores':>9}{'op/s':>9}{'p50':>9}{'p95':>9}{'p99':>9}{'max':>9}  (ms)")
+        for op, stats in report["operations"].items():
+            w(
+                f"{op:<12}{stats['ok']:>8}{sum(stats['errors'].values()):>9}{stats['throughput']:>9}"
+                f"{stats['p50']:>9}{stats['p95']:>9}{stats['p99']:>9}{stats['max']:>9}"
+            )
+            if stats["errors"]:
+                w(f"{'':<12}errores por status: {stats['errors']}")
+        locks = report["lock_waits"]
+        w(
+            f"Esperas por lock: {locks['samples_waiting']}/{locks['samples']} muestras, "
+            f"máx {locks['max_waiting']} sesiones, media {locks['avg_waiting']}"
+        )
+        w(f"Deadlocks: {report['deadlocks']} (pg_stat_database), {report['deadlock_responses']} respuestas")
+        for endpoint, phases in report["server_phases"].items():
+            w(f"Fases {endpoint} (p50/p95/p99 ms):")
+            for name, stats in phases.items():
+                w(f"  {name:<14}{stats['p50']:>9}{stats['p95']:>9}{stats['p99']:>9}")
@@ -0,0 +1,75 @@
+"""Fusiona los créditos por venta de cada cliente en su cuenta de crédito.
+
+Usar al activar CREDITO_CUENTA_UNICA: el historial de compras y los pagos se
+reasignan a la cuenta del cliente y los créditos antiguos se eliminan. Cada
+cliente se procesa en su propia transacción.
+
+    python manage.py consolidar_creditos [--dry-run]
+"""
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.utils import timezone
+
+from apps.api import credits, models
+
+
+class Command(BaseCommand):
+    help = "Fusiona los créditos por venta en una cuenta por cliente."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--dry-run", action="store_true")
+
+    def handle(self, *args, **opts):
+        cliente_ids = list(
+            models.Creditos.objects.filter(cuenta=False)
+            .order_by("cliente_id")
+            .values_list("cliente_id", flat=True)
+            .distinct()
+        )
+        if opts["dry_run"]:
+            self.stdout.write(f"Clientes con créditos por venta: {len(cliente_ids)}")
+            return
+        merged = 0
+        for cliente_id in cliente_ids:
+            with transaction.atomic():
+                merged += self._merge(cliente_id, timezone.now())
+        self.stdout.write(
+            self.style.SUCCESS(f"Clientes: {len(cliente_ids)}  créditos fusionados: {merged}")
+        )
+
+    def _merge(self, cliente_id, now) -> int:
+        account = credits.open_accounts([cliente_id], now)[cliente_id]
+        legacy = list(
+            models.Creditos.objects.select_for_update()
+            .filter(cliente_id=cliente_id, cuenta=False)
+            .order_by("id")
+        )
+        if not legacy:
+            return 0
+        ids = [credito.id for credito in legacy]
+        models.CreditosHistorialCompras.objects.filter(credito_id__in=ids).update(credito=account)
+        models.PagosCredito.objects.filter(credito_id__in=ids).update(credito=account)
+
+        notas = [account.observaciones] if account.observaciones else []
+        for credito in legacy:
+            account.total_deuda += credito.total_deuda
+            account.pagado += credito.pagado
+            account.saldo += credito.saldo
+            account.pagos_total += credito.pagos_total
+            account.devuelto_total += credito.devuelto_total
+            account.ingreso_revertido += credito.ingreso_revertido
+            account.monto_nuevo += credito.monto_nuevo
+            account.monto_usado += credito.monto_usado
+            if credito.fecha_ultima_compra and (
+                account.fecha_ultima_compra is None
+                or credito.fecha_ultima_compra > account.fecha_ultima_compra
+            ):
+                account.fecha_ultima_compra = credito.fecha_ultima_compra
+            if credito.observaciones:
+                notas.append(credito.observaciones)
+        account.estado = credits.estado_for(account.saldo)
+        account.observaciones = "\n".join(notas) or None
+        account.updated_at = now
+        account.save(update_fields=credits.ACCOUNT_FIELDS + ["observaciones"])
+        models.Creditos.objects.filter(id__in=ids).delete()
+        return len(legacy)
@@ -0,0 +1,59 @@
+"""Reconstruye ventas_resumen_diario, ventas_producto_mensual y movimientos a
+partir de ventas, pagos y devoluciones.
+
+Sin fechas recalcula todo el historial; con --desde/--hasta solo esos días
+(fechas locales, inclusive). Los contadores por producto son mensuales, así que
+se recalculan los meses completos que tocan esas fechas. Cada mes se procesa en
+su propia transacción para no bloquear las ventas durante toda la reconstrucción.
+
+    python manage.py reconstruir_resumen_diario [--desde 2024-01-01] [--hasta 2024-12-31]
+"""
+from datetime import date, timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.db.models import Min
+from django.utils import timezone
+
+from apps.api import models, movimientos, product_sales, rollup
+
+
+class Command(BaseCommand):
+    help = "Reconstruye el resumen diario, los contadores por producto y el historial desde las tablas base."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--desde", type=date.fromisoformat, help="Primer día (AAAA-MM-DD)")
+        parser.add_argument("--hasta", type=date.fromisoformat, help="Último día (AAAA-MM-DD)")
+
+    def handle(self, *args, **opts):
+        hasta = opts["hasta"] or timezone.localdate()
+        desde = opts["desde"] or self._first_day()
+        if desde is None:
+            self.stdout.write("Sin movimientos")
+            return
+        if desde > hasta:
+            raise CommandError("--desde debe ser anterior a --hasta")
+
+        filas = productos = historial = 0
+        inicio = desde
+        while inicio <= hasta:
+            siguiente = (inicio.replace(day=1) + timedelta(days=32)).replace(day=1)
+            fin = min(siguiente - timedelta(days=1), hasta)
+            with transaction.atomic():
+                filas += rollup.rebuild(inicio, fin)
+                productos += product_sales.rebuild(inicio, fin)
+                historial += movimientos.rebuild(inicio, fin)
+            self.stdout.write(f"{inicio:%Y-%m}: ok")
+            inicio = siguiente
+        self.stdout.write(self.style.SUCCESS(f"Filas del resumen: {filas}"))
+        self.stdout.write(self.style.SUCCESS(f"Filas por producto: {productos}"))
+        self.stdout.write(self.style.SUCCESS(f"Filas del historial: {historial}"))
+
+    def _first_day(self):
+        fechas = [
+            models.Ventas.objects.aggregate(f=Min("fecha_local"))["f"],
+            models.PagosCredito.objects.aggregate(f=Min("fecha_local"))["f"],
+            models.Devoluciones.objects.aggregate(f=Min("fecha_local"))["f"],
+        ]
+        fechas = [f for f in fechas if f is not None]
+        return min(fechas) if fechas else None
@@ -0,0 +1,43 @@
+"""Verifica los totales acumulados de ventas y créditos contra las tablas base.
+
+Compara ventas.devuelto_total/ingreso_revertido y creditos.pagos_total/
+devuelto_total/ingreso_revertido/monto_nuevo/monto_usado con detalle_venta,
+devoluciones y pagos_credito. Con --fix corrige las filas que no coinciden.
+
+    python manage.py verificar_totales [--fix] [--limit 50]
+"""
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from apps.api import totals
+
+
+class Command(BaseCommand):
+    help = "Verifica (y opcionalmente corrige) los totales acumulados de ventas y créditos."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--fix", action="store_true", help="Corregir las diferencias")
+        parser.add_argument("--limit", type=int, default=50, help="Filas a mostrar por tabla")
+
+    def handle(self, *args, **opts):
+        drift = False
+        for table in totals.COUNTERS:
+            rows = totals.find_mismatches(table, opts["limit"])
+            if not rows:
+                self.stdout.write(self.style.SUCCESS(f"{table}: OK"))
+                continue
+            drift = True
+            self.stdout.write(self.style.WARNING(f"{table}: {len(rows)} filas con diferencias"))
+            for row in rows:
+                detalle = ", ".join(
+                    f"{field} {vals['guardado']} != {vals['esperado']}"
+                    for field, vals in row.items()
+                    if field != "id" and vals["guardado"] != vals["esperado"]
+                )
+                self.stdout.write(f"  id={row['id']}: {detalle}")
+            if opts["fix"]:
+                with transaction.atomic():
+                    fixed = totals.repair(table)
+                self.stdout.write(self.style.SUCCESS(f"  corregidas: {fixed}"))
+        if drift and not opts["fix"]:
+            self.stdout.write("Usar --fix para corregir")
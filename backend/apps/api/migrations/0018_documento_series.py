@@ -0,0 +1,62 @@
+# Generated by Django 5.2.18 on 2026-10-17 03:46
+
+from django.db import migrations, models
+
+
+def check_duplicate_numbers(apps, schema_editor):
+    """Stop before ``ventas_documento_uniq`` if sales already share a number.
+
+    Sales written through the CRUD endpoint could repeat a number; issued
+    fiscal numbers are not renumbered here, they are listed so the duplicates
+    can be corrected by hand before migrating again.
+    """
+    Ventas = apps.get_model('api', 'Ventas')
+    duplicates = list(
+        Ventas.objects.filter(documento_numero__isnull=False)
+        .values('documento_tipo', 'documento_serie', 'documento_numero')
+        .annotate(n=models.Count('id'), primera=models.Min('id'))
+        .filter(n__gt=1)
+        .order_by('documento_tipo', 'documento_serie', 'documento_numero')[:20]
+    )
+    if duplicates:
+        listed = ', '.join(
+            f"{d['documento_tipo']} {d['documento_serie'] or '-'} {d['documento_numero']}"
+            f" ({d['n']} ventas desde id {d['primera']})"
+            for d in duplicates
+        )
+        raise RuntimeError(
+            f'Números de documento repetidos en ventas; corregirlos antes de migrar: {listed}'
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0017_idempotency_keys'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DocumentoSerie',
+            fields=[
+                ('id', models.BigAutoField(primary_key=True, serialize=False)),
+                ('documento_tipo', models.CharField(max_length=30)),
+                ('serie', models.TextField()),
+                ('siguiente', models.BigIntegerField(default=1)),
+                ('created_at', models.DateTimeField()),
+                ('updated_at', models.DateTimeField()),
+            ],
+            options={
+                'db_table': 'documento_series',
+            },
+        ),
+        migrations.RunPython(check_duplicate_numbers, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='ventas',
+            constraint=models.UniqueConstraint(condition=models.Q(('documento_numero__isnull', False)), fields=('documento_tipo', 'documento_serie', 'documento_numero'), name='ventas_documento_uniq'),
+        ),
+        migrations.AddConstraint(
+            model_name='documentoserie',
+            constraint=models.UniqueConstraint(fields=('documento_tipo', 'serie'), name='documento_series_uniq'),
+        ),
+    ]
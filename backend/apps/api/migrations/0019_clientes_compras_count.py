@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-17 03:51
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0018_documento_series'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='clientes',
+            name='compras_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+    ]
@@ -0,0 +1,22 @@
+# Generated by Django 5.2.18 on 2026-10-17 03:52
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0019_clientes_compras_count'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='creditos',
+            name='cuenta',
+            field=models.BooleanField(default=False),
+        ),
+        migrations.AddConstraint(
+            model_name='creditos',
+            constraint=models.UniqueConstraint(condition=models.Q(('cuenta', True)), fields=('cliente',), name='creditos_cuenta_cliente_uniq'),
+        ),
+    ]
@@ -0,0 +1,74 @@
+# Generated by Django 5.2.18 on 2026-10-17 03:54
+
+from django.db import migrations, models
+
+
+BACKFILL_VENTAS = """
+UPDATE ventas v
+   SET devuelto_total = d.total, ingreso_revertido = d.ingreso
+  FROM (
+    SELECT venta_id, SUM(total) AS total, SUM(ingreso_afectado) AS ingreso
+      FROM devoluciones WHERE venta_id IS NOT NULL GROUP BY venta_id
+  ) d
+ WHERE d.venta_id = v.id
+"""
+
+BACKFILL_CREDITOS_PAGOS = """
+UPDATE creditos c
+   SET pagos_total = p.monto
+  FROM (SELECT credito_id, SUM(monto) AS monto FROM pagos_credito GROUP BY credito_id) p
+ WHERE p.credito_id = c.id
+"""
+
+BACKFILL_CREDITOS_DEVOLUCIONES = """
+UPDATE creditos c
+   SET devuelto_total = d.total, ingreso_revertido = d.ingreso
+  FROM (
+    SELECT h.credito_id, SUM(dv.total) AS total, SUM(dv.ingreso_afectado) AS ingreso
+      FROM devoluciones dv
+      JOIN (
+        SELECT DISTINCT ON (venta_id) venta_id, credito_id
+          FROM creditos_historial_compras ORDER BY venta_id, id
+      ) h ON h.venta_id = dv.venta_id
+     GROUP BY h.credito_id
+  ) d
+ WHERE d.credito_id = c.id
+"""
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0020_creditos_cuenta'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='creditos',
+            name='devuelto_total',
+            field=models.DecimalField(decimal_places=2, default=0, max_digits=14),
+        ),
+        migrations.AddField(
+            model_name='creditos',
+            name='ingreso_revertido',
+            field=models.DecimalField(decimal_places=2, default=0, max_digits=14),
+        ),
+        migrations.AddField(
+            model_name='creditos',
+            name='pagos_total',
+            field=models.DecimalField(decimal_places=2, default=0, max_digits=14),
+        ),
+        migrations.AddField(
+            model_name='ventas',
+            name='devuelto_total',
+            field=models.DecimalField(decimal_places=2, default=0, max_digits=14),
+        ),
+        migrations.AddField(
+            model_name='ventas',
+            name='ingreso_revertido',
+            field=models.DecimalField(decimal_places=2, default=0, max_digits=14),
+        ),
+        migrations.RunSQL(BACKFILL_VENTAS, migrations.RunSQL.noop),
+        migrations.RunSQL(BACKFILL_CREDITOS_PAGOS, migrations.RunSQL.noop),
+        migrations.RunSQL(BACKFILL_CREDITOS_DEVOLUCIONES, migrations.RunSQL.noop),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 5.2.18 on 2026-10-17 04:01
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0021_running_totals'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='VentasResumenDiario',
+            fields=[
+                ('id', models.BigAutoField(primary_key=True, serialize=False)),
+                ('dia', models.DateField()),
+                ('condicion', models.CharField(max_length=10)),
+                ('canal', models.CharField(max_length=10)),
+                ('ventas_total', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('costo_total', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('unidades', models.DecimalField(decimal_places=3, default=0, max_digits=14)),
+                ('ingreso', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('devoluciones_total', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('ingreso_revertido', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('updated_at', models.DateTimeField()),
+            ],
+            options={
+                'db_table': 'ventas_resumen_diario',
+                'constraints': [models.UniqueConstraint(fields=('dia', 'condicion', 'canal'), name='ventas_resumen_diario_uniq')],
+            },
+        ),
+    ]
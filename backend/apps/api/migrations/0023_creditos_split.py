@@ -0,0 +1,50 @@
+# Generated by Django 5.2.18 on 2026-10-17 04:05
+
+from django.db import migrations, models
+
+
+BACKFILL_SPLIT = """
+UPDATE creditos c
+   SET monto_nuevo = s.monto_nuevo, monto_usado = s.monto_usado
+  FROM (
+    SELECT h.credito_id,
+           GREATEST(COALESCE(SUM(x.monto) FILTER (WHERE x.condicion <> 'used'), 0), 0)
+             AS monto_nuevo,
+           GREATEST(COALESCE(SUM(x.monto) FILTER (WHERE x.condicion = 'used'), 0), 0)
+             AS monto_usado
+      FROM (
+        SELECT venta_id, COALESCE(lower(trim(producto_condicion_snapshot)), '') AS condicion,
+               subtotal AS monto
+          FROM detalle_venta
+        UNION ALL
+        SELECT venta_id, COALESCE(lower(trim(producto_condicion_snapshot)), ''), -total
+          FROM devoluciones WHERE venta_id IS NOT NULL
+      ) x
+      JOIN (
+        SELECT DISTINCT ON (venta_id) venta_id, credito_id
+          FROM creditos_historial_compras ORDER BY venta_id, id
+      ) h ON h.venta_id = x.venta_id
+     GROUP BY h.credito_id
+  ) s
+ WHERE s.credito_id = c.id
+"""
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0022_ventas_resumen_diario'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='creditos',
+            name='monto_nuevo',
+            field=models.DecimalField(decimal_places=2, default=0, max_digits=14),
+        ),
+        migrations.AddField(
+            model_name='creditos',
+            name='monto_usado',
+            field=models.DecimalField(decimal_places=2, default=0, max_digits=14),
+        ),
+        migrations.RunSQL(BACKFILL_SPLIT, migrations.RunSQL.noop),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 5.2.18 on 2026-10-17 04:09
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0023_creditos_split'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='VentasProductoMensual',
+            fields=[
+                ('id', models.BigAutoField(primary_key=True, serialize=False)),
+                ('mes', models.DateField()),
+                ('producto_id', models.BigIntegerField()),
+                ('condicion', models.CharField(max_length=10)),
+                ('producto_nombre', models.TextField(blank=True, null=True)),
+                ('unidades', models.DecimalField(decimal_places=3, default=0, max_digits=14)),
+                ('ingreso', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('unidades_devueltas', models.DecimalField(decimal_places=3, default=0, max_digits=14)),
+                ('devoluciones_total', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('updated_at', models.DateTimeField()),
+            ],
+            options={
+                'db_table': 'ventas_producto_mensual',
+                'indexes': [models.Index(fields=['producto_id', 'mes'], name='ventas_producto_mes_idx')],
+                'constraints': [models.UniqueConstraint(fields=('condicion', 'mes', 'producto_id'), name='ventas_producto_mensual_uniq')],
+            },
+        ),
+    ]
@@ -0,0 +1,92 @@
+# Generated by Django 5.2.18 on 2026-10-17 04:13
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+TABLES = ("ventas", "pagos_credito", "devoluciones")
+
+
+def create_triggers(apps, schema_editor):
+    """fecha_local = local day of fecha, on insert and whenever fecha changes.
+
+    The zone is settings.TIME_ZONE at migration time; after changing it, run
+    this function again and reconstruir_resumen_diario.
+    """
+    if schema_editor.connection.vendor != "postgresql":
+        return
+    tz = settings.TIME_ZONE.replace("'", "''")
+    with schema_editor.connection.cursor() as cursor:
+        cursor.execute(
+            f"""
+            CREATE OR REPLACE FUNCTION set_fecha_local() RETURNS trigger AS $$
+            BEGIN
+              NEW.fecha_local := (NEW.fecha AT TIME ZONE '{tz}')::date;
+              RETURN NEW;
+            END
+            $$ LANGUAGE plpgsql;
+            """
+        )
+        for table in TABLES:
+            cursor.execute(f"DROP TRIGGER IF EXISTS trg_{table}_fecha_local ON {table};")
+            cursor.execute(
+                f"CREATE TRIGGER trg_{table}_fecha_local"
+                f" BEFORE INSERT OR UPDATE OF fecha ON {table}"
+                f" FOR EACH ROW EXECUTE FUNCTION set_fecha_local();"
+            )
+            cursor.execute(f"UPDATE {table} SET fecha_local = (fecha AT TIME ZONE %s)::date;", [settings.TIME_ZONE])
+
+
+def drop_triggers(apps, schema_editor):
+    if schema_editor.connection.vendor != "postgresql":
+        return
+    with schema_editor.connection.cursor() as cursor:
+        for table in TABLES:
+            cursor.execute(f"DROP TRIGGER IF EXISTS trg_{table}_fecha_local ON {table};")
+        cursor.execute("DROP FUNCTION IF EXISTS set_fecha_local();")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0024_ventas_producto_mensual'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='devoluciones',
+            name='fecha_local',
+            field=models.DateField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='pagoscredito',
+            name='fecha_local',
+            field=models.DateField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='ventas',
+            name='fecha_local',
+            field=models.DateField(blank=True, editable=False, null=True),
+        ),
+        migrations.RunPython(create_triggers, drop_triggers),
+        migrations.AddIndex(
+            model_name='devoluciones',
+            index=models.Index(fields=['fecha'], name='devoluciones_fecha_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='devoluciones',
+            index=models.Index(fields=['fecha_local'], name='devoluciones_fecha_local_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='pagoscredito',
+            index=models.Index(fields=['fecha'], name='pagos_credito_fecha_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='pagoscredito',
+            index=models.Index(fields=['fecha_local'], name='pagos_credito_fecha_local_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='ventas',
+            index=models.Index(fields=['fecha_local'], name='ventas_fecha_local_idx'),
+        ),
+    ]
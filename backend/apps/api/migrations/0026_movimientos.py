@@ -0,0 +1,33 @@
+# Generated by Django 5.2.18 on 2026-10-17 04:19
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0025_fecha_local'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Movimientos',
+            fields=[
+                ('id', models.BigAutoField(primary_key=True, serialize=False)),
+                ('fecha', models.DateTimeField()),
+                ('tipo', models.CharField(max_length=20)),
+                ('origen_id', models.BigIntegerField()),
+                ('monto', models.DecimalField(decimal_places=2, max_digits=14)),
+                ('ingreso_afectado', models.DecimalField(decimal_places=2, max_digits=14)),
+                ('nota', models.TextField(blank=True, null=True)),
+                ('cliente', models.ForeignKey(db_column='cliente_id', db_constraint=False, null=True, on_delete=django.db.models.deletion.DO_NOTHING, related_name='+', to='api.clientes')),
+                ('venta', models.ForeignKey(db_column='venta_id', db_constraint=False, on_delete=django.db.models.deletion.DO_NOTHING, related_name='+', to='api.ventas')),
+            ],
+            options={
+                'db_table': 'movimientos',
+                'indexes': [models.Index(models.OrderBy(models.F('fecha'), descending=True), models.F('id'), name='movimientos_fecha_id_idx')],
+                'constraints': [models.UniqueConstraint(fields=('tipo', 'origen_id'), name='movimientos_origen_uniq')],
+            },
+        ),
+    ]
@@ -0,0 +1,65 @@
+# Generated by Django 5.2.18 on 2026-10-17 04:29
+
+from django.db import migrations, models
+
+
+def create_trigger(apps, schema_editor):
+    """On a price change keep the old price and the time of the change.
+
+    Other updates keep the stored values, so a stale instance saved without a
+    price change cannot overwrite them.
+    """
+    if schema_editor.connection.vendor != "postgresql":
+        return
+    with schema_editor.connection.cursor() as cursor:
+        cursor.execute(
+            """
+            CREATE OR REPLACE FUNCTION set_precio_anterior() RETURNS trigger AS $$
+            BEGIN
+              IF NEW.precio IS DISTINCT FROM OLD.precio THEN
+                NEW.precio_anterior := OLD.precio;
+                NEW.precio_desde := now();
+              ELSE
+                NEW.precio_anterior := OLD.precio_anterior;
+                NEW.precio_desde := OLD.precio_desde;
+              END IF;
+              RETURN NEW;
+            END
+            $$ LANGUAGE plpgsql;
+            """
+        )
+        cursor.execute("DROP TRIGGER IF EXISTS trg_productos_precio_anterior ON productos;")
+        cursor.execute(
+            "CREATE TRIGGER trg_productos_precio_anterior"
+            " BEFORE UPDATE ON productos"
+            " FOR EACH ROW EXECUTE FUNCTION set_precio_anterior();"
+        )
+
+
+def drop_trigger(apps, schema_editor):
+    if schema_editor.connection.vendor != "postgresql":
+        return
+    with schema_editor.connection.cursor() as cursor:
+        cursor.execute("DROP TRIGGER IF EXISTS trg_productos_precio_anterior ON productos;")
+        cursor.execute("DROP FUNCTION IF EXISTS set_precio_anterior();")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0026_movimientos'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='productos',
+            name='precio_anterior',
+            field=models.DecimalField(blank=True, decimal_places=2, editable=False, max_digits=12, null=True),
+        ),
+        migrations.AddField(
+            model_name='productos',
+            name='precio_desde',
+            field=models.DateTimeField(blank=True, editable=False, null=True),
+        ),
+        migrations.RunPython(create_trigger, drop_trigger),
+    ]
@@ -0,0 +1,37 @@
+# Generated by Django 5.2.18 on 2026-10-17 05:02
+
+from django.db import migrations
+
+
+def seed_series(apps, schema_editor):
+    """Start every series after the highest number already issued in ventas.
+
+    GREATEST keeps a series that already reserved past that number where it
+    is, so ``siguiente`` never falls back onto an issued or reserved number.
+    """
+    if schema_editor.connection.vendor != "postgresql":
+        return
+    with schema_editor.connection.cursor() as cursor:
+        cursor.execute(
+            """
+            INSERT INTO documento_series (documento_tipo, serie, siguiente, created_at, updated_at)
+            SELECT documento_tipo, documento_serie, MAX(documento_numero::bigint) + 1, now(), now()
+              FROM ventas
+             WHERE documento_serie IS NOT NULL AND documento_numero ~ '^[0-9]+$'
+             GROUP BY documento_tipo, documento_serie
+            ON CONFLICT (documento_tipo, serie) DO UPDATE
+               SET siguiente = GREATEST(documento_series.siguiente, EXCLUDED.siguiente),
+                   updated_at = EXCLUDED.updated_at
+            """
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0027_productos_precio_anterior'),
+    ]
+
+    operations = [
+        migrations.RunPython(seed_series, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,35 @@
+# Generated by Django 5.2.18 on 2026-10-17 04:38
+
+from django.db import migrations, models
+
+
+def backfill(apps, schema_editor):
+    """Split existing payments by their credit's current split, the only
+    record of it for payments written before this column."""
+    if schema_editor.connection.vendor != "postgresql":
+        return
+    with schema_editor.connection.cursor() as cursor:
+        cursor.execute(
+            """
+            UPDATE pagos_credito p
+               SET monto_usado = ROUND(p.monto * c.monto_usado / (c.monto_nuevo + c.monto_usado), 2)
+              FROM creditos c
+             WHERE c.id = p.credito_id AND c.monto_nuevo + c.monto_usado <> 0
+            """
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0028_seed_documento_series'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='pagoscredito',
+            name='monto_usado',
+            field=models.DecimalField(decimal_places=2, default=0, editable=False, max_digits=14),
+        ),
+        migrations.RunPython(backfill, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 5.2.18 on 2026-10-17 04:41
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0029_pagos_credito_monto_usado'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='movimientos',
+            name='venta',
+            field=models.ForeignKey(blank=True, db_column='venta_id', db_constraint=False, null=True, on_delete=django.db.models.deletion.DO_NOTHING, related_name='+', to='api.ventas'),
+        ),
+    ]
@@ -0,0 +1,39 @@
+# Generated by Django 5.2.18 on 2026-10-17 06:10
+
+from django.db import migrations
+
+
+def backfill(apps, schema_editor):
+    """Fill ventas_resumen_diario, ventas_producto_mensual and movimientos
+    from the existing sales, payments and refunds.
+
+    0022, 0024 and 0026 create these tables empty, and the reports read only
+    them. The rebuild queries need fecha_local (0025) and the payment split
+    (0029), so the backfill runs here, once every column exists. It is the
+    same rebuild as reconstruir_resumen_diario, and only empty tables are
+    filled.
+    """
+    if schema_editor.connection.vendor != "postgresql":
+        return
+    from apps.api import movimientos, product_sales, rollup
+
+    with schema_editor.connection.cursor() as cursor:
+        for table, rebuild in (
+            ("ventas_resumen_diario", rollup.rebuild),
+            ("ventas_producto_mensual", product_sales.rebuild),
+            ("movimientos", movimientos.rebuild),
+        ):
+            cursor.execute(f"SELECT EXISTS (SELECT 1 FROM {table})")
+            if not cursor.fetchone()[0]:
+                rebuild()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0030_movimientos_venta_nullable'),
+    ]
+
+    operations = [
+        migrations.RunPython(backfill, migrations.RunPython.noop),
+    ]
@@ -23,6 +23,7 @@ class Clientes(models.Model):
     contacto = models.TextField(null=True, blank=True)
     contribuyente_iva = models.BooleanField(default=False, db_index=True)
     fecha_ultima_compra = models.DateTimeField(null=True, blank=True)
+    compras_count = models.PositiveIntegerField(default=0)
     observaciones = models.TextField(null=True, blank=True)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
@@ -74,6 +75,11 @@ class Productos(models.Model):
         db_index=True,
     )
     precio = models.DecimalField(max_digits=12, decimal_places=2)
+    # Price before the last change and when the current one took effect, kept
+    # by the set_precio_anterior trigger so queued offline sales are priced as
+    # of their sale time.
+    precio_anterior = models.DecimalField(max_digits=12, decimal_places=2, null=True, blank=True, editable=False)
+    precio_desde = models.DateTimeField(null=True, blank=True, editable=False)
     status = models.CharField(max_length=10, default='active')
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
@@ -89,6 +95,9 @@ class Productos(models.Model):
 class Ventas(models.Model):
     id = models.BigAutoField(primary_key=True)
     fecha = models.DateTimeField()
+    # Local calendar day of ``fecha``, kept by the set_fecha_local trigger
+    # (migration 0025) so reports group on a plain indexed column.
+    fecha_local = models.DateField(null=True, blank=True, editable=False)
     cliente = models.ForeignKey('Clientes', on_delete=models.SET_NULL, null=True, db_column='cliente_id')
     total = models.DecimalField(max_digits=14, decimal_places=2, default=0)
     estado = models.CharField(max_length=20, default='pendiente')
@@ -98,6 +107,9 @@ class Ventas(models.Model):
     documento_numero = models.TextField(null=True, blank=True)
     iva_monto = models.DecimalField(max_digits=14, decimal_places=2, default=0)
     iva_porcentaje = models.DecimalField(max_digits=5, decimal_places=2, default=13)
+    # Running totals over devoluciones (verificar_totales).
+    devuelto_total = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    ingreso_revertido = models.DecimalField(max_digits=14, decimal_places=2, default=0)
     created_at = models.DateTimeField()
     updated_at = models.DateTimeField()
 
@@ -105,10 +117,18 @@ class Ventas(models.Model):
         db_table = "ventas"
         indexes = [
             models.Index(fields=["fecha"], name="ventas_fecha_idx"),
+            models.Index(fields=["fecha_local"], name="ventas_fecha_local_idx"),
             models.Index(fields=["created_at", "estado", "cliente"], name="ventas_cre_cli_idx"),
             models.Index(fields=["documento_numero"], name="ventas_numero_idx"),
             models.Index(fields=["cliente"], name="ventas_cliente_idx"),
         ]
+        constraints = [
+            models.UniqueConstraint(
+                fields=["documento_tipo", "documento_serie", "documento_numero"],
+                condition=models.Q(documento_numero__isnull=False),
+                name="ventas_documento_uniq",
+            ),
+        ]
         #managed = False
 
     def __str__(self):
@@ -158,11 +178,27 @@ class Creditos(models.Model):
     fecha_ultima_compra = models.DateTimeField(null=True, blank=True)
     estado = models.CharField(max_length=20, default='pendiente')
     observaciones = models.TextField(null=True, blank=True)
+    cuenta = models.BooleanField(default=False)
+    # Running totals over pagos_credito and devoluciones (verificar_totales).
+    pagos_total = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    devuelto_total = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    ingreso_revertido = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    # Sold amount by product condition, net of refunds; payments are split
+    # between new and used in this proportion.
+    monto_nuevo = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    monto_usado = models.DecimalField(max_digits=14, decimal_places=2, default=0)
     created_at = models.DateTimeField()
     updated_at = models.DateTimeField()
 
     class Meta:
         db_table = "creditos"
+        constraints = [
+            models.UniqueConstraint(
+                fields=["cliente"],
+                condition=models.Q(cuenta=True),
+                name="creditos_cuenta_cliente_uniq",
+            ),
+        ]
         #managed = False
 
     def __str__(self):
@@ -193,7 +229,13 @@ class PagosCredito(models.Model):
     id = models.BigAutoField(primary_key=True)
     credito = models.ForeignKey('Creditos', on_delete=models.CASCADE, db_column='credito_id', related_name='pagos')
     fecha = models.DateTimeField()
+    # Local calendar day of ``fecha``, kept by the set_fecha_local trigger
+    # (migration 0025) so reports group on a plain indexed column.
+    fecha_local = models.DateField(null=True, blank=True, editable=False)
     monto = models.DecimalField(max_digits=14, decimal_places=2)
+    # Part of ``monto`` that paid for used items, fixed when the payment is
+    # written (rollup.assign_splits) so later refunds do not move it.
+    monto_usado = models.DecimalField(max_digits=14, decimal_places=2, default=0, editable=False)
     concepto = models.TextField(null=True, blank=True)
     metodo_pago = models.CharField(max_length=20, null=True, blank=True)
     created_at = models.DateTimeField()
@@ -201,6 +243,10 @@ class PagosCredito(models.Model):
 
     class Meta:
         db_table = "pagos_credito"
+        indexes = [
+            models.Index(fields=["fecha"], name="pagos_credito_fecha_idx"),
+            models.Index(fields=["fecha_local"], name="pagos_credito_fecha_local_idx"),
+        ]
         #managed = False
 
     def __str__(self):
@@ -210,6 +256,9 @@ class PagosCredito(models.Model):
 class Devoluciones(models.Model):
     id = models.BigAutoField(primary_key=True)
     fecha = models.DateTimeField()
+    # Local calendar day of ``fecha``, kept by the set_fecha_local trigger
+    # (migration 0025) so reports group on a plain indexed column.
+    fecha_local = models.DateField(null=True, blank=True, editable=False)
     producto = models.ForeignKey(
         'Productos', on_delete=models.SET_NULL, null=True, db_column='producto_id'
     )
@@ -231,6 +280,10 @@ class Devoluciones(models.Model):
 
     class Meta:
         db_table = "devoluciones"
+        indexes = [
+            models.Index(fields=["fecha"], name="devoluciones_fecha_idx"),
+            models.Index(fields=["fecha_local"], name="devoluciones_fecha_local_idx"),
+        ]
         #managed = False
 
     def __str__(self):
@@ -255,3 +308,137 @@ class Usuario(models.Model):
 
     def __str__(self):
         return self.user.username
+
+
+class DocumentoSerie(models.Model):
+    id = models.BigAutoField(primary_key=True)
+    documento_tipo = models.CharField(max_length=30)
+    serie = models.TextField()
+    siguiente = models.BigIntegerField(default=1)
+    created_at = models.DateTimeField()
+    updated_at = models.DateTimeField()
+
+    class Meta:
+        db_table = "documento_series"
+        constraints = [
+            models.UniqueConstraint(fields=["documento_tipo", "serie"], name="documento_series_uniq"),
+        ]
+
+    def __str__(self):
+        return f"{self.documento_tipo} {self.serie}"
+
+
+class IdempotencyKey(models.Model):
+    id = models.BigAutoField(primary_key=True)
+    scope = models.CharField(max_length=50)
+    key = models.CharField(max_length=255)
+    request_hash = models.CharField(max_length=64)
+    response = models.JSONField()
+    status_code = models.PositiveSmallIntegerField(default=201)
+    created_at = models.DateTimeField()
+    expires_at = models.DateTimeField()
+
+    class Meta:
+        db_table = "idempotency_keys"
+        constraints = [
+            models.UniqueConstraint(fields=["scope", "key"], name="idempotency_scope_key_uniq"),
+        ]
+        indexes = [
+            models.Index(fields=["expires_at"], name="idempotency_expires_idx"),
+        ]
+
+    def __str__(self):
+        return f"{self.scope}:{self.key}"
+
+
+class VentasResumenDiario(models.Model):
+    """Daily sales rollup maintained by checkout, payments and refunds (see rollup.py)."""
+
+    id = models.BigAutoField(primary_key=True)
+    dia = models.DateField()
+    condicion = models.CharField(max_length=10)
+    canal = models.CharField(max_length=10)
+    ventas_total = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    costo_total = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    unidades = models.DecimalField(max_digits=14, decimal_places=3, default=0)
+    ingreso = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    devoluciones_total = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    ingreso_revertido = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    updated_at = models.DateTimeField()
+
+    class Meta:
+        db_table = "ventas_resumen_diario"
+        constraints = [
+            models.UniqueConstraint(
+                fields=["dia", "condicion", "canal"], name="ventas_resumen_diario_uniq"
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.dia} {self.condicion} {self.canal}"
+
+
+class VentasProductoMensual(models.Model):
+    """Per-product monthly sales counters maintained by checkout and refunds (see product_sales.py)."""
+
+    id = models.BigAutoField(primary_key=True)
+    mes = models.DateField()
+    # Plain id rather than a foreign key: counters outlive deleted products.
+    producto_id = models.BigIntegerField()
+    condicion = models.CharField(max_length=10)
+    producto_nombre = models.TextField(null=True, blank=True)
+    unidades = models.DecimalField(max_digits=14, decimal_places=3, default=0)
+    ingreso = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    unidades_devueltas = models.DecimalField(max_digits=14, decimal_places=3, default=0)
+    devoluciones_total = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    updated_at = models.DateTimeField()
+
+    class Meta:
+        db_table = "ventas_producto_mensual"
+        constraints = [
+            # Leading (condicion, mes) so top-N over a window is a range scan.
+            models.UniqueConstraint(
+                fields=["condicion", "mes", "producto_id"], name="ventas_producto_mensual_uniq"
+            ),
+        ]
+        indexes = [
+            models.Index(fields=["producto_id", "mes"], name="ventas_producto_mes_idx"),
+        ]
+
+    def __str__(self):
+        return f"{self.mes} {self.producto_id} {self.condicion}"
+
+
+class Movimientos(models.Model):
+    """Sales history rows maintained by checkout, payments and refunds (see movimientos.py)."""
+
+    id = models.BigAutoField(primary_key=True)
+    fecha = models.DateTimeField()
+    tipo = models.CharField(max_length=20)
+    # Id of the sale, the payment or the first refund of the group.
+    origen_id = models.BigIntegerField()
+    # No database constraints: rows are recomputed when sales are edited or
+    # deleted. Payments and refunds whose sale was deleted keep a NULL sale.
+    venta = models.ForeignKey(
+        'Ventas', on_delete=models.DO_NOTHING, db_constraint=False, null=True, blank=True,
+        db_column='venta_id', related_name='+',
+    )
+    cliente = models.ForeignKey(
+        'Clientes', on_delete=models.DO_NOTHING, db_constraint=False, null=True,
+        db_column='cliente_id', related_name='+',
+    )
+    monto = models.DecimalField(max_digits=14, decimal_places=2)
+    ingreso_afectado = models.DecimalField(max_digits=14, decimal_places=2)
+    nota = models.TextField(null=True, blank=True)
+
+    class Meta:
+        db_table = "movimientos"
+        constraints = [
+            models.UniqueConstraint(fields=["tipo", "origen_id"], name="movimientos_origen_uniq"),
+        ]
+        indexes = [
+            models.Index(models.F("fecha").desc(), "id", name="movimientos_fecha_id_idx"),
+        ]
+
+    def __str__(self):
+        return f"{self.tipo} {self.origen_id}"
@@ -0,0 +1,167 @@
+from __future__ import annotations
+
+from datetime import date, timedelta
+from decimal import Decimal
+from typing import Iterable, List, Optional
+
+from django.db import connection
+from django.utils import timezone
+
+from . import models, periods
+
+
+# movimientos: the sales history as one table, one row per cash sale, credit
+# payment and refund (the lines refunded together count as one row). Credit
+# payments are listed under the first sale of their credit; payments and
+# refunds left without a sale keep a NULL venta_id. Checkout, payments and
+# refunds insert their rows; edits and deletes recompute the affected local
+# days, like the daily rollup.
+CONTADO = "VENTA_CONTADO"
+ABONO = "ABONO"
+DEVOLUCION = "DEVOLUCION"
+TIPOS = (CONTADO, ABONO, DEVOLUCION)
+
+
+def sale_rows(ventas) -> List[models.Movimientos]:
+    """Rows for cash sales (sales without a credit)."""
+    return [
+        models.Movimientos(
+            fecha=venta.fecha,
+            tipo=CONTADO,
+            origen_id=venta.id,
+            venta_id=venta.id,
+            cliente_id=venta.cliente_id,
+            monto=venta.total or Decimal("0"),
+            ingreso_afectado=venta.total or Decimal("0"),
+        )
+        for venta in ventas
+    ]
+
+
+def first_sales(credito_ids: Iterable[int]) -> dict:
+    """``{credito_id: venta_id}`` of the first sale charged to each credit."""
+    first = {}
+    rows = (
+        models.CreditosHistorialCompras.objects.filter(credito_id__in=set(credito_ids))
+        .order_by("credito_id", "fecha", "id")
+        .values_list("credito_id", "venta_id")
+    )
+    for credito_id, venta_id in rows:
+        first.setdefault(credito_id, venta_id)
+    return first
+
+
+def payment_rows(pagos, creditos) -> List[models.Movimientos]:
+    """Rows for credit payments; ``creditos`` maps credito_id to the credit."""
+    ventas = first_sales(creditos)
+    return [
+        models.Movimientos(
+            fecha=pago.fecha,
+            tipo=ABONO,
+            origen_id=pago.id,
+            venta_id=ventas.get(pago.credito_id),
+            cliente_id=creditos[pago.credito_id].cliente_id,
+            monto=pago.monto,
+            ingreso_afectado=pago.monto,
+        )
+        for pago in pagos
+    ]
+
+
+def refund_row(venta, devoluciones) -> models.Movimientos:
+    """The row for the refunds of ``venta`` written together."""
+    motivos = [dev.motivo for dev in devoluciones if dev.motivo]
+    return models.Movimientos(
+        fecha=devoluciones[0].fecha,
+        tipo=DEVOLUCION,
+        origen_id=min(dev.id for dev in devoluciones),
+        venta_id=venta.id,
+        cliente_id=venta.cliente_id,
+        monto=-sum((dev.total for dev in devoluciones), Decimal("0")),
+        ingreso_afectado=sum((dev.ingreso_afectado for dev in devoluciones), Decimal("0")),
+        nota=" | ".join(motivos) or None,
+    )
+
+
+def insert(rows) -> None:
+    """Insert new rows; must run inside the transaction that wrote the base rows."""
+    if rows:
+        models.Movimientos.objects.bulk_create(rows)
+
+
+# Recomputes the rows whose fecha is in [%(desde)s, %(hasta)s) (either bound
+# may be NULL). Mirrors sale_rows, payment_rows and refund_row.
+_REBUILD = """
+WITH first_sales AS (
+  SELECT DISTINCT ON (credito_id) credito_id, venta_id
+    FROM creditos_historial_compras ORDER BY credito_id, fecha, id
+)
+INSERT INTO movimientos
+       (fecha, tipo, origen_id, venta_id, cliente_id, monto, ingreso_afectado, nota)
+SELECT v.fecha, 'VENTA_CONTADO', v.id, v.id, v.cliente_id,
+       COALESCE(v.total, 0), COALESCE(v.total, 0), NULL
+  FROM ventas v
+ WHERE NOT EXISTS (SELECT 1 FROM creditos_historial_compras h WHERE h.venta_id = v.id)
+   AND (%(desde)s::timestamptz IS NULL OR v.fecha >= %(desde)s)
+   AND (%(hasta)s::timestamptz IS NULL OR v.fecha < %(hasta)s)
+UNION ALL
+SELECT p.fecha, 'ABONO', p.id, fs.venta_id, c.cliente_id, p.monto, p.monto, NULL
+  FROM pagos_credito p
+  LEFT JOIN first_sales fs ON fs.credito_id = p.credito_id
+  JOIN creditos c ON c.id = p.credito_id
+ WHERE (%(desde)s::timestamptz IS NULL OR p.fecha >= %(desde)s)
+   AND (%(hasta)s::timestamptz IS NULL OR p.fecha < %(hasta)s)
+UNION ALL
+SELECT dv.fecha, 'DEVOLUCION', MIN(dv.id), dv.venta_id, v.cliente_id,
+       -SUM(dv.total), SUM(dv.ingreso_afectado),
+       string_agg(dv.motivo, ' | ' ORDER BY dv.id) FILTER (WHERE dv.motivo <> '')
+  FROM devoluciones dv
+  LEFT JOIN ventas v ON v.id = dv.venta_id
+ WHERE (%(desde)s::timestamptz IS NULL OR dv.fecha >= %(desde)s)
+   AND (%(hasta)s::timestamptz IS NULL OR dv.fecha < %(hasta)s)
+ GROUP BY dv.venta_id, dv.fecha, v.cliente_id
+"""
+
+
+def rebuild(desde: Optional[date] = None, hasta: Optional[date] = None) -> int:
+    """Recompute the rows of local days ``desde``..``hasta`` (inclusive).
+
+    Locks the table like rollup.rebuild; request paths use ``rebuild_days``.
+    Must run inside ``transaction.atomic``.
+    """
+    with connection.cursor() as cursor:
+        cursor.execute("LOCK TABLE movimientos IN SHARE ROW EXCLUSIVE MODE")
+        return _replace(cursor, desde, hasta, "")
+
+
+# Writers only insert rows for new origins, so a request-path rebuild needs
+# no table lock: it deletes the day's rows (locking only those) and upserts
+# the recomputed ones, overwriting a row a concurrent checkout just added.
+_UPSERT = """
+ON CONFLICT (tipo, origen_id) DO UPDATE
+   SET fecha = EXCLUDED.fecha, venta_id = EXCLUDED.venta_id, cliente_id = EXCLUDED.cliente_id,
+       monto = EXCLUDED.monto, ingreso_afectado = EXCLUDED.ingreso_afectado, nota = EXCLUDED.nota
+"""
+
+
+def _replace(cursor, desde: Optional[date], hasta: Optional[date], conflict: str) -> int:
+    params = {
+        "desde": periods.day_start(desde),
+        "hasta": periods.day_start(hasta + timedelta(days=1)) if hasta else None,
+    }
+    cursor.execute(
+        "DELETE FROM movimientos"
+        " WHERE (%(desde)s::timestamptz IS NULL OR fecha >= %(desde)s)"
+        " AND (%(hasta)s::timestamptz IS NULL OR fecha < %(hasta)s)",
+        params,
+    )
+    cursor.execute(_REBUILD + conflict, params)
+    return cursor.rowcount
+
+
+def rebuild_days(fechas: Iterable) -> None:
+    """Recompute the local days of the given datetimes, without a table lock."""
+    days = sorted({timezone.localdate(fecha) for fecha in fechas if fecha is not None})
+    with connection.cursor() as cursor:
+        for day in days:
+            _replace(cursor, day, day, _UPSERT)
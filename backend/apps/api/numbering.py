@@ -0,0 +1,120 @@
+from __future__ import annotations
+
+import threading
+from typing import List, Tuple
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.utils import timezone
+
+from . import models
+
+
+DOCUMENTO_TIPOS = ("ticket", "consumidor_final", "ccf")
+
+# (documento_tipo, serie) -> [next_number, end_exclusive]
+_BLOCKS: dict = {}
+_LOCK = threading.Lock()
+
+
+def _reserve_block(tipo: str, serie: str, size: int) -> Tuple[int, int]:
+    """Reserve ``size`` consecutive numbers for this process.
+
+    One short single-row UPDATE in its own transaction; callers must invoke the
+    allocator before opening the checkout transaction so the row lock on
+    ``documento_series`` is released immediately.
+    """
+    now = timezone.now()
+    with transaction.atomic():
+        models.DocumentoSerie.objects.get_or_create(
+            documento_tipo=tipo,
+            serie=serie,
+            defaults={"siguiente": 1, "created_at": now, "updated_at": now},
+        )
+        with connection.cursor() as cursor:
+            cursor.execute(
+                "UPDATE documento_series SET siguiente = siguiente + %s, updated_at = %s "
+                "WHERE documento_tipo = %s AND serie = %s RETURNING siguiente",
+                [size, now, tipo, serie],
+            )
+            end = cursor.fetchone()[0]
+    return end - size, end
+
+
+def allocate_many(tipo: str, serie: str, count: int) -> List[int]:
+    """Hand out ``count`` unique document numbers for a series.
+
+    Numbers come from a block cached by this process; a new block is reserved
+    only when the current one runs out, so there is no ``SELECT max()`` and no
+    table lock on the checkout path. Numbers left in a block when the process
+    stops become gaps, listed by ``find_gaps``.
+    """
+    key = (tipo, serie)
+    numbers: List[int] = []
+    with _LOCK:
+        while len(numbers) < count:
+            block = _BLOCKS.get(key)
+            if not block or block[0] >= block[1]:
+                size = max(settings.DOCUMENTO_BLOCK_SIZE, count - len(numbers))
+                block = list(_reserve_block(tipo, serie, size))
+                _BLOCKS[key] = block
+            take = min(count - len(numbers), block[1] - block[0])
+            numbers.extend(range(block[0], block[0] + take))
+            block[0] += take
+    return numbers
+
+
+def allocate(tipo: str, serie: str) -> int:
+    return allocate_many(tipo, serie, 1)[0]
+
+
+def find_gaps(tipo: str, serie: str) -> dict:
+    """Audit a series: issued range and the missing numbers from 1 (where
+    every series starts) up to the reserved mark, ``siguiente - 1``."""
+    with connection.cursor() as cursor:
+        cursor.execute(
+            """
+            SELECT COUNT(*), MIN(n), MAX(n) FROM (
+                SELECT documento_numero::bigint AS n FROM ventas
+                WHERE documento_tipo = %s AND documento_serie = %s
+                  AND documento_numero ~ '^[0-9]+$'
+            ) issued
+            """,
+            [tipo, serie],
+        )
+        emitidos, primero, ultimo = cursor.fetchone()
+        cursor.execute(
+            """
+            SELECT n + 1, nxt - 1 FROM (
+                SELECT n, LEAD(n) OVER (ORDER BY n) AS nxt FROM (
+                    SELECT documento_numero::bigint AS n FROM ventas
+                    WHERE documento_tipo = %s AND documento_serie = %s
+                      AND documento_numero ~ '^[0-9]+$'
+                ) issued
+            ) ordered
+            WHERE nxt > n + 1
+            ORDER BY n
+            """,
+            [tipo, serie],
+        )
+        huecos = [[start, end] for start, end in cursor.fetchall()]
+    # Numbers before the first issued one.
+    if primero is not None and primero > 1:
+        huecos.insert(0, [1, primero - 1])
+
+    serie_row = models.DocumentoSerie.objects.filter(documento_tipo=tipo, serie=serie).first()
+    reservado_hasta = serie_row.siguiente - 1 if serie_row else None
+    # Reserved numbers past the last issued one: blocks left by stopped
+    # processes, or still held by running ones.
+    if reservado_hasta is not None and reservado_hasta > (ultimo or 0):
+        huecos.append([(ultimo or 0) + 1, reservado_hasta])
+    return {
+        "documento_tipo": tipo,
+        "serie": serie,
+        "emitidos": emitidos,
+        "primero": primero,
+        "ultimo": ultimo,
+        "reservado_hasta": reservado_hasta,
+        "huecos": huecos,
+        "numeros_faltantes": sum(end - start + 1 for start, end in huecos),
+    }
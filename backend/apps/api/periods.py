@@ -0,0 +1,76 @@
+from __future__ import annotations
+
+from datetime import date, datetime, time as dt_time, timedelta
+from typing import NamedTuple, Optional
+
+from django.utils import timezone
+
+
+# Report periods are local days, but filtering on ``fecha__date`` converts
+# every row's timestamp and cannot use the ``fecha`` indexes. A period is
+# turned into aware ``[start, end)`` bounds once and compared directly.
+MODES = ("daily", "quincenal", "monthly", "all", "range")
+
+
+class PeriodError(ValueError):
+    pass
+
+
+def day_start(day: Optional[date]):
+    """Aware local midnight at the start of ``day``."""
+    if day is None:
+        return None
+    return timezone.make_aware(datetime.combine(day, dt_time.min))
+
+
+class Period(NamedTuple):
+    mode: str
+    start_date: Optional[date]
+    end_date: Optional[date]
+
+    @property
+    def start(self):
+        return day_start(self.start_date)
+
+    @property
+    def end(self):
+        """Local midnight after ``end_date`` (exclusive)."""
+        return day_start(self.end_date + timedelta(days=1)) if self.end_date else None
+
+    def filter(self, qs, field: str = "fecha"):
+        if self.start_date:
+            qs = qs.filter(**{f"{field}__gte": self.start})
+        if self.end_date:
+            qs = qs.filter(**{f"{field}__lt": self.end})
+        return qs
+
+
+def resolve(mode: str, today: date, start: Optional[date] = None, end: Optional[date] = None) -> Period:
+    """The local days covered by ``mode``; ``start``/``end`` only apply to "range"."""
+    if mode not in MODES:
+        raise PeriodError("Invalid mode")
+    if mode == "daily":
+        return Period(mode, today, today)
+    if mode == "monthly":
+        return Period(mode, today.replace(day=1), today)
+    if mode == "quincenal":
+        return Period(mode, today.replace(day=1 if today.day <= 15 else 16), today)
+    if mode == "all":
+        return Period(mode, None, None)
+    if end and end > today:
+        end = today
+    if start and end and start > end:
+        raise PeriodError("Invalid range")
+    return Period(mode, start, end)
+
+
+def from_params(params, today: date, default_mode: str = "daily") -> Period:
+    """Period from ``mode``/``start``/``end`` query parameters."""
+    start = params.get("start")
+    end = params.get("end")
+    try:
+        start = date.fromisoformat(start) if start else None
+        end = date.fromisoformat(end) if end else None
+    except ValueError as exc:
+        raise PeriodError("Invalid date") from exc
+    return resolve(params.get("mode", default_mode), today, start, end)
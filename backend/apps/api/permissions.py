@@ -0,0 +1,14 @@
+from rest_framework.permissions import BasePermission
+
+
+class IsAdminRole(BasePermission):
+    """Superusers and users whose ``Usuario.role`` is ``admin``."""
+
+    def has_permission(self, request, view):
+        user = request.user
+        if not user or not user.is_authenticated:
+            return False
+        if user.is_superuser:
+            return True
+        perfil = getattr(user, "usuario", None)
+        return getattr(perfil, "role", None) == "admin"
@@ -0,0 +1,222 @@
+from __future__ import annotations
+
+import secrets
+import threading
+import uuid
+from decimal import Decimal, ROUND_HALF_UP
+from typing import Iterable, Optional
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Count, Max
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from django.utils import timezone
+
+from . import models
+
+
+CATALOG_VERSION_KEY = "pricing:catalog_version"
+CATALOG_FIELDS = (
+    "id",
+    "codigo",
+    "nombre",
+    "precio",
+    "precio_anterior",
+    "precio_desde",
+    "status",
+    "categoria_id",
+    "categoria__nombre",
+)
+CENT = Decimal("0.01")
+TOTAL_TOLERANCE = Decimal("0.01")
+OVERRIDE_TOKEN_PREFIX = "pricing:override:"
+
+_CATALOG: dict = {}
+_CATALOG_VERSION: Optional[str] = None
+_LOCK = threading.Lock()
+
+
+def catalog_version() -> str:
+    """Shared catalog version, derived from ``Productos.updated_at`` when unset."""
+    version = cache.get(CATALOG_VERSION_KEY)
+    if version is None:
+        agg = models.Productos.objects.aggregate(last=Max("updated_at"), n=Count("id"))
+        last = agg["last"].isoformat() if agg["last"] else ""
+        version = f"{last}:{agg['n']}"
+        cache.set(CATALOG_VERSION_KEY, version, None)
+    return version
+
+
+def bump_catalog_version() -> None:
+    cache.set(CATALOG_VERSION_KEY, uuid.uuid4().hex, None)
+
+
+@receiver(post_save, sender=models.Productos)
+@receiver(post_delete, sender=models.Productos)
+def _invalidate_catalog(sender, **kwargs):
+    transaction.on_commit(bump_catalog_version)
+
+
+def get_products(product_ids: Iterable[int]) -> dict:
+    """Return catalog rows for ``product_ids`` from the process-local cache.
+
+    Products missing from the cache are loaded with a single query. The whole
+    cache is dropped as soon as the shared catalog version changes.
+    """
+    global _CATALOG_VERSION
+    ids = {pid for pid in product_ids if pid is not None}
+    if not ids:
+        return {}
+    version = catalog_version()
+    with _LOCK:
+        if version != _CATALOG_VERSION:
+            _CATALOG.clear()
+            _CATALOG_VERSION = version
+        found = {pid: _CATALOG[pid] for pid in ids if pid in _CATALOG}
+    missing = ids - found.keys()
+    if missing:
+        rows = list(models.Productos.objects.filter(id__in=missing).values(*CATALOG_FIELDS))
+        with _LOCK:
+            for row in rows:
+                if _CATALOG_VERSION == version:
+                    _CATALOG[row["id"]] = row
+                found[row["id"]] = row
+    return found
+
+
+class PricingError(ValueError):
+    pass
+
+
+def list_price(product, at=None) -> Decimal:
+    """Catalog price of ``product`` at time ``at`` (default: now).
+
+    Only the previous price is kept, which covers a sale queued offline while
+    the price changed once.
+    """
+    desde = product.get("precio_desde")
+    if at is not None and desde is not None and at < desde and product.get("precio_anterior") is not None:
+        return product["precio_anterior"]
+    return product["precio"]
+
+
+def price_cart(lines, products, override_granted: bool = False, at=None) -> dict:
+    """Recompute every line and the cart total from catalog prices as of ``at``.
+
+    A client price that differs from the catalog is only honoured when the line
+    is flagged ``override`` and the override code was validated; otherwise the
+    line is reported in ``mismatches``. Raises ``PricingError`` for a product
+    that is no longer active.
+    """
+    priced = []
+    mismatches = []
+    total = Decimal("0")
+    has_override = False
+    for line in lines:
+        product = products[line["product_id"]]
+        if product["status"] != "active":
+            raise PricingError(f"Producto {line['product_id']} no está activo")
+        precio = list_price(product, at)
+        requested = line.get("price")
+        unit_price = precio
+        if line["override"] and requested is not None:
+            has_override = True
+            if override_granted:
+                unit_price = requested
+        elif requested is not None and requested != precio:
+            mismatches.append(
+                {
+                    "productId": line["product_id"],
+                    "unit_price": requested,
+                    "precio": precio,
+                }
+            )
+        subtotal = (line["qty"] * unit_price).quantize(CENT, rounding=ROUND_HALF_UP)
+        total += subtotal
+        priced.append(
+            {
+                **line,
+                "list_price": precio,
+                "unit_price": unit_price,
+                "subtotal": subtotal,
+            }
+        )
+    return {
+        "lines": priced,
+        "total": total,
+        "mismatches": mismatches,
+        "has_override": has_override,
+    }
+
+
+# A validated override code yields a single-use token bound to the user (or
+# session) that entered it. The grant is per sale: one token authorizes every
+# overridden line of the checkout that spends it, and the POS keeps a single
+# token per cart.
+# Terminals behind the same proxy share an address, so the address is not used.
+# A token covers sales made within PRICE_OVERRIDE_GRANT_TTL of its issue, and
+# is kept POS_OFFLINE_MAX_AGE longer so a sale queued offline can still spend it.
+def _token_ttl() -> int:
+    return settings.PRICE_OVERRIDE_GRANT_TTL + settings.POS_OFFLINE_MAX_AGE
+
+
+def issue_override_token(owner: str, now=None) -> str:
+    token = secrets.token_urlsafe(24)
+    issued = (now or timezone.now()).timestamp()
+    cache.set(OVERRIDE_TOKEN_PREFIX + token, (owner, issued), _token_ttl())
+    return token
+
+
+def _token_entry(token: Optional[str], owner: str, at=None):
+    """The cached ``(owner, issued)`` of ``token`` if it covers a sale at ``at``."""
+    if not token:
+        return None
+    entry = cache.get(OVERRIDE_TOKEN_PREFIX + str(token))
+    if not entry or entry[0] != owner:
+        return None
+    at = (at or timezone.now()).timestamp()
+    if not entry[1] <= at <= entry[1] + settings.PRICE_OVERRIDE_GRANT_TTL:
+        return None
+    return entry
+
+
+def override_token_valid(token: Optional[str], owner: str, at=None) -> bool:
+    """Whether ``token`` belongs to ``owner`` and covers a sale made at ``at``."""
+    return _token_entry(token, owner, at) is not None
+
+
+def spend_override_token(token: Optional[str], owner: str, at=None):
+    """Use up ``token`` and return its entry, or None if it cannot be spent.
+
+    Of concurrent callers only the one that deletes it wins.
+    """
+    entry = _token_entry(token, owner, at)
+    if entry is None or not cache.delete(OVERRIDE_TOKEN_PREFIX + str(token)):
+        return None
+    return entry
+
+
+def restore_override_token(token: str, entry) -> None:
+    """Give back a token spent by a checkout that did not commit."""
+    cache.add(OVERRIDE_TOKEN_PREFIX + token, entry, _token_ttl())
+
+
+def totals_match(client_total: Decimal, server_total: Decimal) -> bool:
+    return abs(client_total - server_total) <= TOTAL_TOLERANCE
+
+
+def iva_breakdown(total: Decimal, porcentaje: Optional[Decimal] = None) -> dict:
+    """Split an IVA-inclusive ``total`` into base and tax.
+
+    Catalog prices already include IVA, so the tax is taken out of the total
+    rather than added on top; ``subtotal + iva_monto == total`` always holds.
+    """
+    porcentaje = settings.IVA_PORCENTAJE if porcentaje is None else porcentaje
+    subtotal = (total * 100 / (100 + porcentaje)).quantize(CENT, rounding=ROUND_HALF_UP)
+    return {
+        "iva_porcentaje": porcentaje,
+        "subtotal": subtotal,
+        "iva_monto": total - subtotal,
+    }
@@ -0,0 +1,273 @@
+from __future__ import annotations
+
+from collections import defaultdict
+from datetime import date, timedelta
+from decimal import Decimal
+from typing import Iterable, Optional
+
+from django.db import connection
+from django.db.models import Max, Sum
+from django.utils import timezone
+
+from . import models, periods, rollup
+
+
+# ventas_producto_mensual: one row per local month, product and condition.
+# Sold lines count on the month of the sale, refunds on their own month.
+# Lines whose product is unknown are kept under producto_id 0.
+FIELDS = ("unidades", "ingreso", "unidades_devueltas", "devoluciones_total")
+ZERO = Decimal("0")
+
+
+def month_of(fecha) -> date:
+    return timezone.localdate(fecha).replace(day=1)
+
+
+def new_deltas() -> dict:
+    return defaultdict(lambda: {**dict.fromkeys(FIELDS, ZERO), "nombre": None})
+
+
+def _row(deltas, fecha, row):
+    key = (rollup.condition_of(row.producto_condicion_snapshot), month_of(fecha), row.producto_id or 0)
+    entry = deltas[key]
+    entry["nombre"] = row.producto_nombre_snapshot or entry["nombre"]
+    return entry
+
+
+def add_lines(deltas, detalles, sign: int = 1) -> None:
+    for det in detalles:
+        entry = _row(deltas, det.fecha_venta, det)
+        entry["unidades"] += sign * det.cantidad
+        entry["ingreso"] += sign * det.subtotal
+
+
+def add_refunds(deltas, devoluciones, sign: int = 1) -> None:
+    for dev in devoluciones:
+        entry = _row(deltas, dev.fecha, dev)
+        entry["unidades_devueltas"] += sign * dev.cantidad
+        entry["devoluciones_total"] += sign * dev.total
+
+
+def apply(deltas, now) -> int:
+    """Add ``deltas`` to ventas_producto_mensual with a single upsert.
+
+    Rows are written in (condicion, mes, producto_id) order, like
+    rollup.apply, so concurrent writers lock them in the same order. Must run
+    inside the transaction that wrote the base rows.
+    """
+    keys = sorted(
+        key for key, values in deltas.items() if any(values[field] for field in FIELDS)
+    )
+    if not keys:
+        return 0
+    params = []
+    for key in keys:
+        params.extend(key)
+        params.append(deltas[key]["nombre"])
+        params.extend(deltas[key][field] for field in FIELDS)
+        params.append(now)
+    row = "(%s, %s::date, %s, %s, " + ", ".join(["%s::numeric"] * len(FIELDS)) + ", %s)"
+    columns = ", ".join(FIELDS)
+    updates = ", ".join(f"{field} = r.{field} + EXCLUDED.{field}" for field in FIELDS)
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"""
+            INSERT INTO ventas_producto_mensual AS r
+                   (condicion, mes, producto_id, producto_nombre, {columns}, updated_at)
+            VALUES {", ".join([row] * len(keys))}
+            ON CONFLICT (condicion, mes, producto_id)
+            DO UPDATE SET {updates},
+                          producto_nombre = COALESCE(EXCLUDED.producto_nombre, r.producto_nombre),
+                          updated_at = EXCLUDED.updated_at
+            """,
+            params,
+        )
+        return cursor.rowcount
+
+
+# Recomputes the counters for months in [%(desde)s, %(hasta)s) (either bound
+# may be NULL), for the products in %(productos)s (NULL: all). Mirrors
+# add_lines/add_refunds.
+_REBUILD = """
+WITH filas AS (
+  SELECT date_trunc('month', v.fecha_local)::date AS mes,
+         COALESCE(d.producto_id, 0) AS producto_id,
+         CASE WHEN lower(trim(d.producto_condicion_snapshot)) = 'used' THEN 'used' ELSE 'new' END
+           AS condicion,
+         COALESCE(d.producto_nombre_snapshot, p.nombre) AS producto_nombre,
+         d.cantidad AS unidades,
+         d.subtotal AS ingreso,
+         0 AS unidades_devueltas,
+         0 AS devoluciones_total
+    FROM detalle_venta d
+    JOIN ventas v ON v.id = d.venta_id
+    LEFT JOIN productos p ON p.id = d.producto_id
+   WHERE (%(desde)s::timestamptz IS NULL OR v.fecha >= %(desde)s)
+     AND (%(hasta)s::timestamptz IS NULL OR v.fecha < %(hasta)s)
+     AND (%(productos)s::bigint[] IS NULL OR COALESCE(d.producto_id, 0) = ANY(%(productos)s))
+  UNION ALL
+  SELECT date_trunc('month', dv.fecha_local)::date,
+         COALESCE(dv.producto_id, 0),
+         CASE WHEN lower(trim(dv.producto_condicion_snapshot)) = 'used' THEN 'used' ELSE 'new' END,
+         COALESCE(dv.producto_nombre_snapshot, p.nombre),
+         0, 0, dv.cantidad, dv.total
+    FROM devoluciones dv
+    LEFT JOIN productos p ON p.id = dv.producto_id
+   WHERE (%(desde)s::timestamptz IS NULL OR dv.fecha >= %(desde)s)
+     AND (%(hasta)s::timestamptz IS NULL OR dv.fecha < %(hasta)s)
+     AND (%(productos)s::bigint[] IS NULL OR COALESCE(dv.producto_id, 0) = ANY(%(productos)s))
+)
+INSERT INTO ventas_producto_mensual
+       (condicion, mes, producto_id, producto_nombre, unidades, ingreso,
+        unidades_devueltas, devoluciones_total, updated_at)
+SELECT condicion, mes, producto_id, MAX(producto_nombre), SUM(unidades), SUM(ingreso),
+       SUM(unidades_devueltas), SUM(devoluciones_total), %(now)s
+  FROM filas
+ GROUP BY condicion, mes, producto_id
+HAVING SUM(unidades) <> 0 OR SUM(ingreso) <> 0
+    OR SUM(unidades_devueltas) <> 0 OR SUM(devoluciones_total) <> 0
+"""
+
+
+def _next_month(mes: date) -> date:
+    return date(mes.year + mes.month // 12, mes.month % 12 + 1, 1)
+
+
+def rebuild(desde: Optional[date] = None, hasta: Optional[date] = None, now=None) -> int:
+    """Recompute the counters for the months of ``desde``..``hasta`` (inclusive).
+
+    Whole months are rebuilt. Locks the table like rollup.rebuild; request
+    paths use ``rebuild_months``. Must run inside ``transaction.atomic``.
+    """
+    now = now or timezone.now()
+    with connection.cursor() as cursor:
+        cursor.execute("LOCK TABLE ventas_producto_mensual IN SHARE ROW EXCLUSIVE MODE")
+        return _replace(cursor, desde, hasta, None, now)
+
+
+def _replace(cursor, desde: Optional[date], hasta: Optional[date], productos, now) -> int:
+    desde = desde.replace(day=1) if desde else None
+    hasta = _next_month(hasta.replace(day=1)) if hasta else None
+    params = {
+        "desde": periods.day_start(desde),
+        "hasta": periods.day_start(hasta),
+        "productos": productos,
+        "now": now,
+    }
+    cursor.execute(
+        "DELETE FROM ventas_producto_mensual"
+        " WHERE (%(desde)s::date IS NULL OR mes >= %(desde)s)"
+        " AND (%(hasta)s::date IS NULL OR mes < %(hasta)s)"
+        " AND (%(productos)s::bigint[] IS NULL OR producto_id = ANY(%(productos)s))",
+        {"desde": desde, "hasta": hasta, "productos": productos},
+    )
+    cursor.execute(_REBUILD, params)
+    return cursor.rowcount
+
+
+def rebuild_months(fechas: Iterable, producto_ids: Iterable, now=None) -> None:
+    """Recompute the counters of ``producto_ids`` (None for unknown products)
+    for the local months of the given datetimes, under row locks.
+
+    Like rollup.rebuild_days: every affected key is upserted first, in the key
+    order of ``apply``, so concurrent checkouts wait on those rows only.
+    """
+    meses = sorted({month_of(fecha) for fecha in fechas if fecha is not None})
+    productos = sorted({pid or 0 for pid in producto_ids})
+    if not meses or not productos:
+        return
+    now = now or timezone.now()
+    keys = sorted(
+        (condicion, mes, pid) for condicion in ("new", "used") for mes in meses for pid in productos
+    )
+    row = "(%s, %s::date, %s, " + ", ".join(["0"] * len(FIELDS)) + ", %s)"
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"""
+            INSERT INTO ventas_producto_mensual AS r
+                   (condicion, mes, producto_id, {", ".join(FIELDS)}, updated_at)
+            VALUES {", ".join([row] * len(keys))}
+            ON CONFLICT (condicion, mes, producto_id) DO UPDATE SET updated_at = r.updated_at
+            """,
+            [value for key in keys for value in (*key, now)],
+        )
+        for mes in meses:
+            _replace(cursor, mes, mes, productos, now)
+
+
+def top_products(
+    condicion: str, limit: int = 5, desde: Optional[date] = None, hasta: Optional[date] = None
+) -> list:
+    """Best sellers by units for one condition, months ``desde``..``hasta``."""
+    qs = models.VentasProductoMensual.objects.filter(condicion=condicion)
+    if desde:
+        qs = qs.filter(mes__gte=desde.replace(day=1))
+    if hasta:
+        qs = qs.filter(mes__lte=hasta)
+    rows = (
+        qs.values("producto_id")
+        .annotate(nombre=Max("producto_nombre"), ventas=Sum("unidades"), ingresos=Sum("ingreso"))
+        .order_by("-ventas", "producto_id")[:limit]
+    )
+    return [
+        {"nombre": r["nombre"], "ventas": r["ventas"], "ingresos": r["ingresos"]} for r in rows
+    ]
+
+
+def velocity(
+    desde: date,
+    hasta: date,
+    condiciones: Iterable[str],
+    producto_id: Optional[int] = None,
+    limit: Optional[int] = None,
+    today: Optional[date] = None,
+) -> dict:
+    """Units per day over the whole months ``desde``..``hasta``, per product.
+
+    Days after ``today`` (default: the local date) have no sales yet and are
+    not counted, so the current month is averaged over its elapsed days.
+    """
+    today = today or timezone.localdate()
+    desde = desde.replace(day=1)
+    fin = _next_month(hasta.replace(day=1))
+    ultimo = max(min(fin - timedelta(days=1), today), desde)
+    dias = (ultimo - desde).days + 1
+    qs = models.VentasProductoMensual.objects.filter(
+        condicion__in=list(condiciones), mes__gte=desde, mes__lt=fin
+    )
+    if producto_id is not None:
+        qs = qs.filter(producto_id=producto_id)
+    rows = (
+        qs.values("producto_id")
+        .annotate(
+            nombre=Max("producto_nombre"),
+            unidades=Sum("unidades"),
+            unidades_devueltas=Sum("unidades_devueltas"),
+            ingreso=Sum("ingreso"),
+            devoluciones_total=Sum("devoluciones_total"),
+        )
+        .order_by("-unidades", "producto_id")
+    )
+    if limit:
+        rows = rows[:limit]
+    productos = []
+    for r in rows:
+        netas = r["unidades"] - r["unidades_devueltas"]
+        productos.append(
+            {
+                "producto_id": r["producto_id"],
+                "nombre": r["nombre"],
+                "unidades": r["unidades"],
+                "unidades_devueltas": r["unidades_devueltas"],
+                "unidades_netas": netas,
+                "ingreso": r["ingreso"],
+                "devoluciones_total": r["devoluciones_total"],
+                "unidades_por_dia": (netas / dias).quantize(Decimal("0.001")),
+            }
+        )
+    return {
+        "desde": desde.isoformat(),
+        "hasta": ultimo.isoformat(),
+        "dias": dias,
+        "productos": productos,
+    }
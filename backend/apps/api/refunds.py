@@ -0,0 +1,204 @@
+from __future__ import annotations
+
+from collections import defaultdict
+from decimal import Decimal, InvalidOperation, ROUND_HALF_UP
+from typing import List, Tuple
+
+from django.db import connection
+
+from . import models
+
+
+CENT = Decimal("0.01")
+QTY_STEP = Decimal("0.001")
+
+
+class RefundError(Exception):
+    """A refund request that cannot be applied; ``as_dict`` is the response body."""
+
+    def __init__(self, detail: str, status: int = 400, **extra):
+        super().__init__(detail)
+        self.detail = detail
+        self.status = status
+        self.extra = extra
+
+    def as_dict(self) -> dict:
+        return {"detail": self.detail, **self.extra}
+
+
+def parse_items(items) -> List[dict]:
+    parsed = []
+    for raw in items:
+        if not isinstance(raw, dict):
+            raise RefundError("Item inválido")
+        detalle_id = raw.get("detalle_id") or raw.get("detalle")
+        qty_raw = raw.get("qty") or raw.get("cantidad")
+        if not detalle_id:
+            raise RefundError("detalle_id requerido")
+        try:
+            detalle_id = int(detalle_id)
+        except (TypeError, ValueError):
+            raise RefundError("detalle_id inválido")
+        try:
+            qty = Decimal(str(qty_raw)).quantize(QTY_STEP, rounding=ROUND_HALF_UP)
+        except (InvalidOperation, ValueError):
+            raise RefundError("Cantidad inválida")
+        if qty <= 0:
+            raise RefundError("Cantidad debe ser positiva")
+        parsed.append({"detalle_id": detalle_id, "qty": qty, "motivo": raw.get("motivo")})
+    return parsed
+
+
+def load_lines(venta_id, parsed, lock: bool) -> dict:
+    qs = models.DetalleVenta.objects.filter(
+        venta_id=venta_id, id__in=[item["detalle_id"] for item in parsed]
+    )
+    if lock:
+        qs = qs.select_for_update()
+    return {det.id: det for det in qs}
+
+
+def credit_id_for(venta_id):
+    """Id of the credit a sale was charged to (first historial row), if any."""
+    return (
+        models.CreditosHistorialCompras.objects.filter(venta_id=venta_id)
+        .order_by("id")
+        .values_list("credito_id", flat=True)
+        .first()
+    )
+
+
+def find_credit(venta_id, lock: bool):
+    """The credit a sale was charged to, if any."""
+    credito_id = credit_id_for(venta_id)
+    if credito_id is None:
+        return None
+    qs = models.Creditos.objects
+    if lock:
+        qs = qs.select_for_update()
+    return qs.get(id=credito_id)
+
+
+def price_lines(parsed, detalles_map) -> Tuple[List[dict], Decimal]:
+    """Check quantities against what is still returnable and price each line."""
+    processed = []
+    total_refund = Decimal("0")
+    requested = defaultdict(Decimal)
+    for item in parsed:
+        detalle_id = item["detalle_id"]
+        detalle = detalles_map.get(detalle_id)
+        if not detalle:
+            raise RefundError(f"Detalle {detalle_id} no pertenece a la venta", status=404)
+        qty = item["qty"]
+        disponible = detalle.cantidad - (detalle.devuelto or Decimal("0")) - requested[detalle_id]
+        if qty > disponible:
+            raise RefundError(
+                "Cantidad supera disponible",
+                detalle_id=detalle_id,
+                disponible=float(disponible),
+            )
+        requested[detalle_id] += qty
+        line_total = (qty * detalle.precio_unitario).quantize(CENT, rounding=ROUND_HALF_UP)
+        processed.append(
+            {"detalle": detalle, "qty": qty, "motivo": item["motivo"], "total": line_total}
+        )
+        total_refund += line_total
+    return processed, total_refund
+
+
+def allocate_income(processed, total_refund, credito) -> Tuple[Decimal, List[dict]]:
+    """Split the income reversed by a refund across its lines.
+
+    Cash sales reverse the full line total. Credit sales only reverse what was
+    actually paid on the credit and not yet reversed by any of its sales (an
+    account holds many); the last line takes the rounding rest.
+    """
+    income_to_allocate = total_refund
+    if credito:
+        disponible_ingreso = max(credito.pagos_total - credito.ingreso_revertido, Decimal("0"))
+        income_to_allocate = min(disponible_ingreso, total_refund)
+
+    allocated = []
+    remaining_income = income_to_allocate
+    item_count = len(processed)
+    for idx, item in enumerate(processed):
+        line_income = Decimal("0")
+        if income_to_allocate > 0:
+            if credito:
+                if item_count == 1 or idx == item_count - 1:
+                    line_income = remaining_income
+                elif total_refund > 0:
+                    line_income = (income_to_allocate * item["total"] / total_refund).quantize(
+                        CENT, rounding=ROUND_HALF_UP
+                    )
+                remaining_income -= line_income
+                if remaining_income < Decimal("0"):
+                    remaining_income = Decimal("0")
+            else:
+                line_income = item["total"]
+        allocated.append({**item, "ingreso": max(line_income, Decimal("0"))})
+    return income_to_allocate, allocated
+
+
+def build_refund_rows(venta_id, allocated, products, now) -> List[models.Devoluciones]:
+    """Unsaved ``Devoluciones`` rows for ``bulk_create``.
+
+    Snapshots come from the sold line; ``products`` (catalog rows from
+    ``pricing.get_products``) only fill lines sold before snapshots existed.
+    """
+    rows = []
+    for info in allocated:
+        detalle = info["detalle"]
+        product = products.get(detalle.producto_id) or {}
+        rows.append(
+            models.Devoluciones(
+                fecha=now,
+                producto_id=detalle.producto_id,
+                venta_id=venta_id,
+                detalle_venta_id=detalle.id,
+                cantidad=info["qty"],
+                precio_unitario=detalle.precio_unitario,
+                total=info["total"],
+                motivo=info["motivo"],
+                ingreso_afectado=info["ingreso"],
+                producto_codigo_snapshot=detalle.producto_codigo_snapshot or product.get("codigo"),
+                producto_nombre_snapshot=detalle.producto_nombre_snapshot or product.get("nombre"),
+                producto_costo_snapshot=detalle.producto_costo_snapshot,
+                producto_condicion_snapshot=detalle.producto_condicion_snapshot,
+                producto_categoria_id_snapshot=detalle.producto_categoria_id_snapshot
+                or product.get("categoria_id"),
+                producto_categoria_nombre_snapshot=detalle.producto_categoria_nombre_snapshot
+                or product.get("categoria__nombre"),
+                created_at=now,
+                updated_at=now,
+            )
+        )
+    return rows
+
+
+def increment_devuelto(allocated, now) -> int:
+    """Add the refunded quantities to ``detalle_venta.devuelto`` in one UPDATE.
+
+    Quantities are summed per line first: ``UPDATE ... FROM`` applies a single
+    joined row per target, so duplicates in ``VALUES`` would be lost.
+    """
+    per_line = defaultdict(int)
+    for info in allocated:
+        per_line[info["detalle"].id] += info["qty"]
+    if not per_line:
+        return 0
+    values = ", ".join(["(%s::bigint, %s::numeric)"] * len(per_line))
+    params = [now]
+    for detalle_id in sorted(per_line):
+        params.extend([detalle_id, per_line[detalle_id]])
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"""
+            UPDATE detalle_venta d
+               SET devuelto = d.devuelto + v.qty, updated_at = %s
+              FROM (VALUES {values}) AS v(id, qty)
+             WHERE d.id = v.id
+            """,
+            params,
+        )
+        return cursor.rowcount
@@ -0,0 +1,314 @@
+from __future__ import annotations
+
+from collections import defaultdict
+from datetime import date, timedelta
+from decimal import Decimal, ROUND_HALF_UP
+from typing import Iterable, Optional
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connection, transaction
+from django.db.models import F, Sum
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from . import dashboard, models, periods
+
+
+# ventas_resumen_diario: one row per local day, product condition and channel
+# ("contado" for cash sales, "credito" for sales charged to a credit). Sales
+# count on the day of the sale, payments and refunds on their own day.
+# ``ingreso - ingreso_revertido`` is the cash actually collected.
+CENT = Decimal("0.01")
+FIELDS = (
+    "ventas_total",
+    "costo_total",
+    "unidades",
+    "ingreso",
+    "devoluciones_total",
+    "ingreso_revertido",
+)
+
+
+def condition_of(value) -> str:
+    """Lines without a recorded condition count as new, as on the dashboard."""
+    return "used" if (value or "").strip().lower() == "used" else "new"
+
+
+def new_deltas() -> dict:
+    return defaultdict(lambda: dict.fromkeys(FIELDS, Decimal("0")))
+
+
+def add_lines(deltas, detalles, credit_venta_ids, sign: int = 1) -> None:
+    """Sold lines: sales and cost, plus income for cash sales."""
+    for det in detalles:
+        canal = "credito" if det.venta_id in credit_venta_ids else "contado"
+        row = deltas[(timezone.localdate(det.fecha_venta), condition_of(det.producto_condicion_snapshot), canal)]
+        costo = (det.cantidad * (det.producto_costo_snapshot or Decimal("0"))).quantize(
+            CENT, rounding=ROUND_HALF_UP
+        )
+        row["ventas_total"] += sign * det.subtotal
+        row["costo_total"] += sign * costo
+        row["unidades"] += sign * det.cantidad
+        if canal == "contado":
+            row["ingreso"] += sign * det.subtotal
+
+
+def split_payment(monto: Decimal, split) -> tuple:
+    """``(new, used)`` parts of a credit payment; ``split`` is ``(used, total)``."""
+    used_sales, total_sales = split or (Decimal("0"), Decimal("0"))
+    used = Decimal("0")
+    if total_sales:
+        used = (monto * used_sales / total_sales).quantize(CENT, rounding=ROUND_HALF_UP)
+    return monto - used, used
+
+
+def line_splits(rows, amount: str = "subtotal") -> dict:
+    """``{venta_id: (new, used)}`` amounts of sold lines or refund rows."""
+    splits = defaultdict(lambda: [Decimal("0"), Decimal("0")])
+    for row in rows:
+        used = condition_of(row.producto_condicion_snapshot) == "used"
+        splits[row.venta_id][used] += getattr(row, amount)
+    return {venta_id: tuple(pair) for venta_id, pair in splits.items()}
+
+
+def credit_splits(creditos) -> dict:
+    """``{credito_id: (used, total)}`` from the split stored on each credit."""
+    return {c.id: (c.monto_usado, c.monto_nuevo + c.monto_usado) for c in creditos}
+
+
+def assign_splits(pagos, splits) -> None:
+    """Set ``monto_usado`` of unsaved payments from their credit's split."""
+    for pago in pagos:
+        pago.monto_usado = split_payment(pago.monto, splits.get(pago.credito_id))[1]
+
+
+def add_payments(deltas, pagos, sign: int = 1) -> None:
+    """Credit payments, split new/used by their stored ``monto_usado``."""
+    for pago in pagos:
+        dia = timezone.localdate(pago.fecha)
+        deltas[(dia, "new", "credito")]["ingreso"] += sign * (pago.monto - pago.monto_usado)
+        deltas[(dia, "used", "credito")]["ingreso"] += sign * pago.monto_usado
+
+
+def add_refunds(deltas, devoluciones, credit: bool, sign: int = 1) -> None:
+    canal = "credito" if credit else "contado"
+    for dev in devoluciones:
+        row = deltas[(timezone.localdate(dev.fecha), condition_of(dev.producto_condicion_snapshot), canal)]
+        row["devoluciones_total"] += sign * dev.total
+        row["ingreso_revertido"] += sign * dev.ingreso_afectado
+
+
+def apply(deltas, now) -> int:
+    """Add ``deltas`` to ventas_resumen_diario with a single upsert.
+
+    Rows are written in key order so concurrent writers lock them in the same
+    order. Must run inside the transaction that wrote the base rows.
+    """
+    keys = sorted(key for key, values in deltas.items() if any(values.values()))
+    if not keys:
+        return 0
+    dashboard.invalidate()
+    invalidate_closed(keys[0][0])
+    row = "(%s::date, %s, %s, " + ", ".join(["%s::numeric"] * len(FIELDS)) + ", %s)"
+    params = []
+    for key in keys:
+        params.extend(key)
+        params.extend(deltas[key][field] for field in FIELDS)
+        params.append(now)
+    columns = ", ".join(FIELDS)
+    updates = ", ".join(f"{field} = r.{field} + EXCLUDED.{field}" for field in FIELDS)
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"""
+            INSERT INTO ventas_resumen_diario AS r (dia, condicion, canal, {columns}, updated_at)
+            VALUES {", ".join([row] * len(keys))}
+            ON CONFLICT (dia, condicion, canal)
+            DO UPDATE SET {updates}, updated_at = EXCLUDED.updated_at
+            """,
+            params,
+        )
+        return cursor.rowcount
+
+
+# Recomputes the rollup from the base tables for days in [%(desde)s, %(hasta)s)
+# (either bound may be NULL). Mirrors add_lines/add_payments/add_refunds; a
+# sale is a credit sale when it has a creditos_historial_compras row.
+_REBUILD = """
+WITH credit_sales AS (
+  SELECT DISTINCT ON (venta_id) venta_id, credito_id
+    FROM creditos_historial_compras ORDER BY venta_id, id
+),
+lines AS (
+  SELECT v.fecha_local AS dia,
+         CASE WHEN lower(trim(d.producto_condicion_snapshot)) = 'used' THEN 'used' ELSE 'new' END
+           AS condicion,
+         CASE WHEN cs.venta_id IS NULL THEN 'contado' ELSE 'credito' END AS canal,
+         d.subtotal AS ventas_total,
+         ROUND(d.cantidad * COALESCE(d.producto_costo_snapshot, 0), 2) AS costo_total,
+         d.cantidad AS unidades,
+         CASE WHEN cs.venta_id IS NULL THEN d.subtotal ELSE 0 END AS ingreso,
+         0 AS devoluciones_total,
+         0 AS ingreso_revertido
+    FROM detalle_venta d
+    JOIN ventas v ON v.id = d.venta_id
+    LEFT JOIN credit_sales cs ON cs.venta_id = d.venta_id
+   WHERE (%(desde)s::timestamptz IS NULL OR v.fecha >= %(desde)s)
+     AND (%(hasta)s::timestamptz IS NULL OR v.fecha < %(hasta)s)
+),
+pagos_split AS (
+  SELECT p.fecha_local AS dia, p.monto, p.monto_usado AS usado
+    FROM pagos_credito p
+   WHERE (%(desde)s::timestamptz IS NULL OR p.fecha >= %(desde)s)
+     AND (%(hasta)s::timestamptz IS NULL OR p.fecha < %(hasta)s)
+),
+refunds AS (
+  SELECT dv.fecha_local AS dia,
+         CASE WHEN lower(trim(dv.producto_condicion_snapshot)) = 'used' THEN 'used' ELSE 'new' END
+           AS condicion,
+         CASE WHEN cs.venta_id IS NULL THEN 'contado' ELSE 'credito' END AS canal,
+         0 AS ventas_total, 0 AS costo_total, 0 AS unidades, 0 AS ingreso,
+         dv.total AS devoluciones_total,
+         dv.ingreso_afectado AS ingreso_revertido
+    FROM devoluciones dv
+    LEFT JOIN credit_sales cs ON cs.venta_id = dv.venta_id
+   WHERE (%(desde)s::timestamptz IS NULL OR dv.fecha >= %(desde)s)
+     AND (%(hasta)s::timestamptz IS NULL OR dv.fecha < %(hasta)s)
+),
+filas AS (
+  SELECT * FROM lines
+  UNION ALL
+  SELECT dia, 'new', 'credito', 0, 0, 0, monto - usado, 0, 0 FROM pagos_split
+  UNION ALL
+  SELECT dia, 'used', 'credito', 0, 0, 0, usado, 0, 0 FROM pagos_split
+  UNION ALL
+  SELECT * FROM refunds
+)
+INSERT INTO ventas_resumen_diario
+       (dia, condicion, canal, ventas_total, costo_total, unidades, ingreso,
+        devoluciones_total, ingreso_revertido, updated_at)
+SELECT dia, condicion, canal, SUM(ventas_total), SUM(costo_total), SUM(unidades),
+       SUM(ingreso), SUM(devoluciones_total), SUM(ingreso_revertido), %(now)s
+  FROM filas
+ GROUP BY dia, condicion, canal
+HAVING SUM(ventas_total) <> 0 OR SUM(costo_total) <> 0 OR SUM(unidades) <> 0
+    OR SUM(ingreso) <> 0 OR SUM(devoluciones_total) <> 0 OR SUM(ingreso_revertido) <> 0
+"""
+
+
+CONDICIONES = ("new", "used")
+CANALES = ("contado", "credito")
+
+
+def rebuild(desde: Optional[date] = None, hasta: Optional[date] = None, now=None) -> int:
+    """Recompute the rollup for local days ``desde``..``hasta`` (inclusive).
+
+    Takes a table lock so concurrent writers wait instead of adding deltas to
+    rows being replaced; meant for reconstruir_resumen_diario; request paths
+    use ``rebuild_days``. Must run inside ``transaction.atomic``.
+    """
+    now = now or timezone.now()
+    dashboard.invalidate()
+    invalidate_closed(desde)
+    with connection.cursor() as cursor:
+        cursor.execute("LOCK TABLE ventas_resumen_diario IN SHARE ROW EXCLUSIVE MODE")
+        return _replace(cursor, desde, hasta, now)
+
+
+def _replace(cursor, desde: Optional[date], hasta: Optional[date], now) -> int:
+    params = {
+        "desde": periods.day_start(desde),
+        "hasta": periods.day_start(hasta + timedelta(days=1)) if hasta else None,
+        "now": now,
+    }
+    cursor.execute(
+        "DELETE FROM ventas_resumen_diario"
+        " WHERE (%(desde)s::date IS NULL OR dia >= %(desde)s)"
+        " AND (%(hasta)s::date IS NULL OR dia <= %(hasta)s)",
+        {"desde": desde, "hasta": hasta},
+    )
+    cursor.execute(_REBUILD, params)
+    return cursor.rowcount
+
+
+def rebuild_days(fechas: Iterable, now=None) -> None:
+    """Recompute the local days of the given datetimes under row locks.
+
+    For edits and deletes in request paths. Every key of those days is
+    upserted first, in the key order of ``apply``, so the rows exist and stay
+    locked: concurrent checkouts wait on them and add their deltas once this
+    transaction commits, and other days are not blocked.
+    """
+    days = sorted({timezone.localdate(fecha) for fecha in fechas if fecha is not None})
+    if not days:
+        return
+    now = now or timezone.now()
+    keys = [(day, c, canal) for day in days for c in CONDICIONES for canal in CANALES]
+    dashboard.invalidate()
+    invalidate_closed(days[0])
+    with connection.cursor() as cursor:
+        row = "(%s::date, %s, %s, " + ", ".join(["0"] * len(FIELDS)) + ", %s)"
+        cursor.execute(
+            f"""
+            INSERT INTO ventas_resumen_diario AS r (dia, condicion, canal, {", ".join(FIELDS)}, updated_at)
+            VALUES {", ".join([row] * len(keys))}
+            ON CONFLICT (dia, condicion, canal) DO UPDATE SET updated_at = r.updated_at
+            """,
+            [value for key in keys for value in (*key, now)],
+        )
+        for day in days:
+            _replace(cursor, day, day, now)
+
+
+# Totals of closed days (before today) only change on a back-dated write, so
+# they are cached for ROLLUP_CLOSED_CACHE_TTL under a version that those
+# writes bump; today is always read live.
+CLOSED_VERSION_KEY = "rollup:closed_version"
+
+
+def invalidate_closed(first_day: Optional[date]) -> None:
+    """Drop cached closed-day totals on commit if ``first_day`` is before the
+    day of the commit (``None`` means every day).
+
+    Checked at commit time: a write to today that commits after midnight
+    changes a day that is closed by then.
+    """
+
+    def bump():
+        if first_day is None or first_day < timezone.localdate():
+            dashboard.bump_cache_version(CLOSED_VERSION_KEY)
+
+    transaction.on_commit(bump)
+
+
+def _income(qs) -> Decimal:
+    return qs.aggregate(
+        total=Coalesce(Sum(F("ingreso") - F("ingreso_revertido")), Decimal("0"))
+    )["total"]
+
+
+def closed_income(desde: Optional[date], hasta: date) -> Decimal:
+    """Cash collected on closed days ``desde``..``hasta``, cached."""
+    key = f"rollup:ingreso:{desde or 'inicio'}:{hasta}:{dashboard.cache_version(CLOSED_VERSION_KEY)}"
+    total = cache.get(key)
+    if total is None:
+        qs = models.VentasResumenDiario.objects.filter(dia__lte=hasta)
+        if desde:
+            qs = qs.filter(dia__gte=desde)
+        total = _income(qs)
+        cache.set(key, total, settings.ROLLUP_CLOSED_CACHE_TTL)
+    return total
+
+
+def income(desde: Optional[date], hasta: Optional[date], today: date) -> Decimal:
+    """Cash sales plus credit payments, net of reversed income, for local days
+    ``desde``..``hasta`` (either may be ``None``): cached closed days plus a
+    live read of today."""
+    hasta = min(hasta or today, today)
+    total = Decimal("0")
+    yesterday = today - timedelta(days=1)
+    if desde is None or desde <= yesterday:
+        total += closed_income(desde, min(hasta, yesterday))
+    if hasta == today and (desde is None or desde <= today):
+        total += _income(models.VentasResumenDiario.objects.filter(dia=today))
+    return total
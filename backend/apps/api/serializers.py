@@ -3,7 +3,7 @@ from django.utils import timezone
 from django.db import transaction
 from decimal import Decimal
 import re
-from . import models
+from . import credits, locking, models, movimientos, rollup
 
 
 def _norm(s):
@@ -26,9 +26,6 @@ class ClientesSerializer(serializers.ModelSerializer):
     contacto = serializers.CharField(required=False, allow_blank=True)
     contribuyente_iva = serializers.BooleanField(required=False, default=False)
     nombre_comercial = serializers.CharField(required=False, allow_blank=True)
-    fecha_ultima_compra = serializers.DateTimeField(
-        read_only=True, source="ultima_compra"
-    )
 
     class Meta:
         model = models.Clientes
@@ -54,10 +51,17 @@ class ClientesSerializer(serializers.ModelSerializer):
             "contribuyente_iva",
             "observaciones",
             "fecha_ultima_compra",
+            "compras_count",
+            "created_at",
+            "updated_at",
+        )
+        read_only_fields = (
+            "id",
             "created_at",
             "updated_at",
+            "fecha_ultima_compra",
+            "compras_count",
         )
-        read_only_fields = ("id", "created_at", "updated_at", "fecha_ultima_compra")
 
     def validate(self, attrs):
         attrs["tipo_cliente"] = (attrs.get("tipo_cliente") or "natural").lower()
@@ -341,13 +345,26 @@ class PagosCreditoSerializer(serializers.ModelSerializer):
         fields = '__all__'
 
     def create(self, validated_data):
-        with transaction.atomic():
-            pago = super().create(validated_data)
-            credito = pago.credito
-            credito.pagado += pago.monto
-            credito.saldo -= pago.monto
-            credito.updated_at = timezone.now()
-            credito.save(update_fields=["pagado", "saldo", "updated_at"])
+        return locking.run_atomic("pagos_credito", self._create_locked, dict(validated_data))
+
+    def _create_locked(self, validated_data):
+        # Lock the credit first: with rolling accounts several terminals
+        # may pay into the same row at once.
+        credito_id = validated_data["credito"].id
+        credito = locking.lock_rows("pagos_credito", [(models.Creditos, [credito_id])])[
+            models.Creditos
+        ][credito_id]
+        validated_data["credito"] = credito
+        validated_data["monto_usado"] = rollup.split_payment(
+            validated_data["monto"], rollup.credit_splits([credito])[credito_id]
+        )[1]
+        pago = super().create(validated_data)
+        credits.apply_payment(credito, pago.monto, timezone.now())
+        credito.save(update_fields=credits.PAYMENT_FIELDS)
+        deltas = rollup.new_deltas()
+        rollup.add_payments(deltas, [pago])
+        rollup.apply(deltas, credito.updated_at)
+        movimientos.insert(movimientos.payment_rows([pago], {credito.id: credito}))
         return pago
 
 class DevolucionesSerializer(serializers.ModelSerializer):
@@ -1,9 +1,42 @@
+import os
+import random
+from datetime import date, datetime, timedelta
+from decimal import Decimal
+from unittest import mock, skipUnless
+
+import pandas as pd
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import IntegrityError, OperationalError, connection
+from django.db.models import Q
+from django.http import HttpResponse
 from django.urls import reverse
 from django.utils import timezone
-from django.test import override_settings
-from rest_framework.test import APITestCase
+from django.test import SimpleTestCase, TestCase, override_settings
+from rest_framework.test import APIRequestFactory, APITestCase, force_authenticate
 
-from . import models
+from . import (
+    checkout,
+    credits,
+    customers,
+    dashboard,
+    historial,
+    idempotency,
+    locking,
+    models,
+    movimientos,
+    numbering,
+    periods,
+    pricing,
+    product_sales,
+    refunds,
+    rollup,
+    timing,
+    views,
+)
+from .management.commands import bench_dashboard
+from .management.commands.bench_pos import build_cart
 
 sqlite_db = {
     "default": {
@@ -13,9 +46,13 @@ sqlite_db = {
 }
 
 
-@override_settings(DATABASES=sqlite_db)
+@override_settings(
+    DATABASES=sqlite_db,
+    CACHES={"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}},
+)
 class TestReportesDashboard(APITestCase):
     def setUp(self):
+        cache.clear()
         now = timezone.now()
         categoria = models.Categorias.objects.create(nombre="General")
         producto = models.Productos.objects.create(
@@ -23,13 +60,7 @@ class TestReportesDashboard(APITestCase):
             nombre="Prod1",
             categoria=categoria,
             precio=100,
-            costo=60,
-            stock=5,
-            stock_minimo=1,
-            condicion="new",
             status="active",
-            created_at=now,
-            updated_at=now,
         )
         cliente = models.Clientes.objects.create(tipo_cliente="natural", nombre="Cliente")
         venta = models.Ventas.objects.create(
@@ -47,17 +78,1624 @@ class TestReportesDashboard(APITestCase):
             precio_unitario=100,
             subtotal=100,
             fecha_venta=now,
+            producto_nombre_snapshot="Prod1",
+            producto_costo_snapshot=60,
+            producto_condicion_snapshot="new",
             created_at=now,
             updated_at=now,
         )
+        # Checkout keeps these in step with the sale (rollup.apply and
+        # product_sales.apply); the dashboard only reads them.
+        today = timezone.localdate(now)
+        models.VentasResumenDiario.objects.create(
+            dia=today, condicion="new", canal="contado", ventas_total=100, costo_total=60,
+            unidades=1, ingreso=100, updated_at=now,
+        )
+        models.VentasProductoMensual.objects.create(
+            mes=today.replace(day=1), producto_id=producto.id, condicion="new",
+            producto_nombre="Prod1", unidades=1, ingreso=100, updated_at=now,
+        )
 
     def test_dashboard_returns_sales_data(self):
         url = reverse("reportes-dashboard")
         res = self.client.get(url)
         self.assertEqual(res.status_code, 200)
         data = res.json()
-        self.assertEqual(data["stats"]["total_productos"], 1)
-        self.assertEqual(int(data["stats"]["ventas_hoy"]), 100)
+        stats = data["stats"]
+        self.assertEqual(stats["total_productos"], 1)
+        self.assertEqual(Decimal(str(stats["ventas_hoy"])), Decimal("100"))
+        self.assertEqual(Decimal(str(stats["valor_inventario"])), Decimal("0"))
+        self.assertEqual(Decimal(str(stats["devoluciones_mensuales"])), Decimal("0"))
+        self.assertEqual(sorted(data["sales_chart"]), sorted(dashboard.PERIODS))
         self.assertEqual(len(data["recent_sales"]), 1)
+        self.assertEqual(data["recent_sales"][0]["customer"], "Cliente")
+        self.assertEqual(data["low_stock_items"], [])
+        self.assertEqual(data["category_data"], [{"name": "General", "value": 1}])
         self.assertEqual(len(data["top_products"]), 1)
+        self.assertEqual(data["top_products"][0]["nombre"], "Prod1")
+        self.assertEqual(Decimal(str(data["top_products"][0]["ventas"])), Decimal("1"))
+
+
+class TestCheckoutLines(SimpleTestCase):
+    def test_build_detalle_rows_fills_snapshots(self):
+        now = timezone.now()
+        venta = models.Ventas(id=1, fecha=now, created_at=now, updated_at=now)
+        lines = checkout.parse_cart_items(
+            [
+                {"productId": "7", "qty": 2, "unit_price": "3.50"},
+                {"productId": 8, "qty": "1.5", "unit_price": 10, "override": True},
+            ]
+        )
+        snapshots = {
+            7: {"id": 7, "codigo": "P-00007", "nombre": "FILTRO", "precio": Decimal("3.50"), "status": "active", "categoria_id": 3, "categoria__nombre": "Motor"},
+            8: {"id": 8, "codigo": None, "nombre": "ACEITE", "precio": Decimal("12.00"), "status": "active", "categoria_id": 4, "categoria__nombre": "Lubricantes"},
+        }
+        quote = pricing.price_cart(lines, snapshots, override_granted=True)
+        rows = checkout.build_detalle_rows(venta, quote["lines"], snapshots, now)
+        self.assertEqual(len(rows), 2)
+        self.assertEqual(rows[0].subtotal, Decimal("7.00"))
+        self.assertEqual(rows[0].producto_codigo_snapshot, "P-00007")
+        self.assertEqual(rows[0].producto_categoria_nombre_snapshot, "Motor")
+        self.assertFalse(rows[0].override)
+        self.assertEqual(rows[1].subtotal, Decimal("15.00"))
+        self.assertEqual(rows[1].producto_nombre_snapshot, "ACEITE")
+        self.assertTrue(rows[1].override)
+
+    def test_parse_cart_items_rejects_missing_product(self):
+        with self.assertRaises(KeyError):
+            checkout.parse_cart_items([{"qty": 1, "unit_price": 1}])
+
+
+class TestIdempotencyFingerprint(SimpleTestCase):
+    def test_fingerprint_ignores_key_order(self):
+        a = {"saleType": "DIRECT", "items": [{"productId": 1, "qty": 2}]}
+        b = {"items": [{"qty": 2, "productId": 1}], "saleType": "DIRECT"}
+        self.assertEqual(idempotency.fingerprint(a), idempotency.fingerprint(b))
+
+    def test_fingerprint_detects_changed_payload(self):
+        a = {"saleType": "DIRECT", "totals": {"total": 10}}
+        b = {"saleType": "DIRECT", "totals": {"total": 11}}
+        self.assertNotEqual(idempotency.fingerprint(a), idempotency.fingerprint(b))
+
+    def test_store_replaces_expired_keys(self):
+        now = timezone.now()
+        with mock.patch.object(models.IdempotencyKey, "objects") as objects, mock.patch.object(
+            idempotency.transaction, "on_commit"
+        ):
+            idempotency.store_many("pos_checkout", [("k1", "h", {}, 201)], now)
+        objects.filter.assert_called_once_with(
+            scope="pos_checkout", key__in=["k1"], expires_at__lte=now
+        )
+        objects.filter.return_value.delete.assert_called_once_with()
+        objects.bulk_create.assert_called_once()
+
+
+class TestPosCheckoutReplay(SimpleTestCase):
+    """A sale sent to ``pos/checkout`` and retried through the batch, or the
+    other way round, hashes the same."""
+
+    sale = {
+        "saleType": "DIRECT",
+        "paymentMethod": "CASH",
+        "items": [{"productId": 1, "qty": 2, "unit_price": 10}],
+        "totals": {"total": 20},
+        "paidAmount": 20,
+        "idempotencyKey": "k1",
+    }
+
+    def _post(self, body):
+        request = APIRequestFactory().post(
+            "/api/pos/checkout", body, format="json", HTTP_IDEMPOTENCY_KEY="k1"
+        )
+        record = models.IdempotencyKey(
+            key="k1",
+            request_hash=checkout.request_fingerprint(self.sale),
+            response={"id": 5, "documento_numero": "7"},
+            status_code=201,
+            expires_at=timezone.now() + timedelta(hours=1),
+        )
+        with mock.patch.object(models.IdempotencyKey, "objects") as objects:
+            objects.filter.return_value.first.return_value = record
+            return views.pos_checkout(request)
+
+    def test_same_body_is_replayed(self):
+        body = {k: v for k, v in self.sale.items() if k != "idempotencyKey"}
+        for payload in (self.sale, body):
+            response = self._post(payload)
+            self.assertEqual(
+                (response.status_code, response.data), (201, {"id": 5, "documento_numero": "7"})
+            )
+            self.assertEqual(response["Idempotent-Replayed"], "true")
+
+    def test_other_body_is_rejected(self):
+        response = self._post({**self.sale, "paidAmount": 25})
+        self.assertEqual(response.status_code, 422)
+
+
+class TestPricing(SimpleTestCase):
+    products = {
+        1: {"id": 1, "precio": Decimal("10.00"), "status": "active"},
+        2: {"id": 2, "precio": Decimal("0.35"), "status": "active"},
+        3: {"id": 3, "precio": Decimal("5.00"), "status": "archived"},
+    }
+
+    def test_recomputes_total_from_catalog(self):
+        lines = checkout.parse_cart_items(
+            [{"productId": 1, "qty": 3}, {"productId": 2, "qty": "1.5", "unit_price": "0.35"}]
+        )
+        quote = pricing.price_cart(lines, self.products)
+        self.assertEqual(quote["total"], Decimal("30.53"))
+        self.assertEqual(quote["mismatches"], [])
+
+    def test_reports_client_price_mismatch(self):
+        lines = checkout.parse_cart_items([{"productId": 1, "qty": 1, "unit_price": 8}])
+        quote = pricing.price_cart(lines, self.products)
+        self.assertEqual(len(quote["mismatches"]), 1)
+        self.assertEqual(quote["total"], Decimal("10.00"))
+
+    def test_override_requires_grant(self):
+        lines = checkout.parse_cart_items(
+            [{"productId": 1, "qty": 1, "unit_price": 8, "override": True}]
+        )
+        denied = pricing.price_cart(lines, self.products, override_granted=False)
+        self.assertTrue(denied["has_override"])
+        self.assertEqual(denied["total"], Decimal("10.00"))
+        granted = pricing.price_cart(lines, self.products, override_granted=True)
+        self.assertEqual(granted["total"], Decimal("8.00"))
+        self.assertEqual(granted["mismatches"], [])
+
+    def test_rejects_inactive_product(self):
+        lines = checkout.parse_cart_items([{"productId": 3, "qty": 1}])
+        with self.assertRaisesMessage(pricing.PricingError, "Producto 3 no está activo"):
+            pricing.price_cart(lines, self.products)
+
+    def test_prices_as_of_sale_time(self):
+        changed = timezone.now()
+        products = {
+            1: {
+                "id": 1,
+                "precio": Decimal("12.00"),
+                "precio_anterior": Decimal("10.00"),
+                "precio_desde": changed,
+                "status": "active",
+            }
+        }
+        lines = checkout.parse_cart_items([{"productId": 1, "qty": 1, "unit_price": 10}])
+        before = pricing.price_cart(lines, products, at=changed - timedelta(hours=1))
+        self.assertEqual(before["total"], Decimal("10.00"))
+        self.assertEqual(before["mismatches"], [])
+        after = pricing.price_cart(lines, products, at=changed)
+        self.assertEqual(after["total"], Decimal("12.00"))
+        self.assertEqual(len(after["mismatches"]), 1)
+
+
+@override_settings(CACHES={"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}})
+class TestOverrideToken(SimpleTestCase):
+    def setUp(self):
+        cache.clear()
+
+    def test_token_is_single_use_and_bound_to_owner(self):
+        token = pricing.issue_override_token("user:1")
+        self.assertFalse(pricing.override_token_valid(token, "user:2"))
+        self.assertFalse(pricing.spend_override_token(token, "user:2"))
+        self.assertTrue(pricing.override_token_valid(token, "user:1"))
+        self.assertTrue(pricing.spend_override_token(token, "user:1"))
+        self.assertFalse(pricing.spend_override_token(token, "user:1"))
+        self.assertFalse(pricing.override_token_valid(None, "user:1"))
+
+    def test_restored_token_can_be_spent_again(self):
+        token = pricing.issue_override_token("session:abc")
+        entry = pricing.spend_override_token(token, "session:abc")
+        self.assertTrue(entry)
+        pricing.restore_override_token(token, entry)
+        self.assertTrue(pricing.spend_override_token(token, "session:abc"))
+
+    @override_settings(PRICE_OVERRIDE_GRANT_TTL=300)
+    def test_token_covers_sales_inside_its_window(self):
+        issued = timezone.now() - timedelta(hours=2)
+        token = pricing.issue_override_token("user:1", now=issued)
+        self.assertFalse(pricing.override_token_valid(token, "user:1"))
+        self.assertFalse(pricing.override_token_valid(token, "user:1", issued - timedelta(seconds=1)))
+        self.assertTrue(pricing.spend_override_token(token, "user:1", issued + timedelta(minutes=4)))
+
+
+@override_settings(IVA_PORCENTAJE=Decimal("13"))
+class TestIvaBreakdown(SimpleTestCase):
+    def test_iva_is_included_in_total(self):
+        iva = pricing.iva_breakdown(Decimal("113.00"))
+        self.assertEqual(iva["subtotal"], Decimal("100.00"))
+        self.assertEqual(iva["iva_monto"], Decimal("13.00"))
+        self.assertEqual(iva["iva_porcentaje"], Decimal("13"))
+
+    def test_parts_always_add_up(self):
+        for cents in (1, 7, 99, 1234, 99999):
+            total = Decimal(cents) / 100
+            iva = pricing.iva_breakdown(total)
+            self.assertEqual(iva["subtotal"] + iva["iva_monto"], total)
+
+
+class TestCheckoutValidation(SimpleTestCase):
+    products = {
+        1: {"id": 1, "precio": Decimal("10.00"), "status": "active"},
+        2: {"id": 2, "precio": Decimal("10.00"), "status": "archived"},
+    }
+
+    def _sale(self, **overrides):
+        payload = {
+            "saleType": "DIRECT",
+            "paymentMethod": "CASH",
+            "customerId": None,
+            "items": [{"productId": 1, "qty": 2, "unit_price": 10}],
+            "totals": {"total": 20},
+            "paidAmount": 20,
+        }
+        payload.update(overrides)
+        return checkout.parse_sale(payload, timezone.now())
+
+    def test_valid_cash_sale(self):
+        sale = checkout.price_sale(self._sale(), self.products, set(), False)
+        self.assertEqual(sale["total"], Decimal("20.00"))
+        self.assertEqual(sale["method"], "efectivo")
+        self.assertEqual(sale["subtotal"] + sale["iva_monto"], sale["total"])
+
+    def test_credit_requires_customer(self):
+        with self.assertRaises(checkout.CheckoutError) as ctx:
+            checkout.price_sale(
+                self._sale(saleType="CREDIT", paidAmount=0), self.products, set(), False
+            )
+        self.assertEqual(ctx.exception.detail, "Cliente requerido para crédito")
+
+    def test_unknown_customer_is_rejected(self):
+        with self.assertRaises(checkout.CheckoutError):
+            checkout.price_sale(self._sale(customerId=99), self.products, {1}, False)
+
+    def test_total_mismatch_is_rejected(self):
+        with self.assertRaises(checkout.CheckoutError) as ctx:
+            checkout.price_sale(
+                self._sale(totals={"total": 18}, paidAmount=18), self.products, set(), False
+            )
+        self.assertEqual(ctx.exception.extra["total"], Decimal("20.00"))
+
+    def test_override_without_grant_is_forbidden(self):
+        sale = self._sale(items=[{"productId": 1, "qty": 2, "unit_price": 9, "override": True}])
+        with self.assertRaises(checkout.CheckoutError) as ctx:
+            checkout.price_sale(sale, self.products, set(), False)
+        self.assertEqual(ctx.exception.status, 403)
+        priced = checkout.price_sale(
+            self._sale(
+                items=[{"productId": 1, "qty": 2, "unit_price": 9, "override": True}],
+                totals={"total": 18},
+                paidAmount=18,
+                overrideToken="t",
+            ),
+            self.products,
+            set(),
+            True,
+        )
+        self.assertTrue(priced["has_override"])
+        self.assertEqual(priced["override_token"], "t")
+
+    def test_inactive_product_is_rejected(self):
+        with self.assertRaisesMessage(checkout.CheckoutError, "Producto 2 no está activo"):
+            checkout.price_sale(
+                self._sale(items=[{"productId": 2, "qty": 2}]), self.products, set(), False
+            )
+
+    def test_sold_at_is_clamped_to_now(self):
+        sale = self._sale(soldAt="2999-01-01T00:00:00Z")
+        self.assertLessEqual(sale["fecha"], timezone.now())
+
+    @override_settings(POS_OFFLINE_MAX_AGE=3600)
+    def test_sold_at_must_be_within_offline_window(self):
+        recent = timezone.now() - timedelta(minutes=30)
+        self.assertEqual(self._sale(soldAt=recent.isoformat())["fecha"], recent)
+        old = timezone.now() - timedelta(hours=2)
+        with self.assertRaisesMessage(checkout.CheckoutError, "Venta offline demasiado antigua"):
+            self._sale(soldAt=old.isoformat())
+
+    def test_unknown_document_type_is_rejected(self):
+        with self.assertRaises(checkout.CheckoutError):
+            self._sale(documentType="factura")
+
+
+class TestPosCheckoutBatch(SimpleTestCase):
+    """The batch endpoint with the catalog, numbering and writes mocked."""
+
+    products = {1: {"id": 1, "precio": Decimal("10.00"), "status": "active"}}
+
+    def setUp(self):
+        self.writes = []
+        for target, attr, kwargs in (
+            (pricing, "get_products", {"return_value": self.products}),
+            (checkout, "known_customer_ids", {"return_value": set()}),
+            (checkout, "assign_document_numbers", {}),
+            (idempotency, "find_many", {"return_value": {}}),
+            (locking, "run_atomic", {"side_effect": self._write}),
+        ):
+            patcher = mock.patch.object(target, attr, **kwargs)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def _write(self, endpoint, fn, sales, products, now):
+        self.writes.append(len(sales))
+        if any(sale["observaciones"] == "falla" for sale in sales):
+            raise IntegrityError("documento duplicado")
+        return [
+            models.Ventas(id=100 + len(self.writes) * 10 + i, documento_numero=str(i))
+            for i, _ in enumerate(sales)
+        ]
+
+    def _sale(self, **overrides):
+        payload = {
+            "saleType": "DIRECT",
+            "paymentMethod": "CASH",
+            "customerId": None,
+            "items": [{"productId": 1, "qty": 2, "unit_price": 10}],
+            "totals": {"total": 20},
+            "paidAmount": 20,
+        }
+        payload.update(overrides)
+        return payload
+
+    def _post(self, sales):
+        request = APIRequestFactory().post("/api/pos/checkout/batch", {"sales": sales}, format="json")
+        force_authenticate(request, user=mock.Mock(is_authenticated=True, pk=1))
+        return views.pos_checkout_batch(request)
+
+    def _statuses(self, response):
+        return [(row["status"], row.get("status_code")) for row in response.data["results"]]
+
+    def test_valid_sales_are_written_together(self):
+        response = self._post([self._sale(), self._sale(items=[]), self._sale()])
+        self.assertEqual(
+            self._statuses(response), [("created", None), ("error", 400), ("created", None)]
+        )
+        self.assertEqual((response.data["created"], response.data["failed"]), (2, 1))
+        self.assertEqual(self.writes, [2])
+
+    def test_key_repeated_in_batch_is_rejected(self):
+        response = self._post([self._sale(idempotencyKey="k1"), self._sale(idempotencyKey="k1")])
+        self.assertEqual(self._statuses(response), [("created", None), ("error", 400)])
+        self.assertEqual(
+            response.data["results"][1]["detail"], "Idempotency-Key duplicada en el lote"
+        )
+
+    def test_failing_sale_is_isolated(self):
+        response = self._post([self._sale(), self._sale(observaciones="falla"), self._sale()])
+        self.assertEqual(
+            self._statuses(response), [("created", None), ("error", 400), ("created", None)]
+        )
+        self.assertEqual(self.writes, [3, 1, 1, 1])
+
+    def test_stored_key_is_replayed(self):
+        sale = self._sale(idempotencyKey="k1")
+        record = models.IdempotencyKey(
+            key="k1",
+            request_hash=checkout.request_fingerprint(sale),
+            response={"id": 5, "documento_numero": "7"},
+        )
+        idempotency.find_many.return_value = {"k1": record}
+        response = self._post([sale, self._sale()])
+        self.assertEqual(
+            response.data["results"][0],
+            {"index": 0, "status": "replayed", "id": 5, "documento_numero": "7"},
+        )
+        self.assertEqual((response.data["replayed"], self.writes), (1, [1]))
+
+    def test_spent_tokens_are_restored_when_sales_fail(self):
+        override = self._sale(
+            items=[{"productId": 1, "qty": 2, "unit_price": 9, "override": True}],
+            totals={"total": 18},
+            paidAmount=18,
+            overrideToken="t",
+        )
+        for failure, expected in (
+            (IntegrityError("documento duplicado"), 400),
+            (locking.TransactionConflict(), 409),
+        ):
+            locking.run_atomic.side_effect = failure
+            with self.subTest(failure=type(failure).__name__), mock.patch.object(
+                pricing, "override_token_valid", return_value=True
+            ), mock.patch.object(
+                pricing, "spend_override_token", return_value=("owner", 1)
+            ), mock.patch.object(pricing, "restore_override_token") as restore:
+                response = self._post([override])
+                self.assertEqual(self._statuses(response), [("error", expected)])
+                restore.assert_called_once_with("t", ("owner", 1))
+
+
+@override_settings(
+    CACHES={"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}},
+    IVA_PORCENTAJE=Decimal("13"),
+)
+class TestPosQuote(APITestCase):
+    def setUp(self):
+        cache.clear()
+        categoria = models.Categorias.objects.create(nombre="General")
+        self.producto = models.Productos.objects.create(
+            codigo="P1", nombre="Prod1", categoria=categoria, precio=Decimal("11.30"), status="active"
+        )
+
+    def _quote(self, unit_price, override=False, **extra):
+        payload = {
+            "items": [
+                {"productId": self.producto.id, "qty": 2, "unit_price": unit_price, "override": override}
+            ],
+            **extra,
+        }
+        with mock.patch.object(views, "_override_owner", return_value="user:1"):
+            return self.client.post(reverse("pos-quote"), payload, format="json")
+
+    def test_lines_and_iva_from_catalog(self):
+        response = self._quote(11.30, totals={"total": 22.60})
+        self.assertEqual(response.status_code, 200)
+        line = response.data["items"][0]
+        self.assertEqual(
+            (line["codigo"], line["precio"], line["unit_price"], line["subtotal"], line["override"]),
+            ("P1", Decimal("11.30"), Decimal("11.30"), Decimal("22.60"), False),
+        )
+        self.assertEqual(
+            (response.data["subtotal"], response.data["iva_monto"], response.data["total"]),
+            (Decimal("20.00"), Decimal("2.60"), Decimal("22.60")),
+        )
+        self.assertTrue(response.data["total_ok"])
+        self.assertFalse(response.data["override_authorized"])
+
+    def test_override_needs_a_token(self):
+        denied = self._quote(10, override=True)
+        self.assertEqual(denied.data["items"][0]["unit_price"], Decimal("11.30"))
+        self.assertFalse(denied.data["override_authorized"])
+        token = pricing.issue_override_token("user:1")
+        granted = self._quote(10, override=True, overrideToken=token)
+        self.assertEqual(granted.data["items"][0]["unit_price"], Decimal("10"))
+        self.assertEqual(granted.data["total"], Decimal("20.00"))
+        self.assertTrue(granted.data["override_authorized"])
+        # Quoting does not spend the token.
+        self.assertTrue(pricing.override_token_valid(token, "user:1"))
+
+
+@override_settings(DOCUMENTO_BLOCK_SIZE=3)
+class TestDocumentNumbering(SimpleTestCase):
+    def setUp(self):
+        numbering._BLOCKS.clear()
+        self.next = {}
+
+        def reserve(tipo, serie, size):
+            start = self.next.get((tipo, serie), 1)
+            self.next[(tipo, serie)] = start + size
+            return start, start + size
+
+        patcher = mock.patch.object(numbering, "_reserve_block", side_effect=reserve)
+        self.reserve = patcher.start()
+        self.addCleanup(patcher.stop)
+        self.addCleanup(numbering._BLOCKS.clear)
+
+    def test_numbers_come_from_cached_block(self):
+        self.assertEqual(numbering.allocate_many("ticket", "A", 2), [1, 2])
+        self.assertEqual(numbering.allocate("ticket", "A"), 3)
+        self.assertEqual(self.reserve.call_count, 1)
+        self.assertEqual(numbering.allocate("ticket", "A"), 4)
+        self.assertEqual(self.reserve.call_count, 2)
+
+    def test_large_request_spans_blocks(self):
+        numbering.allocate("ticket", "A")
+        self.assertEqual(numbering.allocate_many("ticket", "A", 6), [2, 3, 4, 5, 6, 7])
+
+    def test_series_are_independent(self):
+        self.assertEqual(numbering.allocate("ticket", "A"), 1)
+        self.assertEqual(numbering.allocate("ccf", "A"), 1)
+
+    def test_assign_document_numbers_groups_by_series(self):
+        sales = [
+            {"documento_tipo": "ticket", "documento_serie": "A"},
+            {"documento_tipo": "ccf", "documento_serie": "A"},
+            {"documento_tipo": "ticket", "documento_serie": "A"},
+        ]
+        checkout.assign_document_numbers(sales)
+        self.assertEqual([s["documento_numero"] for s in sales], ["1", "1", "2"])
+        self.assertEqual(self.reserve.call_count, 2)
+
+    def test_gaps_run_to_reserved_mark(self):
+        cursor = mock.MagicMock()
+        cursor.fetchone.return_value = (3, 1, 5)
+        cursor.fetchall.return_value = [(3, 4)]
+        serie = models.DocumentoSerie(documento_tipo="ticket", serie="A", siguiente=9)
+        with mock.patch.object(numbering, "connection") as conn, mock.patch.object(
+            models.DocumentoSerie, "objects"
+        ) as objects:
+            conn.cursor.return_value.__enter__.return_value = cursor
+            objects.filter.return_value.first.return_value = serie
+            audit = numbering.find_gaps("ticket", "A")
+        self.assertEqual(audit["reservado_hasta"], 8)
+        self.assertEqual(audit["huecos"], [[3, 4], [6, 8]])
+        self.assertEqual(audit["numeros_faltantes"], 5)
+
+    def test_gaps_start_at_one(self):
+        cursor = mock.MagicMock()
+        cursor.fetchone.return_value = (2, 4, 6)
+        cursor.fetchall.return_value = [(5, 5)]
+        serie = models.DocumentoSerie(documento_tipo="ticket", serie="A", siguiente=7)
+        with mock.patch.object(numbering, "connection") as conn, mock.patch.object(
+            models.DocumentoSerie, "objects"
+        ) as objects:
+            conn.cursor.return_value.__enter__.return_value = cursor
+            objects.filter.return_value.first.return_value = serie
+            audit = numbering.find_gaps("ticket", "A")
+        self.assertEqual(audit["huecos"], [[1, 3], [5, 5]])
+        self.assertEqual(audit["numeros_faltantes"], 4)
+
+
+@override_settings(TIMING_WINDOW=100)
+class TestTiming(SimpleTestCase):
+    def setUp(self):
+        timing.reset()
+        self.addCleanup(timing.reset)
+
+    def test_percentile_nearest_rank(self):
+        values = [float(v) for v in range(1, 101)]
+        self.assertEqual(timing.percentile(values, 50), 50.0)
+        self.assertEqual(timing.percentile(values, 99), 99.0)
+        self.assertEqual(timing.percentile([], 50), 0.0)
+
+    def test_finish_sets_header_and_records_phases(self):
+        timer = timing.Timer("pos_checkout")
+        timer.lap("parse")
+        timer.lap("commit")
+        response = timer.finish(HttpResponse())
+        header = response["Server-Timing"]
+        self.assertIn("parse;dur=", header)
+        self.assertIn("total;dur=", header)
+        stats = timing.snapshot()["pos_checkout"]
+        self.assertEqual(set(stats), {"parse", "commit", "total"})
+        self.assertEqual(stats["total"]["count"], 1)
+
+    def test_window_is_rolling(self):
+        timing.record("x", [("total", 1.0)] * 150)
+        self.assertEqual(timing.snapshot()["x"]["total"]["count"], 100)
+
+
+def _db_error(pgcode):
+    cause = Exception("fallo")
+    cause.pgcode = pgcode
+    exc = OperationalError("fallo")
+    exc.__cause__ = cause
+    return exc
+
+
+class TestPeriods(SimpleTestCase):
+    def test_modes_resolve_to_local_days(self):
+        today = date(2024, 3, 20)
+        self.assertEqual(periods.resolve("daily", today)[1:], (today, today))
+        self.assertEqual(periods.resolve("quincenal", today).start_date, date(2024, 3, 16))
+        self.assertEqual(periods.resolve("quincenal", date(2024, 3, 15)).start_date, date(2024, 3, 1))
+        self.assertEqual(periods.resolve("monthly", today).start_date, date(2024, 3, 1))
+        self.assertEqual(periods.resolve("all", today)[1:], (None, None))
+        self.assertEqual(
+            periods.resolve("range", today, date(2024, 1, 1), date(2024, 5, 1)).end_date, today
+        )
+
+    def test_bounds_are_half_open_local_midnights(self):
+        period = periods.resolve("daily", date(2024, 3, 20))
+        self.assertEqual(timezone.localtime(period.start), period.start)
+        self.assertEqual(period.end - period.start, timedelta(days=1))
+        self.assertEqual(timezone.localdate(period.end), date(2024, 3, 21))
+        qs = mock.Mock()
+        qs.filter.return_value = qs
+        period.filter(qs, "fecha")
+        qs.filter.assert_has_calls(
+            [mock.call(fecha__gte=period.start), mock.call(fecha__lt=period.end)]
+        )
+        self.assertIs(periods.resolve("all", date(2024, 3, 20)).filter(qs), qs)
+        self.assertEqual(qs.filter.call_count, 2)
+
+    def test_invalid_mode_and_range(self):
+        with self.assertRaisesMessage(periods.PeriodError, "Invalid mode"):
+            periods.resolve("weekly", date(2024, 3, 20))
+        with self.assertRaisesMessage(periods.PeriodError, "Invalid range"):
+            periods.from_params(
+                {"mode": "range", "start": "2024-03-10", "end": "2024-03-01"}, date(2024, 3, 20)
+            )
+
+    def test_malformed_date_is_a_period_error(self):
+        with self.assertRaisesMessage(periods.PeriodError, "Invalid date"):
+            periods.from_params({"mode": "range", "start": "2024-13-01"}, date(2024, 3, 20))
+
+    def test_ventas_total_rejects_malformed_date(self):
+        request = APIRequestFactory().get("/api/ventas/total", {"start": "2024-13-40"})
+        response = views.ventas_total(request)
+        self.assertEqual((response.status_code, response.data), (400, {"detail": "Invalid date"}))
+
+
+class _Rows(list):
+    """A history queryset; ``filter`` takes a predicate on the row."""
+
+    def filter(self, predicate):
+        return _Rows(row for row in self if predicate(row))
+
+
+class TestHistorialPaging(SimpleTestCase):
+    def setUp(self):
+        base = timezone.make_aware(datetime(2024, 3, 20, 10))
+        self.rows = _Rows(
+            models.Movimientos(id=i, fecha=base - timedelta(minutes=i // 4)) for i in range(1, 60)
+        )
+        order = lambda fecha, pk: (-fecha.timestamp(), pk)
+        self.rows.sort(key=lambda mov: order(mov.fecha, mov.id))
+        for name, fn in (
+            ("row", lambda mov: mov.id),
+            # Evaluate the keyset condition in Python instead of SQL.
+            ("after", lambda cursor: lambda mov: order(mov.fecha, mov.id) > order(*cursor)),
+        ):
+            patcher = mock.patch.object(historial, name, side_effect=fn)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def test_cursor_pages_match_offset_pages(self):
+        seen, cursor, offset = [], None, 0
+        while True:
+            ids, next_cursor = historial.page(self.rows, 7, cursor=cursor)
+            self.assertEqual(ids, historial.page(self.rows, 7, offset=offset)[0])
+            seen.extend(ids)
+            offset += 7
+            if next_cursor is None:
+                break
+            cursor = historial.decode_cursor(next_cursor)
+            self.assertEqual(cursor[1], ids[-1])
+        self.assertEqual(seen, [mov.id for mov in self.rows])
+
+
+class TestHistorialCursor(SimpleTestCase):
+    def test_round_trip_and_invalid(self):
+        key = (timezone.make_aware(datetime(2024, 3, 20, 10, 5, 1, 250)), 42)
+        self.assertEqual(historial.decode_cursor(historial.encode_cursor(key)), key)
+        for raw in ("nope", historial.encode_cursor((datetime(2024, 3, 20), 1))):
+            with self.assertRaisesMessage(historial.CursorError, "Cursor inválido"):
+                historial.decode_cursor(raw)
+
+    def test_after_follows_index_order(self):
+        fecha = timezone.make_aware(datetime(2024, 3, 20, 10))
+        self.assertEqual(
+            historial.after((fecha, 9)), Q(fecha__lt=fecha) | Q(fecha=fecha, id__gt=9)
+        )
+
+
+class TestMovimientos(SimpleTestCase):
+    def test_refunds_written_together_are_one_row(self):
+        now = timezone.now()
+        venta = models.Ventas(id=7, cliente_id=3, fecha=now)
+        row = movimientos.refund_row(
+            venta,
+            [
+                models.Devoluciones(id=12, fecha=now, total=Decimal("4.00"),
+                                    ingreso_afectado=Decimal("4.00"), motivo="roto"),
+                models.Devoluciones(id=11, fecha=now, total=Decimal("1.50"),
+                                    ingreso_afectado=Decimal("0"), motivo=""),
+            ],
+        )
+        self.assertEqual(
+            (row.tipo, row.origen_id, row.venta_id, row.cliente_id, row.nota),
+            (movimientos.DEVOLUCION, 11, 7, 3, "roto"),
+        )
+        self.assertEqual((row.monto, row.ingreso_afectado), (Decimal("-5.50"), Decimal("4.00")))
+
+    def test_payments_are_listed_under_the_first_sale(self):
+        now = timezone.now()
+        credito = models.Creditos(id=5, cliente_id=3)
+        pagos = [
+            models.PagosCredito(id=1, credito=credito, fecha=now, monto=Decimal("10")),
+            models.PagosCredito(id=2, credito_id=6, fecha=now, monto=Decimal("5")),
+        ]
+        with mock.patch.object(movimientos, "first_sales", return_value={5: 40}) as first:
+            rows = movimientos.payment_rows(pagos, {5: credito, 6: models.Creditos(id=6)})
+        self.assertEqual(set(first.call_args[0][0]), {5, 6})
+        self.assertEqual(
+            [(r.tipo, r.origen_id, r.venta_id, r.cliente_id, r.monto) for r in rows],
+            [(movimientos.ABONO, 1, 40, 3, Decimal("10")), (movimientos.ABONO, 2, None, None, Decimal("5"))],
+        )
+
+    def test_rows_without_sale_have_no_number(self):
+        mov = models.Movimientos(
+            origen_id=9, fecha=timezone.now(), tipo=movimientos.DEVOLUCION, venta=None,
+            monto=Decimal("-3.00"), ingreso_afectado=Decimal("0"),
+        )
+        data = historial.row(mov)
+        self.assertEqual((data["venta_id"], data["venta_numero"]), (None, None))
+
+    def test_deleting_sale_rebuilds_its_credit_payments(self):
+        fecha = timezone.now()
+        pago_fecha = fecha + timedelta(days=3)
+        venta = models.Ventas(id=7, cliente_id=3, fecha=fecha)
+        with mock.patch.object(views, "transaction"), mock.patch.object(
+            models.Devoluciones, "objects"
+        ) as devoluciones, mock.patch.object(models.PagosCredito, "objects") as pagos, mock.patch.object(
+            views.VentasViewSet, "_product_ids", return_value=[1]
+        ), mock.patch.object(venta, "delete"), mock.patch.object(
+            customers, "refresh_stats"
+        ), mock.patch.object(rollup, "rebuild_days") as rollup_days, mock.patch.object(
+            product_sales, "rebuild_months"
+        ), mock.patch.object(movimientos, "rebuild_days") as mov_days:
+            devoluciones.filter.return_value.values_list.return_value = []
+            pagos.filter.return_value.distinct.return_value.values_list.return_value = [pago_fecha]
+            views.VentasViewSet().perform_destroy(venta)
+        pagos.filter.assert_called_once_with(credito__historial__venta_id=7)
+        rollup_days.assert_called_once_with([fecha])
+        mov_days.assert_called_once_with([fecha, pago_fecha])
+
+    def test_refunds_cannot_be_edited_or_deleted(self):
+        view = views.DevolucionesViewSet.as_view({"patch": "partial_update", "delete": "destroy"})
+        factory = APIRequestFactory()
+        for request in (factory.patch("/devoluciones/1/", {"cantidad": 1}), factory.delete("/devoluciones/1/")):
+            self.assertEqual(view(request, pk=1).status_code, 405)
+
+    def test_rebuild_days_upserts_without_table_lock(self):
+        with mock.patch.object(movimientos, "connection") as conn:
+            movimientos.rebuild_days([timezone.now(), None])
+        calls = conn.cursor.return_value.__enter__.return_value.execute.call_args_list
+        self.assertEqual(len(calls), 2)
+        self.assertTrue(calls[0].args[0].startswith("DELETE FROM movimientos"))
+        self.assertIn("ON CONFLICT (tipo, origen_id) DO UPDATE", calls[1].args[0])
+
+
+@override_settings(TX_MAX_RETRIES=2, TX_RETRY_BASE_MS=1, TX_LOCK_TIMEOUT_MS=0)
+class TestTransactionRetry(SimpleTestCase):
+    def setUp(self):
+        locking.reset()
+        self.addCleanup(locking.reset)
+        for target, attr in ((locking, "transaction"), (locking, "connection"), (locking.time, "sleep")):
+            patcher = mock.patch.object(target, attr)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        locking.connection.in_atomic_block = False
+
+    def test_retries_deadlock_then_succeeds(self):
+        fn = mock.Mock(side_effect=[_db_error("40P01"), "ok"])
+        self.assertEqual(locking.run_atomic("pos_checkout", fn), "ok")
+        self.assertEqual(fn.call_count, 2)
+        stats = locking.snapshot()["pos_checkout"]
+        self.assertEqual(stats["deadlocks"], 1)
+        self.assertEqual(stats["retries"], 1)
+        self.assertEqual(stats["transactions"], 1)
+
+    def test_gives_up_with_conflict(self):
+        fn = mock.Mock(side_effect=_db_error("40001"))
+        with self.assertRaises(locking.TransactionConflict):
+            locking.run_atomic("pagos_credito", fn)
+        self.assertEqual(fn.call_count, 3)
+        stats = locking.snapshot()["pagos_credito"]
+        self.assertEqual(stats["serialization_failures"], 3)
+        self.assertEqual(stats["conflicts"], 1)
+
+    def test_other_errors_are_not_retried(self):
+        fn = mock.Mock(side_effect=_db_error("23505"))
+        with self.assertRaises(OperationalError):
+            locking.run_atomic("pos_checkout", fn)
+        self.assertEqual(fn.call_count, 1)
+
+    def test_nested_transaction_runs_once(self):
+        locking.connection.in_atomic_block = True
+        fn = mock.Mock(side_effect=_db_error("40P01"))
+        with self.assertRaises(OperationalError):
+            locking.run_atomic("pos_checkout", fn)
+        self.assertEqual(fn.call_count, 1)
+
+    def test_lock_order_follows_tables(self):
+        calls = []
+
+        def _manager(model):
+            qs = mock.MagicMock()
+            qs.select_for_update.return_value.filter.return_value.order_by.side_effect = (
+                lambda *_: calls.append(model) or []
+            )
+            return qs
+
+        models_ = (models.Clientes, models.Creditos, models.Ventas)
+        with mock.patch.object(locking.timing, "record"):
+            with mock.patch.multiple(
+                models.Clientes, objects=_manager(models.Clientes)
+            ), mock.patch.multiple(
+                models.Creditos, objects=_manager(models.Creditos)
+            ), mock.patch.multiple(models.Ventas, objects=_manager(models.Ventas)):
+                locking.lock_rows("x", [(model, [1]) for model in models_])
+        self.assertEqual(calls, [models.Ventas, models.Creditos, models.Clientes])
+
+    def test_locked_models_are_in_lock_order(self):
+        for model in (models.Ventas, models.DetalleVenta, models.Creditos, models.Clientes):
+            self.assertIn(model._meta.db_table, locking.LOCK_ORDER)
+
+
+class TestDailyRollup(SimpleTestCase):
+    def test_lines_go_to_day_condition_and_channel(self):
+        fecha = timezone.make_aware(datetime(2024, 3, 5, 23, 30))
+        lines = [
+            models.DetalleVenta(
+                venta_id=1, cantidad=Decimal("2"), subtotal=Decimal("20.00"),
+                producto_costo_snapshot=Decimal("6.555"), fecha_venta=fecha,
+            ),
+            models.DetalleVenta(
+                venta_id=2, cantidad=Decimal("1"), subtotal=Decimal("8.00"),
+                producto_condicion_snapshot=" Used ", fecha_venta=fecha,
+            ),
+        ]
+        deltas = rollup.new_deltas()
+        rollup.add_lines(deltas, lines, credit_venta_ids={2})
+        day = timezone.localdate(fecha)
+        cash = deltas[(day, "new", "contado")]
+        self.assertEqual(cash["ventas_total"], Decimal("20.00"))
+        self.assertEqual(cash["ingreso"], Decimal("20.00"))
+        self.assertEqual(cash["costo_total"], Decimal("13.11"))
+        credit = deltas[(day, "used", "credito")]
+        self.assertEqual(credit["ventas_total"], Decimal("8.00"))
+        self.assertEqual(credit["ingreso"], Decimal("0"))
+
+    def test_line_splits_by_sale(self):
+        rows = [
+            models.DetalleVenta(venta_id=1, subtotal=Decimal("5.00")),
+            models.DetalleVenta(venta_id=1, subtotal=Decimal("2.00"), producto_condicion_snapshot="used"),
+            models.DetalleVenta(venta_id=2, subtotal=Decimal("1.00"), producto_condicion_snapshot="NEW"),
+        ]
+        self.assertEqual(
+            rollup.line_splits(rows),
+            {1: (Decimal("5.00"), Decimal("2.00")), 2: (Decimal("1.00"), Decimal("0"))},
+        )
+
+    def test_payment_split_keeps_every_cent(self):
+        self.assertEqual(
+            rollup.split_payment(Decimal("10.00"), (Decimal("1"), Decimal("3"))),
+            (Decimal("6.67"), Decimal("3.33")),
+        )
+        self.assertEqual(
+            rollup.split_payment(Decimal("5.00"), None), (Decimal("5.00"), Decimal("0"))
+        )
+
+    def test_payments_keep_the_split_of_their_write(self):
+        credito = models.Creditos(id=3, monto_nuevo=Decimal("10.00"), monto_usado=Decimal("30.00"))
+        pago = models.PagosCredito(credito_id=3, fecha=timezone.now(), monto=Decimal("8.00"))
+        rollup.assign_splits([pago], rollup.credit_splits([credito]))
+        self.assertEqual(pago.monto_usado, Decimal("6.00"))
+        # A later refund of the used items does not move the stored share.
+        credito.monto_usado = Decimal("0")
+        deltas = rollup.new_deltas()
+        rollup.add_payments(deltas, [pago])
+        day = timezone.localdate(pago.fecha)
+        self.assertEqual(deltas[(day, "new", "credito")]["ingreso"], Decimal("2.00"))
+        self.assertEqual(deltas[(day, "used", "credito")]["ingreso"], Decimal("6.00"))
+
+    def test_refunds_subtract_with_sign(self):
+        dev = models.Devoluciones(
+            fecha=timezone.now(), total=Decimal("4.00"), ingreso_afectado=Decimal("1.50")
+        )
+        deltas = rollup.new_deltas()
+        rollup.add_refunds(deltas, [dev], credit=True)
+        row = deltas[(timezone.localdate(dev.fecha), "new", "credito")]
+        self.assertEqual(row["devoluciones_total"], Decimal("4.00"))
+        self.assertEqual(row["ingreso_revertido"], Decimal("1.50"))
+
+    def test_apply_upserts_nonzero_rows_in_key_order(self):
+        day = timezone.localdate()
+        deltas = rollup.new_deltas()
+        deltas[(day, "used", "contado")]["ingreso"] += Decimal("1")
+        deltas[(day, "new", "contado")]["ingreso"] += Decimal("2")
+        deltas[(day, "new", "credito")]
+        with mock.patch.object(rollup, "connection") as conn, mock.patch.object(
+            rollup.dashboard, "invalidate"
+        ) as invalidate, mock.patch.object(rollup, "invalidate_closed"):
+            rollup.apply(deltas, timezone.now())
+        invalidate.assert_called_once_with()
+        sql, params = conn.cursor.return_value.__enter__.return_value.execute.call_args[0]
+        self.assertIn("ON CONFLICT (dia, condicion, canal)", sql)
+        row_size = 3 + len(rollup.FIELDS) + 1
+        self.assertEqual(len(params), 2 * row_size)
+        self.assertEqual(params[1:3], ["new", "contado"])
+        self.assertEqual(params[row_size + 1 : row_size + 3], ["used", "contado"])
+
+    def test_rebuild_days_locks_the_day_keys_not_the_table(self):
+        d1 = timezone.make_aware(datetime(2024, 3, 6, 12, 0))
+        d2 = timezone.make_aware(datetime(2024, 3, 5, 12, 0))
+        with mock.patch.object(rollup, "connection") as conn, mock.patch.object(
+            rollup.dashboard, "invalidate"
+        ), mock.patch.object(rollup, "invalidate_closed"):
+            rollup.rebuild_days([d1, d2, d1])
+        calls = conn.cursor.return_value.__enter__.return_value.execute.call_args_list
+        self.assertFalse(any("LOCK TABLE" in c.args[0] for c in calls))
+        sql, params = calls[0].args
+        self.assertIn("DO UPDATE SET updated_at = r.updated_at", sql)
+        keys = [tuple(params[i : i + 3]) for i in range(0, len(params), 4)]
+        self.assertEqual(keys, sorted(keys))
+        self.assertEqual(len(keys), 8)
+        self.assertEqual(len(calls), 1 + 2 * 2)
+
+
+class TestProductSales(SimpleTestCase):
+    def test_lines_and_refunds_share_the_month_row(self):
+        fecha = timezone.make_aware(datetime(2024, 3, 5, 12, 0))
+        deltas = product_sales.new_deltas()
+        product_sales.add_lines(
+            deltas,
+            [
+                models.DetalleVenta(
+                    producto_id=7, cantidad=Decimal("3"), subtotal=Decimal("30.00"),
+                    producto_nombre_snapshot="Cable", fecha_venta=fecha,
+                ),
+                models.DetalleVenta(
+                    producto_id=7, cantidad=Decimal("1"), subtotal=Decimal("4.00"),
+                    producto_condicion_snapshot="used", fecha_venta=fecha,
+                ),
+            ],
+        )
+        product_sales.add_refunds(
+            deltas,
+            [
+                models.Devoluciones(
+                    producto_id=7, cantidad=Decimal("1"), total=Decimal("10.00"),
+                    fecha=fecha + timedelta(days=2),
+                )
+            ],
+        )
+        row = deltas[("new", date(2024, 3, 1), 7)]
+        self.assertEqual(row["unidades"], Decimal("3"))
+        self.assertEqual(row["ingreso"], Decimal("30.00"))
+        self.assertEqual(row["unidades_devueltas"], Decimal("1"))
+        self.assertEqual(row["devoluciones_total"], Decimal("10.00"))
+        self.assertEqual(row["nombre"], "Cable")
+        self.assertEqual(deltas[("used", date(2024, 3, 1), 7)]["unidades"], Decimal("1"))
+
+    def test_apply_upserts_in_index_order(self):
+        deltas = product_sales.new_deltas()
+        deltas[("used", date(2024, 1, 1), 3)]["unidades"] += Decimal("1")
+        deltas[("new", date(2024, 2, 1), 9)]["ingreso"] += Decimal("2")
+        deltas[("new", date(2024, 1, 1), 5)]
+        with mock.patch.object(product_sales, "connection") as conn:
+            product_sales.apply(deltas, timezone.now())
+        sql, params = conn.cursor.return_value.__enter__.return_value.execute.call_args[0]
+        self.assertIn("ON CONFLICT (condicion, mes, producto_id)", sql)
+        row_size = 4 + len(product_sales.FIELDS) + 1
+        self.assertEqual(len(params), 2 * row_size)
+        self.assertEqual(params[:3], ["new", date(2024, 2, 1), 9])
+        self.assertEqual(params[row_size : row_size + 3], ["used", date(2024, 1, 1), 3])
+
+    def test_rebuild_months_only_touches_the_given_products(self):
+        fechas = [timezone.make_aware(datetime(2024, m, 5, 12, 0)) for m in (2, 1)]
+        with mock.patch.object(product_sales, "connection") as conn:
+            product_sales.rebuild_months(fechas, [9, None, 9])
+        calls = conn.cursor.return_value.__enter__.return_value.execute.call_args_list
+        self.assertFalse(any("LOCK TABLE" in c.args[0] for c in calls))
+        params = calls[0].args[1]
+        keys = [tuple(params[i : i + 3]) for i in range(0, len(params), 4)]
+        self.assertEqual(keys, sorted(keys))
+        self.assertEqual(keys[:2], [("new", date(2024, 1, 1), 0), ("new", date(2024, 1, 1), 9)])
+        self.assertEqual(len(keys), 8)
+        self.assertEqual(calls[1].args[1]["productos"], [0, 9])
+
+    def test_velocity_stops_counting_days_at_today(self):
+        row = {
+            "producto_id": 7, "nombre": "Cable", "unidades": Decimal("25"),
+            "unidades_devueltas": Decimal("5"), "ingreso": Decimal("250.00"),
+            "devoluciones_total": Decimal("50.00"),
+        }
+        with mock.patch.object(models.VentasProductoMensual, "objects") as objects:
+            objects.filter.return_value.values.return_value.annotate.return_value.order_by.return_value = [row]
+            result = product_sales.velocity(
+                date(2024, 3, 1), date(2024, 3, 31), ("new",), today=date(2024, 3, 10)
+            )
+        self.assertEqual((result["hasta"], result["dias"]), ("2024-03-10", 10))
+        self.assertEqual(result["productos"][0]["unidades_por_dia"], Decimal("2.000"))
+
+
+@override_settings(CACHES={"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}})
+class TestClosedDayIncome(SimpleTestCase):
+    def setUp(self):
+        cache.clear()
+        patcher = mock.patch.object(rollup, "_income", return_value=Decimal("5"))
+        self.live = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_closed_days_cached_today_live(self):
+        today = date(2024, 3, 20)
+        self.assertEqual(rollup.income(date(2024, 3, 1), today, today), Decimal("10"))
+        self.assertEqual(rollup.income(date(2024, 3, 1), today, today), Decimal("10"))
+        # One closed-range query, then only today on every call.
+        self.assertEqual(self.live.call_count, 3)
+        dashboard.bump_cache_version(rollup.CLOSED_VERSION_KEY)
+        rollup.income(date(2024, 3, 1), today, today)
+        self.assertEqual(self.live.call_count, 5)
+
+    def test_past_range_skips_today(self):
+        today = date(2024, 3, 20)
+        self.assertEqual(rollup.income(None, date(2024, 2, 29), today), Decimal("5"))
+        self.assertEqual(rollup.income(today, None, today), Decimal("5"))
+        self.assertEqual(self.live.call_count, 2)
+
+    def test_back_dated_writes_invalidate(self):
+        today = timezone.localdate()
+        with mock.patch.object(rollup.transaction, "on_commit") as on_commit:
+            for first_day in (today, today - timedelta(days=1), None):
+                rollup.invalidate_closed(first_day)
+        callbacks = [c.args[0] for c in on_commit.call_args_list]
+        with mock.patch.object(dashboard, "bump_cache_version") as bump:
+            callbacks[0]()
+            bump.assert_not_called()
+            callbacks[1]()
+            callbacks[2]()
+        self.assertEqual(bump.call_count, 2)
+
+    def test_write_to_today_committed_after_midnight_invalidates(self):
+        today = timezone.localdate()
+        with mock.patch.object(rollup.transaction, "on_commit") as on_commit:
+            rollup.invalidate_closed(today)
+        tomorrow = today + timedelta(days=1)
+        with mock.patch.object(rollup.timezone, "localdate", return_value=tomorrow), mock.patch.object(
+            dashboard, "bump_cache_version"
+        ) as bump:
+            on_commit.call_args.args[0]()
+        bump.assert_called_once_with(rollup.CLOSED_VERSION_KEY)
+
+
+class TestDashboardEngine(SimpleTestCase):
+    def _frame(self, rows):
+        return pd.DataFrame.from_records(
+            [
+                (dia, cond, Decimal(v), Decimal(vt), Decimal(c), Decimal(d))
+                for dia, cond, v, vt, c, d in rows
+            ],
+            columns=dashboard.ROLLUP_COLUMNS,
+        )
+
+    def test_periods_from_one_frame(self):
+        today = date(2024, 3, 20)
+        frame = self._frame(
+            [
+                (date(2024, 3, 20), "new", "10", "12", "5", "0"),
+                (date(2024, 3, 20), "used", "4", "4", "1", "0"),
+                (date(2024, 3, 2), "new", "7", "7", "3", "2"),
+                (date(2023, 12, 31), "new", "100", "100", "60", "0"),
+            ]
+        )
+        stats, chart = dashboard.sales_chart(frame, "all", today)
+        self.assertEqual(stats["ventas_hoy"], Decimal("14"))
+        self.assertEqual(stats["devoluciones_mensuales"], Decimal("2"))
+        self.assertEqual(len(chart["diario"]), 7)
+        self.assertEqual(chart["diario"][-1]["ventas"], Decimal("14"))
+        # Profit on "all" only counts new items.
+        self.assertEqual(chart["diario"][-1]["utilidad"], Decimal("7"))
+        self.assertEqual(chart["diario"][0]["ventas"], Decimal("0"))
+        self.assertEqual([q["ventas"] for q in chart["quincenal"]], [Decimal("7"), Decimal("14")])
+        self.assertEqual(chart["quincenal"][1]["periodo"], "16-31")
+        self.assertEqual([m["periodo"] for m in chart["mensual"]], ["Mar"])
+        self.assertEqual([t["periodo"] for t in chart["todos"]], [2023, 2024])
+        self.assertEqual(chart["todos"][1]["ventas"], Decimal("21"))
+
+    def test_section_profit_uses_its_condition(self):
+        frame = self._frame([(date(2024, 3, 20), "used", "4", "4", "1", "0")])
+        _, chart = dashboard.sales_chart(frame, "used", date(2024, 3, 20))
+        self.assertEqual(chart["diario"][-1]["utilidad"], Decimal("3"))
+
+    def test_chart_period_matches_combined(self):
+        today = date(2024, 3, 20)
+        frame = self._frame(
+            [
+                (date(2024, 3, 18), "new", "10", "12", "5", "0"),
+                (date(2024, 3, 2), "used", "7", "7", "3", "2"),
+                (date(2023, 12, 31), "new", "100", "100", "60", "0"),
+            ]
+        )
+        stats, chart = dashboard.sales_chart(frame, "all", today)
+        prepared = dashboard._prepare(frame, "all")
+        for period in dashboard.PERIODS:
+            self.assertEqual(dashboard.chart_series(prepared, period, today), chart[period])
+        self.assertEqual(dashboard.sales_stats(prepared, today), stats)
+        self.assertEqual(dashboard.period_start("quincenal", today), date(2024, 3, 1))
+        self.assertIsNone(dashboard.period_start("todos", today))
+
+    def test_empty_rollup(self):
+        stats, chart = dashboard.sales_chart(self._frame([]), "all", date(2024, 1, 1))
+        self.assertEqual(stats["ventas_hoy"], Decimal("0"))
+        self.assertEqual(chart["mensual"], [])
+        self.assertEqual(chart["todos"], [])
+        self.assertEqual(chart["quincenal"][0]["ventas"], Decimal("0"))
+
+
+@override_settings(
+    CACHES={"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}},
+    DASHBOARD_CACHE_TTL=60,
+)
+class TestDashboardCache(SimpleTestCase):
+    def setUp(self):
+        cache.clear()
+        dashboard.reset_cache_stats()
+        self.addCleanup(dashboard.reset_cache_stats)
+        self.build = mock.Mock(side_effect=lambda s, d: {"section": s})
+        self.chart = mock.Mock(side_effect=lambda s, d, period: {"period": period})
+        patcher = mock.patch.dict(
+            dashboard.BUILDERS, {"dashboard": self.build, "chart": self.chart}
+        )
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_hit_until_version_bump(self):
+        today = date(2024, 3, 20)
+        self.assertEqual(dashboard.cached_build("new", today), ({"section": "new"}, False))
+        self.assertEqual(dashboard.cached_build("new", today)[1], True)
+        dashboard.bump_sales_version()
+        self.assertEqual(dashboard.cached_build("new", today)[1], False)
+        self.assertEqual(self.build.call_count, 2)
+        self.assertEqual(dashboard.cache_stats()["dashboard"]["new"], {"hits": 1, "misses": 2})
+
+    def test_new_day_misses(self):
+        dashboard.cached_build("all", date(2024, 3, 20))
+        self.assertFalse(dashboard.cached_build("all", date(2024, 3, 21))[1])
+
+    def test_parts_cache_separately(self):
+        today = date(2024, 3, 20)
+        dashboard.cached_build("all", today)
+        self.assertEqual(dashboard.cached("chart", "all", today, period="mensual"), ({"period": "mensual"}, False))
+        self.assertTrue(dashboard.cached("chart", "all", today, period="mensual")[1])
+        self.assertFalse(dashboard.cached("chart", "all", today, period="diario")[1])
+        self.assertEqual(self.build.call_count, 1)
+        self.assertEqual(dashboard.cache_stats()["chart"]["all"], {"hits": 1, "misses": 2})
+
+
+@skipUnless(
+    connection.vendor == "postgresql" and os.getenv("BENCH_DASHBOARD"),
+    "requiere PostgreSQL y BENCH_DASHBOARD=1",
+)
+@override_settings(CACHES={"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}})
+class TestDashboardBudget(TestCase):
+    """Query and p95 ceilings for every dashboard part on years of seeded
+    history. Size with BENCH_DASHBOARD_YEARS / BENCH_DASHBOARD_SALES_PER_DAY."""
+
+    @classmethod
+    def setUpTestData(cls):
+        bench_dashboard.seed_history(
+            int(os.getenv("BENCH_DASHBOARD_YEARS", "2")),
+            int(os.getenv("BENCH_DASHBOARD_SALES_PER_DAY", "60")),
+            seed=1234,
+        )
+
+    def test_within_budget(self):
+        report = bench_dashboard.measure(runs=int(os.getenv("BENCH_DASHBOARD_RUNS", "10")))
+        self.assertEqual(set(report["dashboard"]), set(dashboard.SECTIONS))
+        self.assertEqual(
+            bench_dashboard.violations(report, settings.DASHBOARD_P95_BUDGET_MS), []
+        )
+
+
+class TestBenchDashboard(SimpleTestCase):
+    def test_violations_flag_queries_and_latency(self):
+        stats = {
+            "cold": {"queries": bench_dashboard.QUERY_BUDGETS["dashboard"] + 1, "p50": 5, "p95": 50},
+            "warm": {"queries": 0, "p50": 1, "p95": 2},
+        }
+        found = bench_dashboard.violations({"dashboard": {"all": stats}}, p95_ms=40)
+        self.assertEqual(len(found), 2)
+        self.assertTrue(found[0].startswith("dashboard/all: 7 consultas"))
+        stats["cold"].update(queries=1, p95=10)
+        self.assertEqual(bench_dashboard.violations({"chart": {"new": stats}}, p95_ms=40), [])
+
+
+class TestBenchCart(SimpleTestCase):
+    def test_cart_total_matches_server_pricing(self):
+        catalog = [{"id": i, "precio": Decimal("1.35") * i, "status": "active"} for i in range(1, 40)]
+        products = {row["id"]: row for row in catalog}
+        rng = random.Random(7)
+        for _ in range(20):
+            sale = checkout.parse_sale(build_cart(rng, catalog), timezone.now())
+            priced = checkout.price_sale(sale, products, set(), False)
+            self.assertEqual(priced["total"], sale["client_total"])
+
+
+class TestCustomerStats(SimpleTestCase):
+    def test_record_purchases_groups_by_customer(self):
+        d1 = timezone.now()
+        d2 = d1 + timedelta(minutes=5)
+        sales = [
+            {"customer_id": 7, "fecha": d2},
+            {"customer_id": None, "fecha": d1},
+            {"customer_id": 3, "fecha": d1},
+            {"customer_id": 7, "fecha": d1},
+        ]
+        with mock.patch.object(models.Clientes.objects, "filter") as flt:
+            customers.record_purchases(sales)
+        self.assertEqual([c.kwargs for c in flt.call_args_list], [{"id": 3}, {"id": 7}])
+        update = flt.return_value.update.call_args_list[1].kwargs
+        self.assertEqual(update["compras_count"].rhs.value, 2)
+        self.assertEqual(update["fecha_ultima_compra"].source_expressions[1].value, d2)
+
+    def test_refresh_stats_skips_voided_sales(self):
+        with mock.patch.object(customers, "connection") as conn:
+            cursor = conn.cursor.return_value.__enter__.return_value
+            cursor.rowcount = 2
+            self.assertEqual(customers.refresh_stats([5, None, 2, 5]), 2)
+        sql, params = cursor.execute.call_args.args
+        self.assertEqual(params, {"anulada": "anulada", "ids": [2, 5]})
+        self.assertIn("FILTER (WHERE lower(v.estado) <> %(anulada)s) AS n", sql)
+        self.assertIn("LEFT JOIN ventas v ON v.cliente_id = cl.id\n", sql)
+
+
+class TestCreditAccounts(SimpleTestCase):
+    def test_apply_charge_updates_balances_in_place(self):
+        now = timezone.now()
+        account = models.Creditos(
+            cliente_id=1,
+            cuenta=True,
+            total_deuda=Decimal("10.00"),
+            pagado=Decimal("10.00"),
+            saldo=Decimal("0.00"),
+            estado="pagado",
+        )
+        credits.apply_charge(account, Decimal("25.00"), Decimal("5.00"), now, now)
+        self.assertEqual(account.total_deuda, Decimal("35.00"))
+        self.assertEqual(account.pagado, Decimal("15.00"))
+        self.assertEqual(account.saldo, Decimal("20.00"))
+        self.assertEqual(account.pagos_total, Decimal("5.00"))
+        self.assertEqual(account.estado, "pendiente")
+        self.assertEqual(account.fecha_ultima_compra, now)
+
+        credits.apply_charge(account, Decimal("1.00"), Decimal("1.00"), now - timedelta(days=1), now)
+        self.assertEqual(account.fecha_ultima_compra, now)
+
+    def test_apply_charge_accumulates_condition_split(self):
+        now = timezone.now()
+        account = models.Creditos(cliente_id=1, cuenta=True)
+        credits.apply_charge(account, Decimal("30.00"), Decimal("0"), now, now)
+        credits.apply_charge(
+            account, Decimal("10.00"), Decimal("0"), now, now, (Decimal("4.00"), Decimal("6.00"))
+        )
+        self.assertEqual(account.monto_nuevo, Decimal("34.00"))
+        self.assertEqual(account.monto_usado, Decimal("6.00"))
+        self.assertEqual(
+            rollup.credit_splits([account]), {account.id: (Decimal("6.00"), Decimal("40.00"))}
+        )
+
+    def test_apply_payment_can_be_taken_back(self):
+        now = timezone.now()
+        credito = models.Creditos(
+            total_deuda=Decimal("20.00"), pagado=Decimal("5.00"), saldo=Decimal("15.00")
+        )
+        credits.apply_payment(credito, Decimal("15.00"), now)
+        self.assertEqual(
+            (credito.pagado, credito.saldo, credito.estado), (Decimal("20.00"), Decimal("0.00"), "pagado")
+        )
+        credits.apply_payment(credito, Decimal("-15.00"), now)
+        self.assertEqual(
+            (credito.pagado, credito.saldo, credito.estado), (Decimal("5.00"), Decimal("15.00"), "pendiente")
+        )
+        self.assertEqual(credito.pagos_total, Decimal("0.00"))
+
+    def test_deleting_payment_restores_balance(self):
+        fecha = timezone.now()
+        pago = models.PagosCredito(id=4, credito_id=2, monto=Decimal("6.00"), fecha=fecha)
+        credito = models.Creditos(
+            id=2, pagado=Decimal("6.00"), saldo=Decimal("0.00"), pagos_total=Decimal("6.00")
+        )
+        with mock.patch.object(models.PagosCredito, "objects") as objects, mock.patch.object(
+            locking, "lock_rows", return_value={models.Creditos: {2: credito}}
+        ), mock.patch.object(credito, "save"), mock.patch.object(
+            rollup, "rebuild_days"
+        ) as rollup_days, mock.patch.object(movimientos, "rebuild_days"):
+            objects.get.return_value = pago
+            views.PagosCreditoViewSet()._destroy_locked(4)
+        objects.filter.assert_called_once_with(id=4)
+        self.assertEqual(
+            (credito.pagado, credito.saldo, credito.estado), (Decimal("0.00"), Decimal("6.00"), "pendiente")
+        )
+        rollup_days.assert_called_once_with([fecha])
+
+    def test_charge_accounts_keeps_sale_notes(self):
+        now = timezone.now()
+        account = models.Creditos(cliente_id=1, cuenta=True, observaciones="Cliente frecuente")
+        sales = [
+            (
+                {"customer_id": 1, "total": Decimal(total), "paid": Decimal("0"), "observaciones": nota},
+                models.Ventas(fecha=now),
+            )
+            for total, nota in (("5.00", "Entregar lunes"), ("3.00", None))
+        ]
+        with mock.patch.object(credits, "open_accounts", return_value={1: account}), mock.patch.object(
+            account, "save"
+        ) as save:
+            self.assertEqual(credits.charge_accounts(sales, now), [account, account])
+        self.assertEqual(account.observaciones, "Cliente frecuente\nEntregar lunes")
+        self.assertIn("observaciones", save.call_args.kwargs["update_fields"])
+
+
+class TestRefundWrites(SimpleTestCase):
+    def _info(self, detalle_id, qty):
+        detalle = models.DetalleVenta(
+            id=detalle_id,
+            producto_id=4,
+            precio_unitario=Decimal("2.50"),
+            producto_nombre_snapshot="Cable",
+        )
+        return {
+            "detalle": detalle,
+            "qty": Decimal(qty),
+            "motivo": None,
+            "total": Decimal(qty) * detalle.precio_unitario,
+            "ingreso": Decimal("0"),
+        }
+
+    def test_increment_devuelto_sums_duplicate_lines(self):
+        now = timezone.now()
+        allocated = [self._info(9, "1"), self._info(3, "2"), self._info(9, "2")]
+        with mock.patch.object(refunds, "connection") as connection:
+            refunds.increment_devuelto(allocated, now)
+        cursor = connection.cursor.return_value.__enter__.return_value
+        sql, params = cursor.execute.call_args.args
+        self.assertEqual(sql.count("(%s::bigint, %s::numeric)"), 2)
+        self.assertEqual(params, [now, 3, Decimal("2"), 9, Decimal("3")])
+
+    def test_refund_rows_prefer_line_snapshots(self):
+        rows = refunds.build_refund_rows(
+            1, [self._info(9, "1")], {4: {"codigo": "C-4", "nombre": "Otro"}}, timezone.now()
+        )
+        self.assertEqual(rows[0].producto_nombre_snapshot, "Cable")
+        self.assertEqual(rows[0].producto_codigo_snapshot, "C-4")
+
+
+class TestRefundAllocation(SimpleTestCase):
+    def setUp(self):
+        self.lines = {
+            1: models.DetalleVenta(id=1, cantidad=Decimal("2"), precio_unitario=Decimal("10.00")),
+            2: models.DetalleVenta(id=2, cantidad=Decimal("1"), precio_unitario=Decimal("5.00")),
+        }
+
+    def _price(self, items):
+        return refunds.price_lines(refunds.parse_items(items), self.lines)
+
+    def test_cash_sale_reverses_full_total(self):
+        processed, total = self._price([{"detalle_id": 1, "qty": 2}, {"detalle_id": 2, "qty": 1}])
+        income, allocated = refunds.allocate_income(processed, total, None)
+        self.assertEqual(total, Decimal("25.00"))
+        self.assertEqual(income, Decimal("25.00"))
+        self.assertEqual([a["ingreso"] for a in allocated], [Decimal("20.00"), Decimal("5.00")])
+
+    def test_credit_sale_reverses_only_paid_income(self):
+        processed, total = self._price([{"detalle_id": 1, "qty": 1}, {"detalle_id": 2, "qty": 1}])
+        credito = models.Creditos(pagos_total=Decimal("8.00"), ingreso_revertido=Decimal("2.00"))
+        income, allocated = refunds.allocate_income(processed, total, credito)
+        self.assertEqual(income, Decimal("6.00"))
+        self.assertEqual(sum(a["ingreso"] for a in allocated), Decimal("6.00"))
+
+    def test_account_income_is_shared_by_its_sales(self):
+        # Two sales on one account with 12.00 paid: the second refund only
+        # reverses what the first one left.
+        account = models.Creditos(cuenta=True, pagos_total=Decimal("12.00"))
+        for expected in (Decimal("12.00"), Decimal("0")):
+            processed, total = self._price([{"detalle_id": 1, "qty": 2}])
+            income, _ = refunds.allocate_income(processed, total, account)
+            self.assertEqual(income, expected)
+            account.ingreso_revertido += income
+
+    def test_repeated_line_cannot_exceed_available(self):
+        with self.assertRaises(refunds.RefundError) as ctx:
+            self._price([{"detalle_id": 2, "qty": 1}, {"detalle_id": "2", "qty": 1}])
+        self.assertEqual(ctx.exception.extra["disponible"], 0.0)
+
+    def test_foreign_line_is_not_found(self):
+        with self.assertRaises(refunds.RefundError) as ctx:
+            self._price([{"detalle_id": 99, "qty": 1}])
+        self.assertEqual(ctx.exception.status, 404)
+
+
+_LOCMEM = {"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}}
+requires_postgres = skipUnless(connection.vendor == "postgresql", "requiere PostgreSQL")
+
+
+class PosSalesMixin:
+    """Real sales written through ``pos/checkout`` (PostgreSQL only)."""
+
+    def setUp(self):
+        cache.clear()
+        numbering._BLOCKS.clear()
+        categoria = models.Categorias.objects.create(nombre="General")
+        self.producto = models.Productos.objects.create(
+            codigo="P1", nombre="Prod1", categoria=categoria, precio=Decimal("10.00"), status="active"
+        )
+        self.cliente = models.Clientes.objects.create(tipo_cliente="natural", nombre="Cliente")
+
+    def _sale(self, qty=3, **overrides):
+        total = 10 * qty
+        payload = {
+            "saleType": "DIRECT",
+            "paymentMethod": "CASH",
+            "customerId": None,
+            "items": [{"productId": self.producto.id, "qty": qty, "unit_price": 10}],
+            "totals": {"total": total},
+            "paidAmount": total,
+        }
+        payload.update(overrides)
+        return payload
+
+    def _credit_sale(self, qty=3, paid=10):
+        return self._sale(qty, saleType="CREDIT", customerId=self.cliente.id, paidAmount=paid)
+
+    def _checkout(self, payload):
+        response = self.client.post(reverse("pos-checkout"), payload, format="json")
+        self.assertEqual(response.status_code, 201, response.data)
+        return models.Ventas.objects.get(id=response.data["id"])
+
+    # Rows of the incrementally kept tables, ignoring ids, timestamps and
+    # all-zero counter rows (edits may leave those behind).
+    _MAINTAINED = (
+        (models.VentasResumenDiario, ("dia", "condicion", "canal", *rollup.FIELDS), 3),
+        (models.VentasProductoMensual, ("mes", "condicion", "producto_id", *product_sales.FIELDS), 3),
+        (
+            models.Movimientos,
+            ("fecha", "tipo", "origen_id", "venta_id", "cliente_id", "monto", "ingreso_afectado", "nota"),
+            0,
+        ),
+    )
+
+    def _maintained(self):
+        return {
+            model._meta.db_table: sorted(
+                row for row in model.objects.values_list(*fields) if not skip or any(row[skip:])
+            )
+            for model, fields, skip in self._MAINTAINED
+        }
+
+    def assertMaintained(self):
+        """The kept tables match a full rebuild from the source rows."""
+        kept = self._maintained()
+        rollup.rebuild()
+        product_sales.rebuild()
+        movimientos.rebuild()
+        self.assertEqual(kept, self._maintained())
+
+    def _refund_payload(self, venta, qty=1):
+        detalle = models.DetalleVenta.objects.get(venta=venta)
+        return {"venta_id": venta.id, "items": [{"detalle_id": detalle.id, "qty": qty, "motivo": "roto"}]}
+
+
+@requires_postgres
+@override_settings(CACHES=_LOCMEM)
+class TestRefundPreview(PosSalesMixin, APITestCase):
+    def _items(self, response):
+        return [(i["detalle_id"], i["cantidad"], i["total"]) for i in response.data["items"]]
+
+    def test_preview_matches_create_and_writes_nothing(self):
+        for venta in (self._checkout(self._sale()), self._checkout(self._credit_sale(paid=10))):
+            payload = self._refund_payload(venta)
+            with self.subTest(venta=venta.id):
+                preview = self.client.post(reverse("devoluciones-preview"), payload, format="json")
+                self.assertEqual(preview.status_code, 200, preview.data)
+                self.assertFalse(models.Devoluciones.objects.filter(venta=venta).exists())
+                venta.refresh_from_db()
+                self.assertEqual(venta.devuelto_total, Decimal("0"))
+
+                created = self.client.post(reverse("devoluciones-list"), payload, format="json")
+                self.assertEqual(created.status_code, 201, created.data)
+                self.assertEqual(
+                    (preview.data["total_refund"], preview.data["ingreso_afectado"]),
+                    (created.data["total_refund"], created.data["ingreso_afectado"]),
+                )
+                self.assertEqual(self._items(preview), self._items(created))
+
+
+@requires_postgres
+@override_settings(CACHES=_LOCMEM)
+class TestCrudKeepsSummaries(PosSalesMixin, APITestCase):
+    def test_line_edits(self):
+        venta = self._checkout(self._sale())
+        detalle = models.DetalleVenta.objects.get(venta=venta)
+        url = reverse("detalleventa-detail", args=[detalle.id])
+        response = self.client.patch(url, {"cantidad": 5, "subtotal": 50}, format="json")
+        self.assertEqual(response.status_code, 200, response.data)
+        self.assertEqual(
+            models.VentasProductoMensual.objects.get(producto_id=self.producto.id).unidades, 5
+        )
+        self.assertMaintained()
+        self.assertEqual(self.client.delete(url).status_code, 204)
+        self.assertFalse(models.VentasProductoMensual.objects.filter(unidades__gt=0).exists())
+        self.assertMaintained()
+
+    def test_charging_a_sale_to_a_credit(self):
+        credito_venta = self._checkout(self._credit_sale(paid=10))
+        credito = models.CreditosHistorialCompras.objects.get(venta=credito_venta).credito
+        venta = self._checkout(self._sale())
+        now = timezone.now()
+        response = self.client.post(
+            reverse("creditoshistorialcompras-list"),
+            {
+                "credito": credito.id,
+                "venta": venta.id,
+                "fecha": now,
+                "monto": 30,
+                "estado": "pendiente",
+                "created_at": now,
+                "updated_at": now,
+            },
+            format="json",
+        )
+        self.assertEqual(response.status_code, 201, response.data)
+        self.assertFalse(
+            models.Movimientos.objects.filter(tipo=movimientos.CONTADO, origen_id=venta.id).exists()
+        )
+        self.assertMaintained()
+        url = reverse("creditoshistorialcompras-detail", args=[response.data["id"]])
+        self.assertEqual(self.client.delete(url).status_code, 204)
+        self.assertTrue(
+            models.Movimientos.objects.filter(tipo=movimientos.CONTADO, origen_id=venta.id).exists()
+        )
+        self.assertMaintained()
+
+
+@requires_postgres
+@override_settings(CACHES=_LOCMEM)
+class TestWritePaths(PosSalesMixin, APITestCase):
+    def _day(self):
+        return models.VentasResumenDiario.objects.get(dia=timezone.localdate(), condicion="new", canal="contado")
+
+    def _units(self):
+        return models.VentasProductoMensual.objects.get(producto_id=self.producto.id)
+
+    def _credito(self, venta):
+        return models.CreditosHistorialCompras.objects.filter(venta=venta).earliest("id").credito
+
+    def test_cash_checkout(self):
+        venta = self._checkout(self._sale())
+        self.assertEqual((self._day().ventas_total, self._day().ingreso), (Decimal("30"), Decimal("30")))
+        self.assertEqual(self._units().unidades, 3)
+        self.assertTrue(
+            models.Movimientos.objects.filter(tipo=movimientos.CONTADO, origen_id=venta.id, monto=30).exists()
+        )
+        self.assertMaintained()
+
+    def test_credit_checkout(self):
+        venta = self._checkout(self._credit_sale(paid=10))
+        credito = self._credito(venta)
+        self.assertEqual((credito.total_deuda, credito.pagado, credito.saldo), (30, 10, 20))
+        self.assertEqual(self._units().unidades, 3)
+        self.assertMaintained()
+
+    def test_batch(self):
+        sales = [
+            self._sale(qty=2, idempotencyKey="lote-1"),
+            self._credit_sale(qty=3, paid=10) | {"idempotencyKey": "lote-2"},
+        ]
+        response = self.client.post(reverse("pos-checkout-batch"), {"sales": sales}, format="json")
+        self.assertEqual(response.status_code, 200, response.data)
+        self.assertEqual(response.data["created"], 2, response.data)
+        self.assertEqual(self._units().unidades, 5)
+        self.assertMaintained()
+
+        again = self.client.post(reverse("pos-checkout-batch"), {"sales": sales}, format="json")
+        self.assertEqual(again.data["replayed"], 2, again.data)
+        self.assertEqual(models.Ventas.objects.count(), 2)
+        self.assertMaintained()
+
+    def test_refund(self):
+        for venta in (self._checkout(self._sale()), self._checkout(self._credit_sale(paid=10))):
+            response = self.client.post(
+                reverse("devoluciones-list"), self._refund_payload(venta), format="json"
+            )
+            self.assertEqual(response.status_code, 201, response.data)
+            venta.refresh_from_db()
+            self.assertEqual(venta.devuelto_total, Decimal("10"))
+        self.assertEqual(self._units().unidades_devueltas, 2)
+        self.assertEqual(self._credito(venta).devuelto_total, Decimal("10"))
+        self.assertEqual(models.Movimientos.objects.filter(tipo=movimientos.DEVOLUCION).count(), 2)
+        self.assertMaintained()
+
+    def test_payment_create_and_edit(self):
+        credito = self._credito(self._checkout(self._credit_sale(paid=10)))
+        now = timezone.now()
+        response = self.client.post(
+            reverse("pagoscredito-list"),
+            {"credito": credito.id, "fecha": now, "monto": 5, "created_at": now, "updated_at": now},
+            format="json",
+        )
+        self.assertEqual(response.status_code, 201, response.data)
+        credito.refresh_from_db()
+        self.assertEqual((credito.pagado, credito.saldo), (15, 15))
+        self.assertMaintained()
 
+        ayer = now - timedelta(days=1)
+        url = reverse("pagoscredito-detail", args=[response.data["id"]])
+        response = self.client.patch(url, {"monto": 8, "fecha": ayer}, format="json")
+        self.assertEqual(response.status_code, 200, response.data)
+        credito.refresh_from_db()
+        self.assertEqual((credito.pagado, credito.saldo, credito.pagos_total), (18, 12, 18))
+        pago = models.Movimientos.objects.get(tipo=movimientos.ABONO, origen_id=response.data["id"])
+        self.assertEqual((pago.monto, pago.fecha), (Decimal("8"), ayer))
+        self.assertMaintained()
@@ -0,0 +1,96 @@
+from __future__ import annotations
+
+import math
+import threading
+import time
+from collections import deque
+from typing import Dict, List, Optional, Tuple
+
+from django.conf import settings
+
+
+# (endpoint, phase) -> recent durations in milliseconds
+_SAMPLES: Dict[Tuple[str, str], deque] = {}
+_LOCK = threading.Lock()
+
+
+class Timer:
+    """Per-request phase timer.
+
+    ``lap(name)`` closes the phase that started at the previous lap (or at
+    construction) so existing view code can be instrumented without
+    re-indenting it. ``finish`` adds the ``Server-Timing`` header and feeds
+    the rolling histograms exposed by ``snapshot``.
+    """
+
+    def __init__(self, endpoint: str):
+        self.endpoint = endpoint
+        self.phases: List[Tuple[str, float]] = []
+        self._start = self._last = time.perf_counter()
+
+    def lap(self, name: str) -> None:
+        current = time.perf_counter()
+        self.phases.append((name, (current - self._last) * 1000))
+        self._last = current
+
+    def total(self) -> float:
+        return (time.perf_counter() - self._start) * 1000
+
+    def header(self, total: Optional[float] = None) -> str:
+        total = self.total() if total is None else total
+        parts = [f"{name};dur={dur:.2f}" for name, dur in self.phases]
+        parts.append(f"total;dur={total:.2f}")
+        return ", ".join(parts)
+
+    def finish(self, response):
+        total = self.total()
+        response["Server-Timing"] = self.header(total)
+        record(self.endpoint, self.phases + [("total", total)])
+        return response
+
+
+class _NullTimer:
+    def lap(self, name: str) -> None:
+        pass
+
+
+NULL_TIMER = _NullTimer()
+
+
+def record(endpoint: str, phases) -> None:
+    window = settings.TIMING_WINDOW
+    with _LOCK:
+        for name, dur in phases:
+            samples = _SAMPLES.get((endpoint, name))
+            if samples is None:
+                samples = _SAMPLES[(endpoint, name)] = deque(maxlen=window)
+            samples.append(dur)
+
+
+def percentile(sorted_values: List[float], pct: float) -> float:
+    """Nearest-rank percentile of an already sorted list."""
+    if not sorted_values:
+        return 0.0
+    rank = max(math.ceil(pct / 100 * len(sorted_values)), 1)
+    return sorted_values[min(rank, len(sorted_values)) - 1]
+
+
+def snapshot() -> dict:
+    """p50/p95/p99 per endpoint and phase over the last ``TIMING_WINDOW`` requests."""
+    with _LOCK:
+        data = {key: sorted(samples) for key, samples in _SAMPLES.items()}
+    result: dict = {}
+    for (endpoint, name), values in data.items():
+        result.setdefault(endpoint, {})[name] = {
+            "count": len(values),
+            "p50": round(percentile(values, 50), 2),
+            "p95": round(percentile(values, 95), 2),
+            "p99": round(percentile(values, 99), 2),
+            "max": round(values[-1], 2) if values else 0.0,
+        }
+    return result
+
+
+def reset() -> None:
+    with _LOCK:
+        _SAMPLES.clear()
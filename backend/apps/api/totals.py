@@ -0,0 +1,108 @@
+from __future__ import annotations
+
+from typing import List
+
+from django.db import connection
+
+
+# Expected running totals recomputed from the base tables. A refund belongs to
+# the credit of the first historial row of its sale, as in
+# DevolucionesViewSet.create.
+_EXPECTED_VENTAS = """
+SELECT v.id,
+       COALESCE(d.total, 0) AS devuelto_total,
+       COALESCE(d.ingreso, 0) AS ingreso_revertido
+  FROM ventas v
+  LEFT JOIN (
+    SELECT venta_id, SUM(total) AS total, SUM(ingreso_afectado) AS ingreso
+      FROM devoluciones GROUP BY venta_id
+  ) d ON d.venta_id = v.id
+"""
+
+_EXPECTED_CREDITOS = """
+SELECT c.id,
+       COALESCE(p.monto, 0) AS pagos_total,
+       COALESCE(d.total, 0) AS devuelto_total,
+       COALESCE(d.ingreso, 0) AS ingreso_revertido,
+       COALESCE(s.monto_nuevo, 0) AS monto_nuevo,
+       COALESCE(s.monto_usado, 0) AS monto_usado
+  FROM creditos c
+  LEFT JOIN (
+    SELECT credito_id, SUM(monto) AS monto FROM pagos_credito GROUP BY credito_id
+  ) p ON p.credito_id = c.id
+  LEFT JOIN (
+    SELECT h.credito_id, SUM(dv.total) AS total, SUM(dv.ingreso_afectado) AS ingreso
+      FROM devoluciones dv
+      JOIN (
+        SELECT DISTINCT ON (venta_id) venta_id, credito_id
+          FROM creditos_historial_compras ORDER BY venta_id, id
+      ) h ON h.venta_id = dv.venta_id
+     GROUP BY h.credito_id
+  ) d ON d.credito_id = c.id
+  LEFT JOIN ({split}) s ON s.credito_id = c.id
+"""
+
+# Sold amount of each credit by condition (see rollup.condition_of), net of
+# refunds.
+CREDIT_SPLIT = """
+SELECT h.credito_id,
+       GREATEST(COALESCE(SUM(x.monto) FILTER (WHERE x.condicion <> 'used'), 0), 0) AS monto_nuevo,
+       GREATEST(COALESCE(SUM(x.monto) FILTER (WHERE x.condicion = 'used'), 0), 0) AS monto_usado
+  FROM (
+    SELECT venta_id, COALESCE(lower(trim(producto_condicion_snapshot)), '') AS condicion,
+           subtotal AS monto
+      FROM detalle_venta
+    UNION ALL
+    SELECT venta_id, COALESCE(lower(trim(producto_condicion_snapshot)), ''), -total
+      FROM devoluciones WHERE venta_id IS NOT NULL
+  ) x
+  JOIN (
+    SELECT DISTINCT ON (venta_id) venta_id, credito_id
+      FROM creditos_historial_compras ORDER BY venta_id, id
+  ) h ON h.venta_id = x.venta_id
+ GROUP BY h.credito_id
+"""
+
+COUNTERS = {
+    "ventas": (_EXPECTED_VENTAS, ("devuelto_total", "ingreso_revertido")),
+    "creditos": (
+        _EXPECTED_CREDITOS.format(split=CREDIT_SPLIT),
+        ("pagos_total", "devuelto_total", "ingreso_revertido", "monto_nuevo", "monto_usado"),
+    ),
+}
+
+
+def _mismatch(fields) -> str:
+    return " OR ".join(f"t.{f} <> e.{f}" for f in fields)
+
+
+def find_mismatches(table: str, limit: int = 100) -> List[dict]:
+    """Rows of ``table`` whose stored counters differ from the base tables."""
+    expected, fields = COUNTERS[table]
+    columns = ", ".join(f"t.{f}, e.{f}" for f in fields)
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"SELECT t.id, {columns} FROM {table} t JOIN ({expected}) e ON e.id = t.id "
+            f"WHERE {_mismatch(fields)} ORDER BY t.id LIMIT %s",
+            [limit],
+        )
+        rows = cursor.fetchall()
+    result = []
+    for row in rows:
+        item = {"id": row[0]}
+        for idx, field in enumerate(fields):
+            item[field] = {"guardado": row[1 + 2 * idx], "esperado": row[2 + 2 * idx]}
+        result.append(item)
+    return result
+
+
+def repair(table: str) -> int:
+    """Overwrite drifted counters of ``table`` with the recomputed values."""
+    expected, fields = COUNTERS[table]
+    assignments = ", ".join(f"{f} = e.{f}" for f in fields)
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"UPDATE {table} t SET {assignments} FROM ({expected}) e "
+            f"WHERE e.id = t.id AND ({_mismatch(fields)})"
+        )
+        return cursor.rowcount
@@ -17,12 +17,21 @@ router.register(r'usuarios', views.UsuariosViewSet, basename='usuarios')
 urlpatterns = [
     path('health/', views.health, name='health'),
     path('pos/checkout', views.pos_checkout, name='pos-checkout'),
+    path('pos/checkout/batch', views.pos_checkout_batch, name='pos-checkout-batch'),
+    path('pos/quote', views.pos_quote, name='pos-quote'),
+    path('documentos/gaps', views.documentos_gaps, name='documentos-gaps'),
+    path('metrics/timings', views.metrics_timings, name='metrics-timings'),
     path('pos/validate-code', views.ValidateOverrideCodeView.as_view(), name='pos-validate-code'),
     path('ventas-historial/', views.ventas_historial, name='ventas-historial'),
     path('historial-ventas/', views.historial_ventas, name='historial-ventas'),
     path('ventas/search/', views.ventas_search, name='ventas-search'),
     path('ventas-export/', views.ventas_export, name='ventas-export'),
     path('reportes/dashboard/', views.reportes_dashboard, name='reportes-dashboard'),
+    path('reportes/dashboard/stats/', views.reportes_dashboard_stats, name='reportes-dashboard-stats'),
+    path('reportes/dashboard/chart/', views.reportes_dashboard_chart, name='reportes-dashboard-chart'),
+    path('reportes/dashboard/top-products/', views.reportes_dashboard_top_products, name='reportes-dashboard-top-products'),
+    path('reportes/dashboard/recent/', views.reportes_dashboard_recent, name='reportes-dashboard-recent'),
+    path('reportes/productos/velocidad/', views.reportes_productos_velocidad, name='reportes-productos-velocidad'),
     path('reportes/export-inventario/', views.ReporteExportInventarioView.as_view(), name='reportes-export-inventario'),
     path('ventas-total/', views.ventas_total, name='ventas-total'),
     path('ventas/<int:pk>/items/', views.VentaItemsAPIView.as_view(), name='ventas-items'),
@@ -1,5 +1,5 @@
 from rest_framework import viewsets
-from rest_framework.decorators import api_view, parser_classes, action
+from rest_framework.decorators import api_view, parser_classes, permission_classes, action
 from rest_framework.generics import ListAPIView
 from rest_framework.parsers import JSONParser
 from rest_framework.response import Response
@@ -9,27 +9,20 @@ from django.http import JsonResponse, HttpResponse, FileResponse
 from django.db.models import (
     Q,
     F,
-    Max,
-    Min,
     Sum,
-    DecimalField,
-    ExpressionWrapper,
     Count,
     Exists,
     OuterRef,
-    Subquery,
     Case,
     When,
     Value,
     Prefetch,
     Func,
 )
-from django.contrib.postgres.aggregates import StringAgg
-from django.db.models.functions import Coalesce, TruncDay, TruncMonth, TruncYear, Lower
+from django.db.models.functions import Coalesce, Lower
 from django.db import models as dj_models
-from datetime import timedelta, date, datetime, time as dt_time
+from datetime import timedelta, date
 from collections import defaultdict
-import calendar
 from django.db import DataError, IntegrityError, transaction, connection
 from django.utils import timezone
 from django.core.cache import cache
@@ -51,8 +44,27 @@ from reportlab.lib import colors
 from reportlab.lib.pagesizes import letter, A4, landscape
 from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
 from reportlab.platypus import Paragraph, SimpleDocTemplate, Spacer, Table, TableStyle
-from . import models, serializers
+from . import (
+    checkout,
+    credits,
+    customers,
+    dashboard,
+    historial,
+    idempotency,
+    locking,
+    models,
+    movimientos,
+    numbering,
+    periods,
+    pricing,
+    product_sales,
+    refunds,
+    rollup,
+    serializers,
+    timing,
+)
 from .db_state import has_unaccent, has_unaccent_wrapper
+from .permissions import IsAdminRole
 
 
 class Unaccent(Func):
@@ -82,12 +94,6 @@ def _strip_accents(value: str) -> str:
 from .utils.security import constant_time_compare
 
 
-PAYMENT_METHOD_MAP = {
-    "CASH": "efectivo",
-    "CARD": "tarjeta",
-    "TRANSFER": "transferencia",
-}
-
 MONTH_NAMES_ES = [
     "",
     "Enero",
@@ -143,12 +149,19 @@ def _range_label(mode, start, end, today):
     return "Rango:"
 
 
-def _venta_product_names(venta_id):
-    detalles = models.DetalleVenta.objects.filter(venta_id=venta_id).select_related("producto")
-    nombres = []
+def _product_names(venta_ids):
+    """``{venta_id: "producto, producto"}`` with one query."""
+    nombres = defaultdict(list)
+    detalles = (
+        models.DetalleVenta.objects.filter(venta_id__in=venta_ids)
+        .select_related("producto")
+        .order_by("venta_id", "id")
+    )
     for d in detalles:
-        nombres.append(d.producto_nombre_snapshot or (d.producto.nombre if d.producto else ""))
-    return ", ".join(filter(None, nombres))
+        nombres[d.venta_id].append(
+            d.producto_nombre_snapshot or (d.producto.nombre if d.producto else "")
+        )
+    return {venta_id: ", ".join(filter(None, n)) for venta_id, n in nombres.items()}
 
 
 def health(request):
@@ -157,41 +170,13 @@ def health(request):
 
 @api_view(["GET"])
 def ventas_historial(request):
-    mode = request.query_params.get("mode", "daily")
-    if mode not in {"daily", "quincenal", "monthly", "all", "range"}:
-        return Response({"detail": "Invalid mode"}, status=400)
-
-    now = timezone.localtime()
-    today = now.date()
+    try:
+        period = periods.from_params(request.query_params, timezone.localdate())
+    except periods.PeriodError as exc:
+        return Response({"detail": str(exc)}, status=400)
 
-    start_date = end_date = None
-    if mode == "range":
-        start_str = request.query_params.get("start")
-        end_str = request.query_params.get("end")
-        start_date = date.fromisoformat(start_str) if start_str else None
-        end_date = date.fromisoformat(end_str) if end_str else None
-        if end_date and end_date > today:
-            end_date = today
-        if start_date and end_date and start_date > end_date:
-            return Response({"detail": "Invalid range"}, status=400)
-    elif mode == "daily":
-        start_date = today
-        end_date = today
-    elif mode == "monthly":
-        start_date = date(today.year, today.month, 1)
-        end_date = today
-    elif mode == "quincenal":
-        start = 1 if today.day <= 15 else 16
-        start_date = date(today.year, today.month, start)
-        end_date = today
-    # mode "all" leaves start_date/end_date as None (no filter)
-
-    qs = models.Ventas.objects.select_related("cliente")
-
-    if start_date:
-        qs = qs.filter(fecha__date__gte=start_date)
-    if end_date:
-        qs = qs.filter(fecha__date__lte=end_date)
+    # mode "all" has no bounds (no filter)
+    qs = period.filter(models.Ventas.objects.select_related("cliente"))
 
     q = request.query_params.get("q")
     if q:
@@ -227,77 +212,13 @@ def ventas_historial(request):
 @api_view(["GET"])
 def historial_ventas(request):
     try:
-        mode = request.query_params.get("mode", "daily")
-        if mode not in {"daily", "quincenal", "monthly", "all", "range"}:
-            return Response({"detail": "Invalid mode"}, status=400)
-
-        now = timezone.localtime()
-        today = now.date()
-
-        start_date = end_date = None
-        if mode == "range":
-            start_str = request.query_params.get("start")
-            end_str = request.query_params.get("end")
-            start_date = date.fromisoformat(start_str) if start_str else None
-            end_date = date.fromisoformat(end_str) if end_str else None
-            if end_date and end_date > today:
-                end_date = today
-            if start_date and end_date and start_date > end_date:
-                return Response({"detail": "Invalid range"}, status=400)
-        elif mode == "daily":
-            start_date = today
-            end_date = today
-        elif mode == "monthly":
-            start_date = date(today.year, today.month, 1)
-            end_date = today
-        elif mode == "quincenal":
-            start = 1 if today.day <= 15 else 16
-            start_date = date(today.year, today.month, start)
-            end_date = today
+        try:
+            period = periods.from_params(request.query_params, timezone.localdate())
+        except periods.PeriodError as exc:
+            return Response({"detail": str(exc)}, status=400)
 
         search = (request.query_params.get("q") or "").strip()
 
-        venta_credit_exists = models.CreditosHistorialCompras.objects.filter(venta_id=OuterRef("pk"))
-
-        contado_qs = (
-            models.Ventas.objects.select_related("cliente")
-            .annotate(tiene_credito=Exists(venta_credit_exists))
-            .filter(tiene_credito=False)
-        )
-        if start_date:
-            contado_qs = contado_qs.filter(fecha__date__gte=start_date)
-        if end_date:
-            contado_qs = contado_qs.filter(fecha__date__lte=end_date)
-        if search:
-            if search.isdigit():
-                contado_qs = contado_qs.filter(
-                    Q(id=int(search)) | Q(cliente__nombre__icontains=search)
-                )
-            else:
-                contado_qs = contado_qs.filter(cliente__nombre__icontains=search)
-
-        historial_subquery = models.CreditosHistorialCompras.objects.filter(
-            credito_id=OuterRef("credito_id")
-        ).order_by("fecha")
-
-        abonos_qs = (
-            models.PagosCredito.objects.select_related("credito__cliente")
-            .annotate(venta_ref=Subquery(historial_subquery.values("venta_id")[:1]))
-            .filter(venta_ref__isnull=False)
-        )
-        if start_date:
-            abonos_qs = abonos_qs.filter(fecha__date__gte=start_date)
-        if end_date:
-            abonos_qs = abonos_qs.filter(fecha__date__lte=end_date)
-        if search:
-            if search.isdigit():
-                abonos_qs = abonos_qs.filter(
-                    Q(venta_ref=int(search))
-                    | Q(credito__cliente__nombre__icontains=search)
-                )
-            else:
-                abonos_qs = abonos_qs.filter(credito__cliente__nombre__icontains=search)
-
         try:
             page = int(request.query_params.get("page", 1))
         except (TypeError, ValueError):
@@ -311,124 +232,22 @@ def historial_ventas(request):
             page_size = 30
         page_size = max(1, min(page_size, 100))
 
-        fetch_limit = page * page_size
-        contado_items = list(contado_qs.order_by("-fecha")[:fetch_limit])
-        abono_items = list(abonos_qs.order_by("-fecha")[:fetch_limit])
-
-        devoluciones_qs = models.Devoluciones.objects.filter(venta__isnull=False)
-        if start_date:
-            devoluciones_qs = devoluciones_qs.filter(fecha__date__gte=start_date)
-        if end_date:
-            devoluciones_qs = devoluciones_qs.filter(fecha__date__lte=end_date)
-        if search:
-            if search.isdigit():
-                devoluciones_qs = devoluciones_qs.filter(
-                    Q(venta_id=int(search)) | Q(venta__cliente__nombre__icontains=search)
-                )
-            else:
-                devoluciones_qs = devoluciones_qs.filter(
-                    venta__cliente__nombre__icontains=search
-                )
-
-        devoluciones_total = (
-            devoluciones_qs.values("venta_id", "fecha").distinct().count()
-        )
-
-        devoluciones_rows = list(
-            devoluciones_qs
-            .values(
-                "venta_id",
-                "fecha",
-                "venta__cliente__id",
-                "venta__cliente__nombre",
-                "venta__cliente__razon_social",
-                "venta__cliente__nombre_comercial",
-                "venta__cliente__nit",
-                "venta__cliente__telefono",
-                "venta__documento_numero",
-            )
-            .annotate(
-                total_refund=Coalesce(Sum("total"), Decimal("0")),
-                ingreso_total=Coalesce(Sum("ingreso_afectado"), Decimal("0")),
-                notas=StringAgg(
-                    "motivo",
-                    delimiter=" | ",
-                    filter=~Q(motivo__isnull=True) & ~Q(motivo__exact=""),
-                ),
-                first_id=Min("id"),
-            )
-            .order_by("-fecha")[:fetch_limit]
-        )
-
-        contado_total = contado_qs.count()
-        abono_total = abonos_qs.count()
-        total_count = contado_total + abono_total + devoluciones_total
-
-        combined = []
-        for venta in contado_items:
-            cliente = "Cliente General"
-            if venta.cliente_id and venta.cliente:
-                cliente = venta.cliente.nombre
-            combined.append(
-                {
-                    "id": venta.id,
-                    "fecha": venta.fecha,
-                    "monto": float(venta.total),
-                    "venta_id": venta.id,
-                    "cliente": cliente,
-                    "tipo": "VENTA_CONTADO",
-                    "nota": None,
-                    "ingreso_afectado": float(venta.total),
-                    "venta_numero": venta.documento_numero,
-                }
-            )
-
-        for abono in abono_items:
-            credito = getattr(abono, "credito", None)
-            cliente_obj = getattr(credito, "cliente", None)
-            cliente = getattr(cliente_obj, "nombre", "Cliente General")
-            combined.append(
-                {
-                    "id": abono.id,
-                    "fecha": abono.fecha,
-                    "monto": float(abono.monto),
-                    "venta_id": abono.venta_ref,
-                    "cliente": cliente,
-                    "tipo": "ABONO",
-                    "nota": None,
-                    "ingreso_afectado": float(abono.monto),
-                    "venta_numero": None,
-                }
-            )
-
-        for row in devoluciones_rows:
-            cliente_nombre = (
-                row.get("venta__cliente__nombre")
-                or row.get("venta__cliente__razon_social")
-                or row.get("venta__cliente__nombre_comercial")
-                or "Cliente General"
-            )
-            notas = row.get("notas") or None
-            total_refund = row.get("total_refund") or Decimal("0")
-            ingreso_total = row.get("ingreso_total") or Decimal("0")
-            combined.append(
-                {
-                    "id": row.get("first_id"),
-                    "fecha": row["fecha"],
-                    "monto": -float(total_refund),
-                    "venta_id": row["venta_id"],
-                    "cliente": cliente_nombre,
-                    "tipo": "DEVOLUCION",
-                    "nota": notas,
-                    "ingreso_afectado": float(ingreso_total),
-                    "venta_numero": row.get("venta__documento_numero"),
-                }
-            )
+        # ``cursor`` (from ``next_cursor``) continues after the last row shown
+        # and reads the same few rows at any depth; ``page`` still allows
+        # numbered jumps.
+        cursor = request.query_params.get("cursor")
+        if cursor:
+            try:
+                cursor = historial.decode_cursor(cursor)
+            except historial.CursorError as exc:
+                return Response({"detail": str(exc)}, status=400)
 
-        combined.sort(key=lambda x: x["fecha"], reverse=True)
-        start = (page - 1) * page_size
-        end = start + page_size
-        page_rows = combined[start:end]
+        qs = historial.queryset(period, search)
+        if cursor:
+            page_rows, next_cursor = historial.page(qs, page_size, cursor=cursor)
+        else:
+            page_rows, next_cursor = historial.page(qs, page_size, offset=(page - 1) * page_size)
+        total_count = qs.count()
 
         results = [
             {
@@ -445,6 +264,7 @@ def historial_ventas(request):
                 "page": page,
                 "page_size": page_size,
                 "total_pages": total_pages,
+                "next_cursor": next_cursor,
                 "results": results,
             }
         )
@@ -696,100 +516,49 @@ def ventas_export(request):
 
     start_date = _parse_date(request.query_params.get("start"), today)
     end_date = _parse_date(request.query_params.get("end"), today)
-    if start_date and end_date and start_date > end_date:
-        return Response({"detail": "Invalid range"}, status=400)
+    try:
+        period = periods.resolve("range", today, start_date, end_date)
+    except periods.PeriodError as exc:
+        return Response({"detail": str(exc)}, status=400)
 
     mode = mode or _infer_mode(start_date, end_date, today)
     label = _range_label(mode, start_date, end_date, today)
 
-    qs = models.Ventas.objects.select_related("cliente").order_by("fecha", "id")
-    if start_date:
-        qs = qs.filter(fecha__date__gte=start_date)
-    if end_date:
-        qs = qs.filter(fecha__date__lte=end_date)
+    qs = period.filter(
+        models.Movimientos.objects.select_related("cliente", "venta").order_by("fecha", "id")
+    )
+    movs = list(qs)
+    productos = _product_names(
+        [mov.venta_id for mov in movs if mov.tipo == movimientos.CONTADO]
+    )
 
     entries = []
     grand = Decimal("0")
-    for v in qs:
-        cliente = v.cliente.nombre if v.cliente else "Cliente General"
-        local_dt = timezone.localtime(v.fecha)
-        fecha_str = local_dt.strftime("%d/%m/%Y %I:%M %p")
-        productos = _venta_product_names(v.id)
-        total = v.total or Decimal("0")
-        grand += total
-        entries.append(
-            {
-                "venta_id": v.id,
-                "cliente": cliente,
-                "fecha_dt": local_dt,
-                "fecha_str": fecha_str,
-                "descripcion": productos,
-                "total": total,
-                "tipo": "VENTA",
-            }
-        )
-
-    devoluciones_qs = models.Devoluciones.objects.filter(venta__isnull=False)
-    if start_date:
-        devoluciones_qs = devoluciones_qs.filter(fecha__date__gte=start_date)
-    if end_date:
-        devoluciones_qs = devoluciones_qs.filter(fecha__date__lte=end_date)
-
-    devoluciones_rows = (
-        devoluciones_qs.values(
-            "venta_id",
-            "fecha",
-            "venta__cliente__nombre",
-            "venta__cliente__razon_social",
-            "venta__cliente__nombre_comercial",
-            "venta__documento_numero",
-        )
-        .annotate(
-            total_refund=Coalesce(Sum("total"), Decimal("0")),
-            notas=StringAgg(
-                "motivo",
-                delimiter=" | ",
-                filter=~Q(motivo__isnull=True) & ~Q(motivo__exact=""),
-            ),
-        )
-        .order_by("fecha", "venta_id")
-    )
-
-    for row in devoluciones_rows:
-        local_dt = timezone.localtime(row["fecha"])
-        fecha_str = local_dt.strftime("%d/%m/%Y %I:%M %p")
-        cliente = (
-            row.get("venta__cliente__nombre")
-            or row.get("venta__cliente__razon_social")
-            or row.get("venta__cliente__nombre_comercial")
-            or "Cliente General"
-        )
-        numero = row.get("venta__documento_numero") or str(row["venta_id"])
-        motivo = row.get("notas")
-        descripcion = f"Devolución venta #{numero}"
-        if motivo:
-            descripcion = f"{descripcion} · {motivo}"
-        total_refund = row.get("total_refund") or Decimal("0")
-        grand -= total_refund
+    for mov in movs:
+        local_dt = timezone.localtime(mov.fecha)
+        numero = (mov.venta.documento_numero if mov.venta else None) or mov.venta_id
+        venta_ref = f" venta #{numero}" if numero else ""
+        if mov.tipo == movimientos.CONTADO:
+            descripcion = productos.get(mov.venta_id, "")
+        elif mov.tipo == movimientos.ABONO:
+            descripcion = f"Abono{venta_ref}"
+        else:
+            descripcion = f"Devolución{venta_ref}"
+            if mov.nota:
+                descripcion = f"{descripcion} · {mov.nota}"
+        grand += mov.monto
         entries.append(
             {
-                "venta_id": row["venta_id"],
-                "cliente": cliente,
+                "venta_id": mov.venta_id,
+                "cliente": historial.cliente_nombre(mov.cliente),
                 "fecha_dt": local_dt,
-                "fecha_str": fecha_str,
+                "fecha_str": local_dt.strftime("%d/%m/%Y %I:%M %p"),
                 "descripcion": descripcion,
-                "total": -total_refund,
-                "tipo": "DEVOLUCION",
+                "total": mov.monto,
+                "tipo": mov.tipo,
             }
         )
 
-    entries.sort(
-        key=lambda item: (
-            item["fecha_dt"],
-            item.get("venta_id") or 0,
-            0 if item["tipo"] == "VENTA" else 1,
-        )
-    )
     count = len(entries)
     dataset = [
         [
@@ -1399,60 +1168,17 @@ class ReporteExportInventarioView(APIView):
 
 @api_view(["GET"])
 def ventas_total(request):
-    now = timezone.localtime()
-    today = now.date()
-
-    start_str = request.query_params.get("start")
-    end_str = request.query_params.get("end")
-
-    start_date = date.fromisoformat(start_str) if start_str else None
-    end_date = date.fromisoformat(end_str) if end_str else None
-    if end_date and end_date > today:
-        end_date = today
-    if start_date and end_date and start_date > end_date:
-        return Response({"detail": "Invalid range"}, status=400)
-
-    cash_qs = models.Ventas.objects.filter(creditoshistorialcompras__isnull=True)
-    if start_date:
-        cash_qs = cash_qs.filter(fecha__date__gte=start_date)
-    if end_date:
-        cash_qs = cash_qs.filter(fecha__date__lte=end_date)
-    cash_total = cash_qs.aggregate(total=Coalesce(Sum("total"), Decimal("0")))[
-        "total"
-    ] or Decimal("0")
-
-    cash_refunds_qs = models.Devoluciones.objects.filter(
-        venta__creditoshistorialcompras__isnull=True
-    )
-    if start_date:
-        cash_refunds_qs = cash_refunds_qs.filter(fecha__date__gte=start_date)
-    if end_date:
-        cash_refunds_qs = cash_refunds_qs.filter(fecha__date__lte=end_date)
-    cash_refunds = cash_refunds_qs.aggregate(
-        total=Coalesce(Sum("ingreso_afectado"), Decimal("0"))
-    )["total"] or Decimal("0")
-
-    credit_qs = models.PagosCredito.objects.all()
-    if start_date:
-        credit_qs = credit_qs.filter(fecha__date__gte=start_date)
-    if end_date:
-        credit_qs = credit_qs.filter(fecha__date__lte=end_date)
-    credit_total = credit_qs.aggregate(total=Coalesce(Sum("monto"), Decimal("0")))[
-        "total"
-    ] or Decimal("0")
-
-    credit_refunds_qs = models.Devoluciones.objects.filter(
-        venta__creditoshistorialcompras__isnull=False
-    )
-    if start_date:
-        credit_refunds_qs = credit_refunds_qs.filter(fecha__date__gte=start_date)
-    if end_date:
-        credit_refunds_qs = credit_refunds_qs.filter(fecha__date__lte=end_date)
-    credit_refunds = credit_refunds_qs.aggregate(
-        total=Coalesce(Sum("ingreso_afectado"), Decimal("0"))
-    )["total"] or Decimal("0")
+    today = timezone.localdate()
+    params = {key: request.query_params.get(key) for key in ("start", "end")}
+    try:
+        period = periods.from_params(params, today, default_mode="range")
+    except periods.PeriodError as exc:
+        return Response({"detail": str(exc)}, status=400)
+    start_date, end_date = period.start_date, period.end_date
 
-    total = (cash_total - cash_refunds) + (credit_total - credit_refunds)
+    # Cash sales plus credit payments, net of reversed income, from the
+    # daily rollup (local days); only today is queried on a warm cache.
+    total = rollup.income(start_date, end_date, today)
 
     return Response(
         {
@@ -1463,651 +1189,66 @@ def ventas_total(request):
     )
 
 
-@api_view(["GET"])
-def reportes_dashboard(request):
+def _dashboard_part(request, part, **params):
     section = request.GET.get("section", "all")
-    if section == "new":
-        prod_cond = "new"
-        product_filter = {"condicion": "new"}
-        detalle_filter = {"producto__condicion": "new"}
-    elif section == "used":
-        prod_cond = "used"
-        product_filter = {"condicion": "used"}
-        detalle_filter = {"producto__condicion": "used"}
-    else:
-        prod_cond = None
-        product_filter = {}
-        detalle_filter = {}
-
-    now = timezone.localtime()
-    today = now.date()
-    tz = timezone.get_current_timezone()
-
-    def _aware_datetime(d: date, t: dt_time = dt_time.min) -> datetime:
-        naive = datetime.combine(d, t)
-        if timezone.is_naive(naive):
-            return timezone.make_aware(naive, tz)
-        return naive.astimezone(tz)
-
-    # Stats
-    total_productos = models.Productos.objects.filter(**product_filter).count()
-    start_today = _aware_datetime(today)
-    end_today = start_today + timedelta(days=1)
-    ventas_hoy = Decimal("0")
-
-    creditos_qs = models.CreditosHistorialCompras.objects.all()
-    if prod_cond:
-        creditos_qs = creditos_qs.filter(
-            venta__detalles__producto__condicion=prod_cond
-        ).distinct()
-    creditos_pendientes = creditos_qs.aggregate(
-        total=Coalesce(Sum("saldo"), Decimal("0"))
-    )["total"]
-
-    valor_inventario = models.Productos.objects.filter(**product_filter).aggregate(
-        total=Coalesce(
-            Sum(
-                ExpressionWrapper(
-                    F("costo") * F("stock"),
-                    output_field=DecimalField(max_digits=14, decimal_places=2),
-                )
-            ),
-            Decimal("0"),
-        )
-    )["total"]
-
-    devoluciones_qs = models.Devoluciones.objects.filter(
-        fecha__year=today.year, fecha__month=today.month
-    )
-    if prod_cond:
-        devoluciones_qs = devoluciones_qs.filter(producto__condicion=prod_cond)
-    devoluciones_mensuales = devoluciones_qs.aggregate(
-        total=Coalesce(Sum("total"), Decimal("0"))
-    )["total"]
-
-    stats = {
-        "total_productos": total_productos,
-        "ventas_hoy": ventas_hoy,
-        "creditos_pendientes": creditos_pendientes,
-        "valor_inventario": valor_inventario,
-        "devoluciones_mensuales": devoluciones_mensuales,
-    }
-
-    # Sales chart data
-    cost_expr = ExpressionWrapper(
-        F("cantidad")
-        * Coalesce("producto_costo_snapshot", F("producto__costo")),
-        output_field=DecimalField(max_digits=14, decimal_places=2),
-    )
-    detalles_sales = models.DetalleVenta.objects.filter(**detalle_filter)
-    detalles_profit = detalles_sales
-    if section == "all":
-        detalles_profit = detalles_sales.filter(producto__condicion="new")
-
-    condition_new = Q(producto_condicion_snapshot__iexact="new") | Q(
-        producto__condicion__iexact="new"
-    )
-    condition_used = Q(producto_condicion_snapshot__iexact="used") | Q(
-        producto__condicion__iexact="used"
-    )
-
-    cash_details_base = models.DetalleVenta.objects.filter(
-        venta__creditoshistorialcompras__isnull=True
-    )
-
-    credit_sale_lookup = models.CreditosHistorialCompras.objects.filter(
-        venta_id=OuterRef("venta_id")
-    ).order_by("fecha")
-
-    credit_detail_rows = (
-        models.DetalleVenta.objects.annotate(
-            credito_ref=Subquery(credit_sale_lookup.values("credito_id")[:1])
-        )
-        .filter(credito_ref__isnull=False)
-        .values("credito_ref")
-        .annotate(
-            new_total=Coalesce(
-                Sum("subtotal", filter=condition_new),
-                Decimal("0"),
-            ),
-            used_total=Coalesce(
-                Sum("subtotal", filter=condition_used),
-                Decimal("0"),
-            ),
-        )
-    )
-
-    credit_ratios = {}
-    default_ratio = {"new": Decimal("1"), "used": Decimal("0")}
-    for row in credit_detail_rows:
-        new_total = row["new_total"] or Decimal("0")
-        used_total = row["used_total"] or Decimal("0")
-        base_total = new_total + used_total
-        if base_total > 0:
-            credit_ratios[row["credito_ref"]] = {
-                "new": new_total / base_total,
-                "used": used_total / base_total,
-            }
-        elif new_total > 0:
-            credit_ratios[row["credito_ref"]] = {"new": Decimal("1"), "used": Decimal("0")}
-        elif used_total > 0:
-            credit_ratios[row["credito_ref"]] = {"new": Decimal("0"), "used": Decimal("1")}
-        else:
-            credit_ratios[row["credito_ref"]] = default_ratio
-
-    def _refund_condition_filter(qs, condition):
-        if condition == "new":
-            return qs.filter(
-                Q(producto_condicion_snapshot__iexact="new")
-                | Q(producto__condicion__iexact="new")
-            )
-        if condition == "used":
-            return qs.filter(
-                Q(producto_condicion_snapshot__iexact="used")
-                | Q(producto__condicion__iexact="used")
-            )
-        return qs
-
-    def _aggregate_cash_period(qs, period_expr, start=None, end=None, condition=None):
-        filtered = qs
-        if start is not None:
-            filtered = filtered.filter(venta__fecha__gte=start)
-        if end is not None:
-            filtered = filtered.filter(venta__fecha__lt=end)
-        rows = (
-            filtered.annotate(periodo=period_expr)
-            .values("periodo")
-            .annotate(total=Coalesce(Sum("subtotal"), Decimal("0")))
-        )
-        data = defaultdict(lambda: Decimal("0"))
-        for row in rows:
-            data[row["periodo"]] += row["total"] or Decimal("0")
-        refund_qs = models.Devoluciones.objects.filter(
-            venta__creditoshistorialcompras__isnull=True
-        )
-        if start is not None:
-            refund_qs = refund_qs.filter(fecha__gte=start)
-        if end is not None:
-            refund_qs = refund_qs.filter(fecha__lt=end)
-        refund_qs = _refund_condition_filter(refund_qs, condition)
-        refund_rows = (
-            refund_qs.annotate(periodo=period_expr)
-            .values("periodo")
-            .annotate(total=Coalesce(Sum("ingreso_afectado"), Decimal("0")))
-        )
-        for row in refund_rows:
-            data[row["periodo"]] -= row["total"] or Decimal("0")
-        return data
-
-    def _sum_cash_range(qs, start=None, end=None, condition=None):
-        filtered = qs
-        if start is not None:
-            filtered = filtered.filter(venta__fecha__gte=start)
-        if end is not None:
-            filtered = filtered.filter(venta__fecha__lt=end)
-        total = filtered.aggregate(total=Coalesce(Sum("subtotal"), Decimal("0")))[
-            "total"
-        ] or Decimal("0")
-        refund_qs = models.Devoluciones.objects.filter(
-            venta__creditoshistorialcompras__isnull=True
-        )
-        if start is not None:
-            refund_qs = refund_qs.filter(fecha__gte=start)
-        if end is not None:
-            refund_qs = refund_qs.filter(fecha__lt=end)
-        refund_qs = _refund_condition_filter(refund_qs, condition)
-        refund_total = refund_qs.aggregate(
-            total=Coalesce(Sum("ingreso_afectado"), Decimal("0"))
-        )["total"] or Decimal("0")
-        return total - refund_total
-
-    def _aggregate_credit_period(period_expr, start=None, end=None):
-        qs = models.PagosCredito.objects.all()
-        if start is not None:
-            qs = qs.filter(fecha__gte=start)
-        if end is not None:
-            qs = qs.filter(fecha__lt=end)
-        rows = (
-            qs.annotate(periodo=period_expr)
-            .values("periodo", "credito_id")
-            .annotate(total=Coalesce(Sum("monto"), Decimal("0")))
-        )
-        new_map = defaultdict(lambda: Decimal("0"))
-        used_map = defaultdict(lambda: Decimal("0"))
-        for row in rows:
-            ratio = credit_ratios.get(row["credito_id"], default_ratio)
-            total = row["total"] or Decimal("0")
-            new_map[row["periodo"]] += total * ratio["new"]
-            used_map[row["periodo"]] += total * ratio["used"]
-        refund_qs = models.Devoluciones.objects.filter(
-            venta__creditoshistorialcompras__isnull=False
-        )
-        if start is not None:
-            refund_qs = refund_qs.filter(fecha__gte=start)
-        if end is not None:
-            refund_qs = refund_qs.filter(fecha__lt=end)
-        refund_rows = (
-            refund_qs.annotate(periodo=period_expr)
-            .values("periodo", "producto_condicion_snapshot", "producto__condicion")
-            .annotate(total=Coalesce(Sum("ingreso_afectado"), Decimal("0")))
-        )
-        for row in refund_rows:
-            cond = row["producto_condicion_snapshot"] or row["producto__condicion"] or ""
-            cond = cond.lower()
-            if cond == "used":
-                used_map[row["periodo"]] -= row["total"] or Decimal("0")
-            else:
-                new_map[row["periodo"]] -= row["total"] or Decimal("0")
-        return new_map, used_map
-
-    def _sum_credit_range(start=None, end=None):
-        qs = models.PagosCredito.objects.all()
-        if start is not None:
-            qs = qs.filter(fecha__gte=start)
-        if end is not None:
-            qs = qs.filter(fecha__lt=end)
-        rows = qs.values("credito_id").annotate(total=Coalesce(Sum("monto"), Decimal("0")))
-        total_new = Decimal("0")
-        total_used = Decimal("0")
-        for row in rows:
-            ratio = credit_ratios.get(row["credito_id"], default_ratio)
-            amount = row["total"] or Decimal("0")
-            total_new += amount * ratio["new"]
-            total_used += amount * ratio["used"]
-        refund_qs = models.Devoluciones.objects.filter(
-            venta__creditoshistorialcompras__isnull=False
-        )
-        if start is not None:
-            refund_qs = refund_qs.filter(fecha__gte=start)
-        if end is not None:
-            refund_qs = refund_qs.filter(fecha__lt=end)
-        refund_rows = refund_qs.values(
-            "producto_condicion_snapshot", "producto__condicion"
-        ).annotate(total=Coalesce(Sum("ingreso_afectado"), Decimal("0")))
-        refund_new = Decimal("0")
-        refund_used = Decimal("0")
-        for row in refund_rows:
-            cond = row["producto_condicion_snapshot"] or row["producto__condicion"] or ""
-            cond = cond.lower()
-            if cond == "used":
-                refund_used += row["total"] or Decimal("0")
-            else:
-                refund_new += row["total"] or Decimal("0")
-        return total_new - refund_new, total_used - refund_used
+    if section not in dashboard.SECTIONS:
+        section = "all"
+    payload, hit = dashboard.cached(part, section, timezone.localdate(), **params)
+    response = Response(payload)
+    response["X-Cache"] = "HIT" if hit else "MISS"
+    return response
 
-    cash_new_qs = cash_details_base.filter(condition_new)
-    cash_used_qs = cash_details_base.filter(condition_used)
 
-    cash_today_new = _sum_cash_range(cash_new_qs, start_today, end_today, condition="new")
-    cash_today_used = _sum_cash_range(cash_used_qs, start_today, end_today, condition="used")
-    credit_today_new, credit_today_used = _sum_credit_range(
-        start=start_today, end=end_today
-    )
+@api_view(["GET"])
+def reportes_dashboard(request):
+    return _dashboard_part(request, "dashboard")
 
-    if section == "new":
-        ventas_hoy = cash_today_new + credit_today_new
-    elif section == "used":
-        ventas_hoy = cash_today_used + credit_today_used
-    else:
-        ventas_hoy = (
-            cash_today_new
-            + cash_today_used
-            + credit_today_new
-            + credit_today_used
-        )
-    stats["ventas_hoy"] = ventas_hoy
-
-    # Diario: últimos 7 días
-    start_day = today - timedelta(days=6)
-    start_day_dt = _aware_datetime(start_day)
-    diario_profit_qs = (
-        detalles_profit.filter(venta__fecha__date__gte=start_day)
-        .annotate(periodo=TruncDay("venta__fecha", tzinfo=tz))
-        .values("periodo")
-        .annotate(
-            price_total=Coalesce(Sum("subtotal"), Decimal("0")),
-            cost_total=Coalesce(Sum(cost_expr), Decimal("0")),
-        )
-        .order_by("periodo")
-    )
-    profit_map = {d["periodo"]: d for d in diario_profit_qs}
 
-    diario_cash_new = _aggregate_cash_period(
-        cash_new_qs,
-        TruncDay("venta__fecha", tzinfo=tz),
-        start=start_day_dt,
-        condition="new",
-    )
-    diario_cash_used = _aggregate_cash_period(
-        cash_used_qs,
-        TruncDay("venta__fecha", tzinfo=tz),
-        start=start_day_dt,
-        condition="used",
-    )
-    diario_credit_new, diario_credit_used = _aggregate_credit_period(
-        TruncDay("fecha", tzinfo=tz), start=start_day_dt
-    )
-
-    diario = []
-    for offset in range(7):
-        current_day = start_day + timedelta(days=offset)
-        periodo_dt = _aware_datetime(current_day)
-        new_total = diario_cash_new.get(periodo_dt, Decimal("0")) + diario_credit_new.get(
-            periodo_dt, Decimal("0")
-        )
-        used_total = diario_cash_used.get(periodo_dt, Decimal("0")) + diario_credit_used.get(
-            periodo_dt, Decimal("0")
-        )
-        if section == "new":
-            ventas_total = new_total
-        elif section == "used":
-            ventas_total = used_total
-        else:
-            ventas_total = new_total + used_total
-        profit_data = profit_map.get(
-            periodo_dt, {"price_total": Decimal("0"), "cost_total": Decimal("0")}
-        )
-        profit = profit_data["price_total"] - profit_data["cost_total"]
-        diario.append(
-            {
-                "periodo": periodo_dt.strftime("%Y-%m-%d"),
-                "ventas": ventas_total,
-                "utilidad": profit,
-                "price_total": profit_data["price_total"],
-                "cost_total": profit_data["cost_total"],
-                "profit_total": profit,
-            }
-        )
+@api_view(["GET"])
+def reportes_dashboard_stats(request):
+    return _dashboard_part(request, "stats")
 
-    # Quincenal: este mes
-    year = today.year
-    month = today.month
-    last_day = calendar.monthrange(year, month)[1]
-    quincenal = []
-    first_half_profit = detalles_profit.filter(
-        venta__fecha__year=year, venta__fecha__month=month, venta__fecha__day__lte=15
-    ).aggregate(
-        price_total=Coalesce(Sum("subtotal"), Decimal("0")),
-        cost_total=Coalesce(Sum(cost_expr), Decimal("0")),
-    )
-    second_half_profit = detalles_profit.filter(
-        venta__fecha__year=year, venta__fecha__month=month, venta__fecha__day__gt=15
-    ).aggregate(
-        price_total=Coalesce(Sum("subtotal"), Decimal("0")),
-        cost_total=Coalesce(Sum(cost_expr), Decimal("0")),
-    )
-    month_start_dt = _aware_datetime(date(year, month, 1))
-    mid_month_dt = _aware_datetime(date(year, month, 16))
-    if month == 12:
-        next_month = date(year + 1, 1, 1)
-    else:
-        next_month = date(year, month + 1, 1)
-    next_month_dt = _aware_datetime(next_month)
-
-    first_half_cash_new = _sum_cash_range(cash_new_qs, month_start_dt, mid_month_dt)
-    first_half_cash_used = _sum_cash_range(cash_used_qs, month_start_dt, mid_month_dt)
-    second_half_cash_new = _sum_cash_range(cash_new_qs, mid_month_dt, next_month_dt)
-    second_half_cash_used = _sum_cash_range(cash_used_qs, mid_month_dt, next_month_dt)
-
-    first_half_credit_new, first_half_credit_used = _sum_credit_range(
-        start=month_start_dt, end=mid_month_dt
-    )
-    second_half_credit_new, second_half_credit_used = _sum_credit_range(
-        start=mid_month_dt, end=next_month_dt
-    )
 
-    first_half_new = first_half_cash_new + first_half_credit_new
-    first_half_used = first_half_cash_used + first_half_credit_used
-    second_half_new = second_half_cash_new + second_half_credit_new
-    second_half_used = second_half_cash_used + second_half_credit_used
-
-    for label, sales_data, profit_data in (
-        (
-            "1-15",
-            {"new": first_half_new, "used": first_half_used},
-            first_half_profit,
-        ),
-        (
-            f"16-{last_day}",
-            {"new": second_half_new, "used": second_half_used},
-            second_half_profit,
-        ),
-    ):
-        if section == "new":
-            ventas_total = sales_data["new"]
-        elif section == "used":
-            ventas_total = sales_data["used"]
-        else:
-            ventas_total = sales_data["new"] + sales_data["used"]
-        profit = profit_data["price_total"] - profit_data["cost_total"]
-        quincenal.append(
-            {
-                "periodo": label,
-                "ventas": ventas_total,
-                "utilidad": profit,
-                "price_total": profit_data["price_total"],
-                "cost_total": profit_data["cost_total"],
-                "profit_total": profit,
-            }
-        )
+@api_view(["GET"])
+def reportes_dashboard_chart(request):
+    period = request.GET.get("period", "diario")
+    if period not in dashboard.PERIODS:
+        return Response({"detail": "Periodo inválido"}, status=400)
+    return _dashboard_part(request, "chart", period=period)
 
-    # Mensual: este año
-    mensual_profit_qs = (
-        detalles_profit.filter(venta__fecha__year=today.year)
-        .annotate(periodo=TruncMonth("venta__fecha", tzinfo=tz))
-        .values("periodo")
-        .annotate(
-            price_total=Coalesce(Sum("subtotal"), Decimal("0")),
-            cost_total=Coalesce(Sum(cost_expr), Decimal("0")),
-        )
-        .order_by("periodo")
-    )
-    mensual = []
-    profit_map = {d["periodo"]: d for d in mensual_profit_qs}
-    year_start_dt = _aware_datetime(date(today.year, 1, 1))
-    year_end_dt = _aware_datetime(date(today.year + 1, 1, 1))
-    mensual_cash_new = _aggregate_cash_period(
-        cash_new_qs,
-        TruncMonth("venta__fecha", tzinfo=tz),
-        start=year_start_dt,
-        end=year_end_dt,
-        condition="new",
-    )
-    mensual_cash_used = _aggregate_cash_period(
-        cash_used_qs,
-        TruncMonth("venta__fecha", tzinfo=tz),
-        start=year_start_dt,
-        end=year_end_dt,
-        condition="used",
-    )
-    mensual_credit_new, mensual_credit_used = _aggregate_credit_period(
-        TruncMonth("fecha", tzinfo=tz), start=year_start_dt, end=year_end_dt
-    )
-    all_month_keys = sorted(
-        set(mensual_cash_new)
-        | set(mensual_cash_used)
-        | set(mensual_credit_new)
-        | set(mensual_credit_used)
-        | set(profit_map)
-    )
-    for periodo in all_month_keys:
-        new_total = mensual_cash_new.get(periodo, Decimal("0")) + mensual_credit_new.get(
-            periodo, Decimal("0")
-        )
-        used_total = mensual_cash_used.get(periodo, Decimal("0")) + mensual_credit_used.get(
-            periodo, Decimal("0")
-        )
-        if section == "new":
-            sales_total = new_total
-        elif section == "used":
-            sales_total = used_total
-        else:
-            sales_total = new_total + used_total
-        profit_data = profit_map.get(
-            periodo, {"price_total": Decimal("0"), "cost_total": Decimal("0")}
-        )
-        profit = profit_data["price_total"] - profit_data["cost_total"]
-        mensual.append(
-            {
-                "periodo": periodo.strftime("%b"),
-                "ventas": sales_total,
-                "utilidad": profit,
-                "price_total": profit_data["price_total"],
-                "cost_total": profit_data["cost_total"],
-                "profit_total": profit,
-            }
-        )
 
-    # Todos: por año
-    todos_profit_qs = (
-        detalles_profit.annotate(periodo=TruncYear("venta__fecha", tzinfo=tz))
-        .values("periodo")
-        .annotate(
-            price_total=Coalesce(Sum("subtotal"), Decimal("0")),
-            cost_total=Coalesce(Sum(cost_expr), Decimal("0")),
-        )
-        .order_by("periodo")
-    )
-    todos = []
-    profit_map = {d["periodo"]: d for d in todos_profit_qs}
-    todos_cash_new = _aggregate_cash_period(
-        cash_new_qs, TruncYear("venta__fecha", tzinfo=tz), condition="new"
-    )
-    todos_cash_used = _aggregate_cash_period(
-        cash_used_qs, TruncYear("venta__fecha", tzinfo=tz), condition="used"
-    )
-    todos_credit_new, todos_credit_used = _aggregate_credit_period(
-        TruncYear("fecha", tzinfo=tz)
-    )
-    all_year_keys = sorted(
-        set(todos_cash_new)
-        | set(todos_cash_used)
-        | set(todos_credit_new)
-        | set(todos_credit_used)
-        | set(profit_map)
-    )
-    for periodo in all_year_keys:
-        new_total = todos_cash_new.get(periodo, Decimal("0")) + todos_credit_new.get(
-            periodo, Decimal("0")
-        )
-        used_total = todos_cash_used.get(periodo, Decimal("0")) + todos_credit_used.get(
-            periodo, Decimal("0")
-        )
-        if section == "new":
-            sales_total = new_total
-        elif section == "used":
-            sales_total = used_total
-        else:
-            sales_total = new_total + used_total
-        profit_data = profit_map.get(
-            periodo, {"price_total": Decimal("0"), "cost_total": Decimal("0")}
-        )
-        profit = profit_data["price_total"] - profit_data["cost_total"]
-        todos.append(
-            {
-                "periodo": periodo.year,
-                "ventas": sales_total,
-                "utilidad": profit,
-                "price_total": profit_data["price_total"],
-                "cost_total": profit_data["cost_total"],
-                "profit_total": profit,
-            }
-        )
+@api_view(["GET"])
+def reportes_dashboard_top_products(request):
+    return _dashboard_part(request, "top_products")
 
-    sales_chart = {
-        "diario": diario,
-        "quincenal": quincenal,
-        "mensual": mensual,
-        "todos": todos,
-    }
 
-    # Recent sales
-    ventas_qs = models.Ventas.objects.select_related("cliente")
-    if prod_cond:
-        ventas_qs = ventas_qs.filter(detalles__producto__condicion=prod_cond).distinct()
-    recent_sales = []
-    for v in ventas_qs.order_by("-fecha")[:5]:
-        customer = (
-            v.cliente.razon_social
-            or v.cliente.nombre
-            if v.cliente
-            else "Sin cliente"
-        )
-        recent_sales.append(
-            {
-                "id": v.id,
-                "customer": customer,
-                "amount": v.total,
-                "status": v.estado,
-            }
-        )
+@api_view(["GET"])
+def reportes_dashboard_recent(request):
+    return _dashboard_part(request, "recent")
 
-    # Low stock items
-    if section == "all":
-        low_stock_qs = models.Productos.objects.filter(
-            stock__lte=F("stock_minimo"), condicion="new"
-        ).order_by("stock")[:5]
-    else:
-        low_stock_qs = models.Productos.objects.filter(
-            stock__lte=F("stock_minimo"), **product_filter
-        ).order_by("stock")[:5]
-    low_stock_items = [
-        {"name": p.nombre, "stock": p.stock, "min": p.stock_minimo}
-        for p in low_stock_qs
-    ]
 
-    # Category data
-    if prod_cond:
-        category_qs = (
-            models.Categorias.objects.annotate(
-                value=Count("productos", filter=Q(productos__condicion=prod_cond))
-            )
-            .filter(value__gt=0)
-            .order_by("-value")
-        )
-    else:
-        category_qs = (
-            models.Categorias.objects.annotate(value=Count("productos"))
-            .filter(value__gt=0)
-            .order_by("-value")
-        )
-    category_data = [
-        {"name": c.nombre, "value": c.value} for c in category_qs
-    ]
-
-    # Top products
-    base_detalles_top = detalles_sales
-    if section == "all":
-        base_detalles_top = detalles_sales.filter(producto__condicion="new")
-    top_qs = (
-        base_detalles_top.values(
-            "producto_id", "producto_nombre_snapshot", "producto__nombre"
-        )
-        .annotate(
-            ventas=Coalesce(Sum("cantidad"), Decimal("0")),
-            ingresos=Coalesce(Sum("subtotal"), Decimal("0")),
-        )
-        .order_by("-ventas")[:5]
+@api_view(["GET"])
+def reportes_productos_velocidad(request):
+    """Units sold per day by product over whole months, from the product counters."""
+    today = timezone.localdate()
+    try:
+        hasta = date.fromisoformat(request.GET["hasta"]) if request.GET.get("hasta") else today
+        desde = (
+            date.fromisoformat(request.GET["desde"])
+            if request.GET.get("desde")
+            else (hasta.replace(day=1) - timedelta(days=62)).replace(day=1)
+        )
+        producto_id = int(request.GET["producto"]) if request.GET.get("producto") else None
+        limit = int(request.GET.get("limit", 20))
+    except ValueError:
+        return Response({"detail": "Parámetros inválidos"}, status=400)
+    if desde > hasta:
+        return Response({"detail": "Rango inválido"}, status=400)
+    section = request.GET.get("section", "all")
+    condiciones = (section,) if section in ("new", "used") else ("new", "used")
+    return Response(
+        product_sales.velocity(desde, hasta, condiciones, producto_id, max(1, min(limit, 100)))
     )
-    top_products = [
-        {
-            "nombre": t["producto_nombre_snapshot"] or t["producto__nombre"],
-            "ventas": t["ventas"],
-            "ingresos": t["ingresos"],
-        }
-        for t in top_qs
-    ]
-
-    data = {
-        "stats": stats,
-        "sales_chart": sales_chart,
-        "recent_sales": recent_sales,
-        "low_stock_items": low_stock_items,
-        "category_data": category_data,
-        "top_products": top_products,
-    }
-
-    return Response(data)
 
 
 class ClientesViewSet(viewsets.ModelViewSet):
@@ -2117,11 +1258,7 @@ class ClientesViewSet(viewsets.ModelViewSet):
 
     def get_queryset(self):
         try:
-            qs = (
-                self.queryset.annotate(
-                    ultima_compra=Coalesce("fecha_ultima_compra", Max("ventas__fecha"))
-                ).order_by("-id")
-            )
+            qs = self.queryset.order_by("-id")
             q = self.request.query_params.get("q")
             if q:
                 qs = qs.filter(
@@ -2413,6 +1550,65 @@ class VentasViewSet(viewsets.ModelViewSet):
             return serializers.VentaDetalleSerializer
         return super().get_serializer_class()
 
+    def perform_create(self, serializer):
+        with transaction.atomic():
+            venta = serializer.save()
+            customers.refresh_stats([venta.cliente_id])
+            # No lines or credit yet: only its cash row is new.
+            movimientos.insert(movimientos.sale_rows([venta]))
+
+    def perform_update(self, serializer):
+        before = (serializer.instance.cliente_id, serializer.instance.estado, serializer.instance.fecha)
+        total = serializer.instance.total
+        with transaction.atomic():
+            venta = serializer.save()
+            if (venta.cliente_id, venta.estado, venta.fecha) != before:
+                customers.refresh_stats([before[0], venta.cliente_id])
+            if venta.fecha != before[2]:
+                rollup.rebuild_days([before[2], venta.fecha])
+                product_sales.rebuild_months([before[2], venta.fecha], self._product_ids(venta.id))
+            if (venta.cliente_id, venta.fecha, venta.total) != (before[0], before[2], total):
+                # Its refunds carry the sale's customer.
+                movimientos.rebuild_days(
+                    [before[2], venta.fecha]
+                    + list(
+                        models.Devoluciones.objects.filter(venta_id=venta.id).values_list(
+                            "fecha", flat=True
+                        )
+                    )
+                )
+
+    def perform_destroy(self, instance):
+        with transaction.atomic():
+            cliente_id = instance.cliente_id
+            # Refunds keep their rows but lose the sale; recompute their days too.
+            fechas = [instance.fecha] + list(
+                models.Devoluciones.objects.filter(venta_id=instance.id).values_list(
+                    "fecha", flat=True
+                )
+            )
+            # Payments of its credits are listed under their first sale, which
+            # may be this one.
+            pagos = list(
+                models.PagosCredito.objects.filter(
+                    credito__historial__venta_id=instance.id
+                )
+                .distinct()
+                .values_list("fecha", flat=True)
+            )
+            productos = self._product_ids(instance.id)
+            instance.delete()
+            customers.refresh_stats([cliente_id])
+            rollup.rebuild_days(fechas)
+            product_sales.rebuild_months([instance.fecha], productos)
+            movimientos.rebuild_days(fechas + pagos)
+
+    @staticmethod
+    def _product_ids(venta_id):
+        return list(
+            models.DetalleVenta.objects.filter(venta_id=venta_id).values_list("producto_id", flat=True)
+        )
+
 
 class VentaItemsAPIView(ListAPIView):
     serializer_class = serializers.VentaItemSerializer
@@ -2426,6 +1622,35 @@ class DetalleVentaViewSet(viewsets.ModelViewSet):
     queryset = models.DetalleVenta.objects.all()
     serializer_class = serializers.DetalleVentaSerializer
 
+    # Lines feed the daily rollup and the product counters; edits recompute
+    # the day and month of their sale, like VentasViewSet.
+    def perform_create(self, serializer):
+        with transaction.atomic():
+            detalle = serializer.save()
+            self._rebuild([(detalle.venta_id, detalle.producto_id)])
+
+    def perform_update(self, serializer):
+        before = (serializer.instance.venta_id, serializer.instance.producto_id)
+        with transaction.atomic():
+            detalle = serializer.save()
+            self._rebuild([before, (detalle.venta_id, detalle.producto_id)])
+
+    def perform_destroy(self, instance):
+        with transaction.atomic():
+            keys = [(instance.venta_id, instance.producto_id)]
+            instance.delete()
+            self._rebuild(keys)
+
+    @staticmethod
+    def _rebuild(keys):
+        fechas = list(
+            models.Ventas.objects.filter(id__in={venta_id for venta_id, _ in keys}).values_list(
+                "fecha", flat=True
+            )
+        )
+        rollup.rebuild_days(fechas)
+        product_sales.rebuild_months(fechas, [producto_id for _, producto_id in keys])
+
 
 class CreditosViewSet(viewsets.ModelViewSet):
     queryset = (
@@ -2468,11 +1693,91 @@ class CreditosHistorialComprasViewSet(viewsets.ModelViewSet):
     queryset = models.CreditosHistorialCompras.objects.all()
     serializer_class = serializers.CreditosHistorialComprasSerializer
 
+    # Charging a sale to a credit moves the sale and its refunds between the
+    # cash and credit channels, and changes the sale the credit's payments
+    # are listed under; edits recompute those days.
+    def perform_create(self, serializer):
+        with transaction.atomic():
+            row = serializer.save()
+            self._rebuild([row.venta_id], [row.credito_id])
+
+    def perform_update(self, serializer):
+        before = (serializer.instance.venta_id, serializer.instance.credito_id)
+        with transaction.atomic():
+            row = serializer.save()
+            self._rebuild([before[0], row.venta_id], [before[1], row.credito_id])
+
+    def perform_destroy(self, instance):
+        with transaction.atomic():
+            venta_id, credito_id = instance.venta_id, instance.credito_id
+            instance.delete()
+            self._rebuild([venta_id], [credito_id])
+
+    @staticmethod
+    def _rebuild(venta_ids, credito_ids):
+        fechas = list(
+            models.Ventas.objects.filter(id__in=venta_ids).values_list("fecha", flat=True)
+        ) + list(
+            models.Devoluciones.objects.filter(venta_id__in=venta_ids).values_list("fecha", flat=True)
+        )
+        pagos = list(
+            models.PagosCredito.objects.filter(credito_id__in=credito_ids).values_list(
+                "fecha", flat=True
+            )
+        )
+        rollup.rebuild_days(fechas)
+        movimientos.rebuild_days(fechas + pagos)
+
 
 class PagosCreditoViewSet(viewsets.ModelViewSet):
     queryset = models.PagosCredito.objects.all()
     serializer_class = serializers.PagosCreditoSerializer
 
+    # Like the create path (PagosCreditoSerializer), edits lock the credits
+    # involved and keep their pagado/saldo/estado in step with the payment.
+    def perform_update(self, serializer):
+        locking.run_atomic("pagos_credito", self._update_locked, serializer)
+
+    def _update_locked(self, serializer):
+        before = models.PagosCredito.objects.values("credito_id", "monto", "fecha").get(
+            id=serializer.instance.id
+        )
+        nuevo = serializer.validated_data.get("credito")
+        credito_ids = [before["credito_id"], nuevo.id if nuevo else before["credito_id"]]
+        creditos = locking.lock_rows("pagos_credito", [(models.Creditos, credito_ids)])[
+            models.Creditos
+        ]
+        pago = serializer.save()
+        if (pago.credito_id, pago.monto) != (before["credito_id"], before["monto"]):
+            rollup.assign_splits([pago], rollup.credit_splits(creditos.values()))
+            pago.save(update_fields=["monto_usado"])
+            now = timezone.now()
+            credits.apply_payment(creditos[before["credito_id"]], -before["monto"], now)
+            credits.apply_payment(creditos[pago.credito_id], pago.monto, now)
+            for credito in creditos.values():
+                credito.save(update_fields=credits.PAYMENT_FIELDS)
+        if (pago.credito_id, pago.monto, pago.fecha) != (
+            before["credito_id"],
+            before["monto"],
+            before["fecha"],
+        ):
+            rollup.rebuild_days([before["fecha"], pago.fecha])
+            movimientos.rebuild_days([before["fecha"], pago.fecha])
+
+    def perform_destroy(self, instance):
+        locking.run_atomic("pagos_credito", self._destroy_locked, instance.id)
+
+    def _destroy_locked(self, pago_id):
+        pago = models.PagosCredito.objects.get(id=pago_id)
+        credito = locking.lock_rows("pagos_credito", [(models.Creditos, [pago.credito_id])])[
+            models.Creditos
+        ][pago.credito_id]
+        models.PagosCredito.objects.filter(id=pago_id).delete()
+        credits.apply_payment(credito, -pago.monto, timezone.now())
+        credito.save(update_fields=credits.PAYMENT_FIELDS)
+        rollup.rebuild_days([pago.fecha])
+        movimientos.rebuild_days([pago.fecha])
+
 
 class DeudoresListAPIView(ListAPIView):
     permission_classes = [AllowAny]
@@ -2597,283 +1902,212 @@ class DevolucionesViewSet(viewsets.ModelViewSet):
     queryset = models.Devoluciones.objects.all()
     serializer_class = serializers.DevolucionesSerializer
 
-    def create(self, request, *args, **kwargs):
+    def _parse_request(self, request):
         venta_id = request.data.get("venta_id")
         items = request.data.get("items") or []
         if not venta_id:
-            return Response({"detail": "venta_id requerido"}, status=400)
+            raise refunds.RefundError("venta_id requerido")
+        try:
+            venta_id = int(venta_id)
+        except (TypeError, ValueError):
+            raise refunds.RefundError("venta_id inválido")
         if not isinstance(items, list) or not items:
-            return Response({"detail": "Se requieren items"}, status=400)
+            raise refunds.RefundError("Se requieren items")
+        return venta_id, refunds.parse_items(items)
 
+    def create(self, request, *args, **kwargs):
         now = timezone.now()
+        timer = timing.Timer("devoluciones_create")
 
         try:
-            with transaction.atomic():
-                try:
-                    venta = models.Ventas.objects.select_for_update().get(
-                        id=venta_id
-                    )
-                except models.Ventas.DoesNotExist:
-                    return Response({"detail": "Venta no encontrada"}, status=404)
-
-                parsed_items = []
-                detalle_ids = []
-                for raw in items:
-                    detalle_id = raw.get("detalle_id") or raw.get("detalle")
-                    qty_raw = raw.get("qty") or raw.get("cantidad")
-                    motivo = raw.get("motivo")
-                    if not detalle_id:
-                        return Response({"detail": "detalle_id requerido"}, status=400)
-                    try:
-                        qty = Decimal(str(qty_raw))
-                    except Exception:
-                        return Response({"detail": "Cantidad inválida"}, status=400)
-                    qty = qty.quantize(Decimal("0.001"), rounding=ROUND_HALF_UP)
-                    if qty <= 0:
-                        return Response({"detail": "Cantidad debe ser positiva"}, status=400)
-                    parsed_items.append({
-                        "detalle_id": detalle_id,
-                        "qty": qty,
-                        "motivo": motivo,
-                    })
-                    detalle_ids.append(detalle_id)
-
-                detalles_map = {
-                    det.id: det
-                    for det in models.DetalleVenta.objects.select_for_update()
-                    .filter(venta_id=venta_id, id__in=detalle_ids)
-                }
-
-                producto_ids = {
-                    det.producto_id
-                    for det in detalles_map.values()
-                    if det.producto_id
-                }
-                productos_map = {}
-                if producto_ids:
-                    productos_map = {
-                        prod.id: prod
-                        for prod in models.Productos.objects.select_for_update()
-                        .filter(id__in=producto_ids)
-                    }
-
-                credit_hist = (
-                    models.CreditosHistorialCompras.objects.select_related("credito")
-                    .filter(venta_id=venta_id)
-                    .order_by("id")
-                    .first()
-                )
-                credito = None
-                if credit_hist:
-                    credito = (
-                        models.Creditos.objects.select_for_update()
-                        .get(id=credit_hist.credito_id)
-                    )
+            venta_id, parsed_items = self._parse_request(request)
+            timer.lap("parse")
+            response = locking.run_atomic(
+                "devoluciones_create", self._apply_refund, venta_id, parsed_items, now, timer
+            )
+            timer.lap("commit")
+            return timer.finish(response)
+        except refunds.RefundError as exc:
+            return Response(exc.as_dict(), status=exc.status)
+        except DataError as exc:
+            return Response({"detail": str(exc)}, status=400)
 
-                processed = []
-                total_refund = Decimal("0")
-
-                for parsed in parsed_items:
-                    detalle_id = parsed["detalle_id"]
-                    detalle = detalles_map.get(detalle_id)
-                    if not detalle:
-                        return Response(
-                            {
-                                "detail": f"Detalle {detalle_id} no pertenece a la venta"
-                            },
-                            status=404,
-                        )
-                    qty = parsed["qty"]
-                    motivo = parsed["motivo"]
-                    producto = (
-                        productos_map.get(detalle.producto_id)
-                        if detalle.producto_id
-                        else None
-                    )
+    # Refunds also move the sale, its lines, the credit and the summaries;
+    # only ``create`` keeps those in step, so refunds are not edited or deleted.
+    def update(self, request, *args, **kwargs):
+        return Response({"detail": "Las devoluciones no se pueden modificar"}, status=405)
 
-                    disponible = detalle.cantidad - (detalle.devuelto or Decimal("0"))
-                    if qty > disponible:
-                        return Response(
-                            {
-                                "detail": "Cantidad supera disponible",
-                                "detalle_id": detalle_id,
-                                "disponible": float(disponible),
-                            },
-                            status=400,
-                        )
+    def destroy(self, request, *args, **kwargs):
+        return Response({"detail": "Las devoluciones no se pueden eliminar"}, status=405)
 
-                    line_total = (qty * detalle.precio_unitario).quantize(
-                        Decimal("0.01"), rounding=ROUND_HALF_UP
-                    )
-                    processed.append(
-                        {
-                            "detalle": detalle,
-                            "producto": producto,
-                            "qty": qty,
-                            "motivo": motivo,
-                            "total": line_total,
-                        }
-                    )
-                    total_refund += line_total
-
-                prev_applied = models.Devoluciones.objects.filter(
-                    venta_id=venta_id
-                ).aggregate(total=Coalesce(Sum("ingreso_afectado"), Decimal("0")))[
-                    "total"
-                ] or Decimal("0")
-
-                income_to_allocate = total_refund
-                pagos_total = Decimal("0")
-                if credito:
-                    pagos_total = (
-                        models.PagosCredito.objects.filter(credito_id=credito.id)
-                        .aggregate(total=Coalesce(Sum("monto"), Decimal("0")))["total"]
-                        or Decimal("0")
-                    )
-                    disponible_ingreso = max(pagos_total - prev_applied, Decimal("0"))
-                    income_to_allocate = min(disponible_ingreso, total_refund)
-
-                allocated = []
-                remaining_income = income_to_allocate
-                item_count = len(processed)
-                for idx, item in enumerate(processed):
-                    detalle = item["detalle"]
-                    line_income = Decimal("0")
-                    if income_to_allocate > 0:
-                        if credito:
-                            if item_count == 1 or idx == item_count - 1:
-                                line_income = remaining_income
-                            elif total_refund > 0:
-                                line_income = (
-                                    income_to_allocate
-                                    * item["total"]
-                                    / total_refund
-                                ).quantize(Decimal("0.01"), rounding=ROUND_HALF_UP)
-                            remaining_income -= line_income
-                            if remaining_income < Decimal("0"):
-                                remaining_income = Decimal("0")
-                        else:
-                            line_income = item["total"]
-
-                    allocated.append(
-                        {
-                            "detalle": detalle,
-                            "producto": item["producto"],
-                            "qty": item["qty"],
-                            "motivo": item["motivo"],
-                            "total": item["total"],
-                            "ingreso": max(line_income, Decimal("0")),
-                        }
-                    )
+    def _apply_refund(self, venta_id, parsed_items, now, timer):
+        """Transaction body of ``create``; re-run from scratch on retry."""
+        credito_id = refunds.credit_id_for(venta_id)
+        locked = locking.lock_rows(
+            "devoluciones_create",
+            [
+                (models.Ventas, [venta_id]),
+                (models.DetalleVenta, [item["detalle_id"] for item in parsed_items]),
+                (models.Creditos, [credito_id]),
+            ],
+        )
+        venta = locked[models.Ventas].get(venta_id)
+        if venta is None:
+            raise refunds.RefundError("Venta no encontrada", status=404)
+        detalles_map = {
+            det.id: det for det in locked[models.DetalleVenta].values() if det.venta_id == venta_id
+        }
+        credito = locked[models.Creditos].get(credito_id)
+        timer.lap("locks")
+
+        processed, total_refund = refunds.price_lines(parsed_items, detalles_map)
+        # Running totals kept by checkout, payments and refunds; see
+        # the verificar_totales command.
+        income_to_allocate, allocated = refunds.allocate_income(
+            processed, total_refund, credito
+        )
+        productos_map = pricing.get_products(
+            det.producto_id for det in detalles_map.values() if det.producto_id
+        )
+        timer.lap("calculo")
+
+        created = models.Devoluciones.objects.bulk_create(
+            refunds.build_refund_rows(venta_id, allocated, productos_map, now)
+        )
+        refunds.increment_devuelto(allocated, now)
+        venta.devuelto_total += total_refund
+        venta.ingreso_revertido += income_to_allocate
+        venta.updated_at = now
+        venta.save(update_fields=["devuelto_total", "ingreso_revertido", "updated_at"])
+        timer.lap("devoluciones")
+
+        if credito:
+            nuevo_total = max(credito.total_deuda - total_refund, Decimal("0"))
+            nuevo_pagado = max(credito.pagado - income_to_allocate, Decimal("0"))
+            nuevo_saldo = max(nuevo_total - nuevo_pagado, Decimal("0"))
+            credito.total_deuda = nuevo_total
+            credito.pagado = nuevo_pagado
+            credito.saldo = nuevo_saldo
+            credito.estado = "pagado" if nuevo_saldo == 0 else "pendiente"
+            credito.devuelto_total += total_refund
+            credito.ingreso_revertido += income_to_allocate
+            nuevo, usado = rollup.line_splits(created, amount="total").get(
+                venta_id, (Decimal("0"), Decimal("0"))
+            )
+            credito.monto_nuevo = max(credito.monto_nuevo - nuevo, Decimal("0"))
+            credito.monto_usado = max(credito.monto_usado - usado, Decimal("0"))
+            credito.updated_at = now
+            credito.save(
+                update_fields=[
+                    "total_deuda",
+                    "pagado",
+                    "saldo",
+                    "estado",
+                    "devuelto_total",
+                    "ingreso_revertido",
+                    "monto_nuevo",
+                    "monto_usado",
+                    "updated_at",
+                ]
+            )
 
-                created = []
-                for info in allocated:
-                    detalle = info["detalle"]
-                    qty = info["qty"]
-                    motivo = info["motivo"]
-                    line_total = info["total"]
-                    ingreso = info["ingreso"]
-                    producto = info.get("producto")
-
-                    producto_id = detalle.producto_id if detalle.producto_id else None
-
-                    devolucion = models.Devoluciones.objects.create(
-                        fecha=now,
-                        producto_id=producto_id,
-                        venta_id=venta_id,
-                        detalle_venta_id=detalle.id,
-                        cantidad=qty,
-                        precio_unitario=detalle.precio_unitario,
-                        total=line_total,
-                        motivo=motivo,
-                        ingreso_afectado=ingreso,
-                        producto_codigo_snapshot=detalle.producto_codigo_snapshot
-                        or (producto.codigo if producto else None),
-                        producto_nombre_snapshot=detalle.producto_nombre_snapshot
-                        or (producto.nombre if producto else None),
-                        producto_costo_snapshot=detalle.producto_costo_snapshot
-                        or (producto.costo if producto else None),
-                        producto_condicion_snapshot=detalle.producto_condicion_snapshot
-                        or (producto.condicion if producto else None),
-                        producto_categoria_id_snapshot=detalle.producto_categoria_id_snapshot
-                        or (
-                            producto.categoria_id if producto else None
-                        ),
-                        producto_categoria_nombre_snapshot=detalle.producto_categoria_nombre_snapshot
-                        or (
-                            producto.categoria.nombre
-                            if producto and producto.categoria
-                            else None
-                        ),
-                        created_at=now,
-                        updated_at=now,
-                    )
-                    created.append(devolucion)
+            models.CreditosHistorialCompras.objects.create(
+                credito=credito,
+                venta_id=venta_id,
+                fecha=now,
+                monto=-total_refund,
+                pagado=-income_to_allocate,
+                saldo=credito.saldo,
+                estado=credito.estado,
+                created_at=now,
+                updated_at=now,
+            )
+            timer.lap("credito")
 
-                    models.DetalleVenta.objects.filter(id=detalle.id).update(
-                        devuelto=F("devuelto") + qty,
-                        updated_at=now,
-                    )
+        deltas = rollup.new_deltas()
+        rollup.add_refunds(deltas, created, credit=credito is not None)
+        rollup.apply(deltas, now)
+        productos = product_sales.new_deltas()
+        product_sales.add_refunds(productos, created)
+        product_sales.apply(productos, now)
+        movimientos.insert([movimientos.refund_row(venta, created)])
+        timer.lap("resumen")
 
-                    if producto_id:
-                        models.Productos.objects.filter(id=producto_id).update(
-                            stock=F("stock") + qty,
-                            updated_at=now,
-                        )
+        return Response(
+            {
+                "ok": True,
+                "venta_id": venta_id,
+                "total_refund": float(total_refund),
+                "ingreso_afectado": float(income_to_allocate),
+                "items": [
+                    {
+                        "devolucion_id": dev.id,
+                        "detalle_id": dev.detalle_venta_id,
+                        "cantidad": float(dev.cantidad),
+                        "total": float(dev.total),
+                    }
+                    for dev in created
+                ],
+            },
+            status=201,
+        )
 
-                if credito:
-                    nuevo_total = max(credito.total_deuda - total_refund, Decimal("0"))
-                    nuevo_pagado = max(credito.pagado - income_to_allocate, Decimal("0"))
-                    nuevo_saldo = max(nuevo_total - nuevo_pagado, Decimal("0"))
-                    credito.total_deuda = nuevo_total
-                    credito.pagado = nuevo_pagado
-                    credito.saldo = nuevo_saldo
-                    credito.estado = "pagado" if nuevo_saldo == 0 else "pendiente"
-                    credito.updated_at = now
-                    credito.save(
-                        update_fields=[
-                            "total_deuda",
-                            "pagado",
-                            "saldo",
-                            "estado",
-                            "updated_at",
-                        ]
-                    )
+    @action(detail=False, methods=["post"])
+    def preview(self, request):
+        """Dry run of ``create``: same validation and split, no writes, no locks.
 
-                    models.CreditosHistorialCompras.objects.create(
-                        credito=credito,
-                        venta_id=venta_id,
-                        fecha=now,
-                        monto=-total_refund,
-                        pagado=-income_to_allocate,
-                        saldo=credito.saldo,
-                        estado=credito.estado,
-                        created_at=now,
-                        updated_at=now,
-                    )
+        Reads run in one REPEATABLE READ, READ ONLY transaction so the sale,
+        its lines and the credit come from a single snapshot; inside an
+        enclosing transaction they use that transaction's snapshot.
+        """
+        try:
+            venta_id, parsed_items = self._parse_request(request)
+            outermost = not connection.in_atomic_block
+            with transaction.atomic():
+                if outermost:
+                    with connection.cursor() as cursor:
+                        cursor.execute("SET TRANSACTION ISOLATION LEVEL REPEATABLE READ, READ ONLY")
+                venta = models.Ventas.objects.filter(id=venta_id).first()
+                if venta is None:
+                    return Response({"detail": "Venta no encontrada"}, status=404)
+                detalles_map = refunds.load_lines(venta_id, parsed_items, lock=False)
+                credito = refunds.find_credit(venta_id, lock=False)
+            processed, total_refund = refunds.price_lines(parsed_items, detalles_map)
+            income_to_allocate, allocated = refunds.allocate_income(
+                processed, total_refund, credito
+            )
+        except refunds.RefundError as exc:
+            return Response(exc.as_dict(), status=exc.status)
 
-                return Response(
+        return Response(
+            {
+                "venta_id": venta.id,
+                "credito_id": credito.id if credito else None,
+                "total_refund": float(total_refund),
+                "ingreso_afectado": float(income_to_allocate),
+                "items": [
                     {
-                        "ok": True,
-                        "venta_id": venta_id,
-                        "total_refund": float(total_refund),
-                        "ingreso_afectado": float(income_to_allocate),
-                        "items": [
-                            {
-                                "devolucion_id": dev.id,
-                                "detalle_id": dev.detalle_venta_id,
-                                "cantidad": float(dev.cantidad),
-                                "total": float(dev.total),
-                            }
-                            for dev in created
-                        ],
-                    },
-                    status=201,
-                )
-        except DataError as exc:
-            transaction.set_rollback(True)
-            return Response({"detail": str(exc)}, status=400)
+                        "detalle_id": info["detalle"].id,
+                        "cantidad": float(info["qty"]),
+                        "precio_unitario": float(info["detalle"].precio_unitario),
+                        "total": float(info["total"]),
+                        "ingreso_afectado": float(info["ingreso"]),
+                        "motivo": info["motivo"],
+                    }
+                    for info in allocated
+                ],
+            }
+        )
+
 
+def _override_owner(request) -> str:
+    """Who an override token belongs to: the user, or the session when anonymous."""
+    user = getattr(request, "user", None)
+    if user is not None and user.is_authenticated:
+        return f"user:{user.pk}"
+    if not request.session.session_key:
+        request.session.save()
+    return f"session:{request.session.session_key}"
 
 
 class ValidateOverrideCodeView(APIView):
@@ -2911,7 +2145,8 @@ class ValidateOverrideCodeView(APIView):
             )
         if constant_time_compare(code, settings.PRICE_OVERRIDE_CODE):
             cache.delete(key)
-            return Response({"ok": True, "attempts_left": max_attempts})
+            token = pricing.issue_override_token(_override_owner(request))
+            return Response({"ok": True, "attempts_left": max_attempts, "override_token": token})
         attempts += 1
         if attempts >= max_attempts:
             until = now + ttl
@@ -2930,99 +2165,292 @@ class ValidateOverrideCodeView(APIView):
 @api_view(["POST"])
 @parser_classes([JSONParser])
 def pos_checkout(request):
+    timer = timing.Timer("pos_checkout")
     d = request.data
     now = timezone.now()
-    is_credit = d["saleType"] == "CREDIT"
-    tot = Decimal(str(d["totals"]["total"]))
-    paid = Decimal(str(d.get("paidAmount", 0)))
-    cust_id = d.get("customerId") or None
-
-    if cust_id and not models.Clientes.objects.filter(id=cust_id).exists():
-        return Response({"detail": "Cliente no existe"}, status=400)
-
-    method = PAYMENT_METHOD_MAP[d["paymentMethod"]]
-
-    if is_credit:
-        if not cust_id:
-            return Response({"detail": "Cliente requerido para crédito"}, status=400)
-        if not (Decimal("0") <= paid <= tot):
-            return Response({"detail": "Abono inválido"}, status=400)
-    else:
-        if method == "efectivo" and paid < tot:
-            return Response({"detail": "Efectivo debe cubrir total"}, status=400)
-        if method != "efectivo" and paid != tot:
-            return Response({"detail": "Pago debe cubrir total"}, status=400)
 
-    items = d.get("items", [])
-    if not items or tot <= 0:
-        return Response({"detail": "La venta debe tener items y total mayor a 0"}, status=400)
+    idem_key = idempotency.get_key(request)
+    idem_hash = checkout.request_fingerprint(d) if idem_key else None
+    if idem_key:
+        replay = idempotency.lookup(checkout.IDEMPOTENCY_SCOPE, idem_key, idem_hash, now)
+        if replay is not None:
+            return replay
+        timer.lap("idempotency")
 
     try:
-        with transaction.atomic():
-            venta = models.Ventas.objects.create(
-                fecha=now,
-                cliente_id=cust_id,
-                total=tot,
-                estado="completada",
-                metodo_pago=method,
-                created_at=now,
-                updated_at=now,
-            )
+        sale = checkout.parse_sale(d, now)
+        timer.lap("parse")
+        products = pricing.get_products(line["product_id"] for line in sale["lines"])
+        timer.lap("catalogo")
+        customers = checkout.known_customer_ids([sale["customer_id"]])
+        timer.lap("cliente")
+        owner = _override_owner(request)
+        # Offline sales are priced and authorized as of their soldAt.
+        granted = pricing.override_token_valid(sale["override_token"], owner, sale["fecha"])
+        sale = checkout.price_sale(sale, products, customers, granted)
+        timer.lap("precios")
+    except checkout.CheckoutError as exc:
+        return Response(exc.as_dict(), status=exc.status)
+
+    if idem_key:
+        sale["idempotency_key"] = idem_key
+        sale["request_hash"] = idem_hash
+
+    spent = None
+    if sale["has_override"]:
+        spent = pricing.spend_override_token(sale["override_token"], owner, sale["fecha"])
+    if sale["has_override"] and spent is None:
+        if idem_key:
+            # A retry of this sale already spent the token.
+            replay = idempotency.lookup(checkout.IDEMPOTENCY_SCOPE, idem_key, idem_hash, now)
+            if replay is not None:
+                return replay
+        return Response({"detail": "Cambio de precio no autorizado"}, status=403)
+
+    committed = False
+    try:
+        checkout.assign_document_numbers([sale])
+        timer.lap("numeracion")
+        (venta,) = locking.run_atomic(
+            "pos_checkout", checkout.write_sales, [sale], products, now, timer
+        )
+        committed = True
+        timer.lap("commit")
+        return timer.finish(Response(checkout.sale_response(venta), status=201))
+    except IntegrityError as exc:
+        if idem_key:
+            # A concurrent retry with the same key committed first.
+            replay = idempotency.lookup(checkout.IDEMPOTENCY_SCOPE, idem_key, idem_hash, now)
+            if replay is not None:
+                return replay
+        return Response({"detail": str(exc)}, status=400)
+    except DataError as exc:
+        return Response({"detail": str(exc)}, status=400)
+    finally:
+        if spent and not committed:
+            pricing.restore_override_token(sale["override_token"], spent)
 
-            for it in items:
-                qty = Decimal(str(it["qty"]))
-                price = Decimal(str(it["unit_price"]))
-                override = bool(it.get("override"))
-                models.DetalleVenta.objects.create(
-                    venta=venta,
-                    producto_id=it["productId"],
-                    cantidad=qty,
-                    precio_unitario=price,
-                    subtotal=qty * price,
-                    fecha_venta=now,
-                    override=override,
-                    created_at=now,
-                    updated_at=now,
-                )
 
-            if is_credit:
-                saldo = tot - paid
-                credito = models.Creditos.objects.create(
-                    cliente_id=cust_id,
-                    total_deuda=tot,
-                    pagado=paid,
-                    saldo=saldo,
-                    fecha_ultima_compra=now,
-                    estado="pendiente",
-                    observaciones=d.get("observaciones"),
-                    created_at=now,
-                    updated_at=now,
-                )
-                models.CreditosHistorialCompras.objects.create(
-                    credito=credito,
-                    venta=venta,
-                    fecha=now,
-                    monto=tot,
-                    pagado=paid,
-                    saldo=saldo,
-                    estado="pendiente",
-                    created_at=now,
-                    updated_at=now,
+@api_view(["POST"])
+@parser_classes([JSONParser])
+def pos_checkout_batch(request):
+    raw_sales = request.data.get("sales")
+    if not isinstance(raw_sales, list) or not raw_sales:
+        return Response({"detail": "Se requieren ventas"}, status=400)
+    if len(raw_sales) > settings.POS_BATCH_MAX_SALES:
+        return Response(
+            {"detail": f"Máximo {settings.POS_BATCH_MAX_SALES} ventas por lote"}, status=400
+        )
+
+    now = timezone.now()
+    results = [None] * len(raw_sales)
+
+    def _error(idx, exc):
+        results[idx] = {"index": idx, "status": "error", "status_code": exc.status, **exc.as_dict()}
+
+    parsed = []
+    seen_keys = set()
+    for idx, raw in enumerate(raw_sales):
+        try:
+            if not isinstance(raw, dict):
+                raise checkout.CheckoutError("Venta inválida")
+            sale = checkout.parse_sale(raw, now)
+            key = str(raw.get("idempotencyKey") or "").strip()[: idempotency.MAX_KEY_LENGTH]
+            if key:
+                if key in seen_keys:
+                    raise checkout.CheckoutError("Idempotency-Key duplicada en el lote")
+                seen_keys.add(key)
+                sale["idempotency_key"] = key
+                sale["request_hash"] = checkout.request_fingerprint(raw)
+            parsed.append((idx, sale))
+        except checkout.CheckoutError as exc:
+            _error(idx, exc)
+
+    existing = idempotency.find_many(
+        checkout.IDEMPOTENCY_SCOPE, [sale.get("idempotency_key") for _, sale in parsed], now
+    )
+
+    def _replayed(idx, sale):
+        record = existing.get(sale.get("idempotency_key"))
+        if record is None:
+            return False
+        if record.request_hash != sale["request_hash"]:
+            _error(idx, checkout.CheckoutError("Idempotency-Key ya fue usada con otra solicitud", status=422))
+        else:
+            results[idx] = {"index": idx, "status": "replayed", **record.response}
+        return True
+
+    parsed = [(idx, sale) for idx, sale in parsed if not _replayed(idx, sale)]
+
+    products = pricing.get_products(
+        line["product_id"] for _, sale in parsed for line in sale["lines"]
+    )
+    customers = checkout.known_customer_ids(sale["customer_id"] for _, sale in parsed)
+    owner = _override_owner(request)
+    valid = []
+    spent = {}
+    for idx, sale in parsed:
+        try:
+            granted = pricing.override_token_valid(sale["override_token"], owner, sale["fecha"])
+            sale = checkout.price_sale(sale, products, customers, granted)
+            if sale["has_override"]:
+                entry = pricing.spend_override_token(sale["override_token"], owner, sale["fecha"])
+                if entry is None:
+                    raise checkout.CheckoutError("Cambio de precio no autorizado", status=403)
+                spent[idx] = (sale["override_token"], entry)
+            valid.append((idx, sale))
+        except checkout.CheckoutError as exc:
+            _error(idx, exc)
+
+    def _created(idx, venta):
+        results[idx] = {"index": idx, "status": "created", **checkout.sale_response(venta)}
+
+    def _conflict(idx, exc):
+        _error(idx, checkout.CheckoutError(str(exc.detail), status=exc.status_code))
+
+    try:
+        if valid:
+            checkout.assign_document_numbers([sale for _, sale in valid])
+            try:
+                ventas = locking.run_atomic(
+                    "pos_checkout_batch", checkout.write_sales, [sale for _, sale in valid], products, now
                 )
-                if paid > 0:
-                    models.PagosCredito.objects.create(
-                        credito=credito,
-                        fecha=now,
-                        monto=paid,
-                        concepto="Abono inicial",
-                        metodo_pago=method,
-                        created_at=now,
-                        updated_at=now,
-                    )
+                for (idx, _), venta in zip(valid, ventas):
+                    _created(idx, venta)
+            except locking.TransactionConflict as exc:
+                for idx, _ in valid:
+                    _conflict(idx, exc)
+            except (DataError, IntegrityError):
+                # Aislar la venta que falla: reintentar una por una en su propia transacción.
+                for idx, sale in valid:
+                    try:
+                        (venta,) = locking.run_atomic(
+                            "pos_checkout_batch", checkout.write_sales, [sale], products, now
+                        )
+                        _created(idx, venta)
+                    except locking.TransactionConflict as exc:
+                        _conflict(idx, exc)
+                    except (DataError, IntegrityError) as exc:
+                        existing.update(
+                            idempotency.find_many(
+                                checkout.IDEMPOTENCY_SCOPE, [sale.get("idempotency_key")], now
+                            )
+                        )
+                        if not _replayed(idx, sale):
+                            _error(idx, checkout.CheckoutError(str(exc)))
+    finally:
+        # Tokens of sales that were not written can be used again.
+        for idx, (token, entry) in spent.items():
+            if (results[idx] or {}).get("status") != "created":
+                pricing.restore_override_token(token, entry)
+
+    summary = defaultdict(int)
+    for row in results:
+        summary[row["status"]] += 1
+    return Response(
+        {
+            "results": results,
+            "created": summary["created"],
+            "replayed": summary["replayed"],
+            "failed": summary["error"],
+        }
+    )
+
 
-        return Response({"id": venta.id}, status=201)
-    except (DataError, IntegrityError, KeyError) as exc:
+@api_view(["POST"])
+@parser_classes([JSONParser])
+def pos_quote(request):
+    """Price a cart without writing anything.
+
+    Accepts the ``pos/checkout`` payload (only ``items`` is required) and
+    answers from the cached catalog: priced lines, IVA breakdown and total.
+    """
+    timer = timing.Timer("pos_quote")
+    d = request.data
+    items = d.get("items", [])
+    if not isinstance(items, list):
+        return Response({"detail": "Item inválido"}, status=400)
+
+    try:
+        lines = checkout.parse_cart_items(items)
+    except (KeyError, TypeError, ValueError, InvalidOperation):
+        return Response({"detail": "Item inválido"}, status=400)
+    timer.lap("parse")
+
+    products = pricing.get_products(line["product_id"] for line in lines)
+    missing = [line["product_id"] for line in lines if line["product_id"] not in products]
+    if missing:
+        return Response({"detail": f"Producto {missing[0]} no existe"}, status=400)
+    timer.lap("catalogo")
+
+    granted = pricing.override_token_valid(d.get("overrideToken"), _override_owner(request))
+    try:
+        quote = pricing.price_cart(lines, products, override_granted=granted)
+    except pricing.PricingError as exc:
         return Response({"detail": str(exc)}, status=400)
+    iva = pricing.iva_breakdown(quote["total"])
+    body = {
+        "items": [
+            {
+                "productId": line["product_id"],
+                "codigo": products[line["product_id"]]["codigo"],
+                "nombre": products[line["product_id"]]["nombre"],
+                "qty": line["qty"],
+                "precio": line["list_price"],
+                "unit_price": line["unit_price"],
+                "subtotal": line["subtotal"],
+                "override": line["override"],
+            }
+            for line in quote["lines"]
+        ],
+        "subtotal": iva["subtotal"],
+        "iva_porcentaje": iva["iva_porcentaje"],
+        "iva_monto": iva["iva_monto"],
+        "total": quote["total"],
+        "mismatches": quote["mismatches"],
+        "override_authorized": granted,
+    }
+    totals = d.get("totals")
+    if isinstance(totals, dict) and totals.get("total") is not None:
+        try:
+            client_total = Decimal(str(totals["total"]))
+            body["total_ok"] = pricing.totals_match(client_total, quote["total"])
+        except InvalidOperation:
+            body["total_ok"] = False
+    timer.lap("precios")
+    return timer.finish(Response(body))
+
+
+@api_view(["GET"])
+@permission_classes([IsAdminRole])
+def metrics_timings(request):
+    """Per-phase latency percentiles (ms), transaction retry counters and
+    dashboard cache hits kept in memory by this worker."""
+    return Response(
+        {
+            "window": settings.TIMING_WINDOW,
+            "endpoints": timing.snapshot(),
+            "transacciones": locking.snapshot(),
+            "dashboard_cache": dashboard.cache_stats(),
+        }
+    )
+
+
+@api_view(["GET"])
+@permission_classes([IsAdminRole])
+def documentos_gaps(request):
+    """Audit document numbering: issued range and gaps per series."""
+    tipo = request.query_params.get("tipo")
+    serie = request.query_params.get("serie")
+    series = models.DocumentoSerie.objects.order_by("documento_tipo", "serie")
+    if tipo:
+        series = series.filter(documento_tipo=tipo)
+    if serie:
+        series = series.filter(serie=serie)
+    pairs = list(series.values_list("documento_tipo", "serie"))
+    if tipo and serie and not pairs:
+        pairs = [(tipo, serie)]
+    return Response({"results": [numbering.find_gaps(t, s) for t, s in pairs]})
 
 
 class UsuariosViewSet(viewsets.ModelViewSet):
@@ -1,4 +1,5 @@
 from pathlib import Path
+from decimal import Decimal
 import os
 from dotenv import load_dotenv
 
@@ -54,6 +55,7 @@ CORS_ALLOW_HEADERS = [
     'user-agent',
     'x-csrftoken',
     'x-requested-with',
+    'idempotency-key',
 ]
 
 # Si prefieres especificar orígenes manualmente, descomenta esto y comenta la línea anterior:
@@ -69,7 +71,7 @@ CORS_ALLOW_HEADERS = [
 # ]
 
 CORS_ALLOW_CREDENTIALS = True
-CORS_EXPOSE_HEADERS = ["Content-Disposition", "X-Filename"]
+CORS_EXPOSE_HEADERS = ["Content-Disposition", "X-Filename", "Idempotent-Replayed", "Server-Timing", "X-Cache"]
 CSRF_TRUSTED_ORIGINS = [
     "http://localhost:8080",
     "http://127.0.0.1:8080",
@@ -91,6 +93,40 @@ REST_FRAMEWORK = {
 PRICE_OVERRIDE_CODE = os.getenv("PRICE_OVERRIDE_CODE", "123456")
 RATE_LIMIT_OVERRIDE_TTL = int(os.getenv("RATE_LIMIT_OVERRIDE_TTL", "180"))
 RATE_LIMIT_OVERRIDE_MAX_ATTEMPTS = int(os.getenv("RATE_LIMIT_OVERRIDE_MAX_ATTEMPTS", "3"))
+PRICE_OVERRIDE_GRANT_TTL = int(os.getenv("PRICE_OVERRIDE_GRANT_TTL", "1800"))
+IDEMPOTENCY_KEY_TTL = int(os.getenv("IDEMPOTENCY_KEY_TTL", "86400"))
+IDEMPOTENCY_PURGE_INTERVAL = int(os.getenv("IDEMPOTENCY_PURGE_INTERVAL", "300"))
+POS_BATCH_MAX_SALES = int(os.getenv("POS_BATCH_MAX_SALES", "200"))
+# Oldest soldAt (seconds) accepted for a sale queued offline; unspent override
+# tokens stay redeemable that much longer for sales sold inside their grant.
+POS_OFFLINE_MAX_AGE = int(os.getenv("POS_OFFLINE_MAX_AGE", "86400"))
+DOCUMENTO_SERIE = os.getenv("DOCUMENTO_SERIE", "A")
+IVA_PORCENTAJE = Decimal(os.getenv("IVA_PORCENTAJE", "13"))
+DOCUMENTO_BLOCK_SIZE = int(os.getenv("DOCUMENTO_BLOCK_SIZE", "20"))
+TIMING_WINDOW = int(os.getenv("TIMING_WINDOW", "1000"))
+# One rolling Creditos account per customer instead of one row per credit sale.
+CREDITO_CUENTA_UNICA = os.getenv("CREDITO_CUENTA_UNICA", "False") == "True"
+# Write transactions retried on deadlock / serialization failure / lock timeout.
+TX_MAX_RETRIES = int(os.getenv("TX_MAX_RETRIES", "3"))
+TX_RETRY_BASE_MS = int(os.getenv("TX_RETRY_BASE_MS", "20"))
+TX_LOCK_TIMEOUT_MS = int(os.getenv("TX_LOCK_TIMEOUT_MS", "0"))
+# Dashboard payloads are keyed by a sales version bumped on every write; the
+# TTL only bounds how long unused entries stay around.
+DASHBOARD_CACHE_TTL = int(os.getenv("DASHBOARD_CACHE_TTL", "3600"))
+# The split dashboard endpoints cache each part separately; recent sales are
+# the part people watch, so they expire soonest.
+DASHBOARD_CACHE_TTLS = {
+    "dashboard": DASHBOARD_CACHE_TTL,
+    "stats": int(os.getenv("DASHBOARD_STATS_TTL", "900")),
+    "chart": int(os.getenv("DASHBOARD_CHART_TTL", "3600")),
+    "top_products": int(os.getenv("DASHBOARD_TOP_PRODUCTS_TTL", "3600")),
+    "recent": int(os.getenv("DASHBOARD_RECENT_TTL", "60")),
+}
+# Closed-day income totals are dropped by back-dated writes; the TTL only
+# bounds how long an entry outlives its version.
+ROLLUP_CLOSED_CACHE_TTL = int(os.getenv("ROLLUP_CLOSED_CACHE_TTL", "604800"))
+# p95 ceiling (ms) for a cold dashboard request in bench_dashboard.
+DASHBOARD_P95_BUDGET_MS = float(os.getenv("DASHBOARD_P95_BUDGET_MS", "300"))
 
 CACHES = {
     "default": {
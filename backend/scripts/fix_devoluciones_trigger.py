@@ -20,6 +20,12 @@ DECLARE
   v_codigo TEXT; v_nombre TEXT;
   v_cat_id BIGINT; v_cat_nombre TEXT;
 BEGIN
+  -- DevolucionesViewSet.create copia los snapshots de la línea vendida y los
+  -- envía en un INSERT multi-fila; en ese caso no repetimos la búsqueda.
+  IF TG_OP='INSERT' AND NEW.producto_nombre_snapshot IS NOT NULL THEN
+    RETURN NEW;
+  END IF;
+
   IF TG_OP='INSERT' OR NEW.producto_id IS DISTINCT FROM OLD.producto_id THEN
     SELECT p.codigo, p.nombre, p.categoria_id, c.nombre
       INTO v_codigo, v_nombre, v_cat_id, v_cat_nombre
@@ -5,6 +5,13 @@ DECLARE
   v_codigo TEXT; v_nombre TEXT;
   v_cat_id BIGINT; v_cat_nombre TEXT; v_fecha TIMESTAMPTZ;
 BEGIN
+  -- pos_checkout resuelve los snapshots en una sola consulta y los envía en
+  -- un INSERT multi-fila; en ese caso no repetimos la búsqueda por fila.
+  IF TG_OP='INSERT' AND NEW.producto_nombre_snapshot IS NOT NULL
+     AND NEW.fecha_venta IS NOT NULL THEN
+    RETURN NEW;
+  END IF;
+
   IF TG_OP='INSERT' OR NEW.producto_id IS DISTINCT FROM OLD.producto_id THEN
     SELECT p.codigo, p.nombre, p.categoria_id, c.nombre
       INTO v_codigo, v_nombre, v_cat_id, v_cat_nombre
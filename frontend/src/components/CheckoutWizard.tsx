@@ -15,6 +15,8 @@ interface CheckoutWizardProps {
   onClose: () => void;
   items: POSCartItem[];
   total: number;
+  // Sale-scoped price override grant; see NuevaFacturaModal.
+  overrideToken?: string;
   onSuccess?: (saleData?: { id: number; total: number; saleType: string }) => void;
   onCloseParent?: () => void; // Para cerrar el modal padre cuando se muestra la confirmación
 }
@@ -29,7 +31,7 @@ interface CheckoutState {
   reference: string;
 }
 
-export default function CheckoutWizard({ open, onClose, items, total, onSuccess, onCloseParent }: CheckoutWizardProps) {
+export default function CheckoutWizard({ open, onClose, items, total, overrideToken, onSuccess, onCloseParent }: CheckoutWizardProps) {
   const [step, setStep] = useState(1);
   const [state, setState] = useState<CheckoutState>({
     saleType: 'DIRECT',
@@ -115,6 +117,7 @@ export default function CheckoutWizard({ open, onClose, items, total, onSuccess,
         paidAmount: s.paidAmount,
         changeDue: s.changeDue,
         reference: s.reference,
+        overrideToken: items.some(i => i.overridePrice) ? overrideToken : undefined,
       };
       if (s.saleType === 'CREDIT') {
         payload.observaciones = s.reference;
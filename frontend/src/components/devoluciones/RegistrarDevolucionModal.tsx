@@ -43,6 +43,20 @@ interface VentaSearchResult {
   returnable_total: number;
 }
 
+interface DevolucionPreview {
+  venta_id: number;
+  credito_id: number | null;
+  total_refund: number;
+  ingreso_afectado: number;
+  items: {
+    detalle_id: number;
+    cantidad: number;
+    precio_unitario: number;
+    total: number;
+    ingreso_afectado: number;
+  }[];
+}
+
 interface ItemSelectionState {
   qty: number;
   motivo: string;
@@ -163,7 +177,20 @@ export function RegistrarDevolucionModal({ open, onClose, onSuccess }: Registrar
   }, [selectedSale, itemState]);
 
   const selectedCount = selectedItems.length;
-  const refundAmount = selectedItems.reduce((sum, { item, qty }) => sum + qty * item.precio, 0);
+  const previewItems = selectedItems.map(({ item, qty }) => ({ detalle_id: item.detalle_id, qty }));
+
+  // Dry run on the server: same split as the real refund, without locking the sale.
+  const { data: preview } = useQuery<DevolucionPreview>({
+    queryKey: ['devolucion-preview', selectedSale?.id, previewItems],
+    queryFn: () =>
+      api.previewDevolucion({ venta_id: selectedSale?.id, items: previewItems }) as Promise<DevolucionPreview>,
+    enabled: open && !!selectedSale && previewItems.length > 0,
+    staleTime: 10_000,
+    retry: false,
+  });
+
+  const refundAmount =
+    preview?.total_refund ?? selectedItems.reduce((sum, { item, qty }) => sum + qty * item.precio, 0);
 
   const resetSelection = () => {
     setSelectedSale(null);
@@ -278,7 +305,9 @@ export function RegistrarDevolucionModal({ open, onClose, onSuccess }: Registrar
 
   const summaryInfo = selectedSale?.tipo === 'contado'
     ? `Se restará de ingresos ${formatCurrency(refundAmount)}`
-    : 'Se restará de ingresos hasta el monto abonado disponible. Saldo no pagado no afecta ingresos.';
+    : preview
+      ? `Se restará de ingresos ${formatCurrency(preview.ingreso_afectado)}. Saldo no pagado no afecta ingresos.`
+      : 'Se restará de ingresos hasta el monto abonado disponible. Saldo no pagado no afecta ingresos.';
 
   const summaryContent = (
     <div className="space-y-4">
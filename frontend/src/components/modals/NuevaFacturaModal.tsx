@@ -1,5 +1,5 @@
 import { useState, useEffect } from 'react';
-import { api } from '@/lib/api';
+import { api, type PosQuote } from '@/lib/api';
 import type { Producto, Categoria } from '@/types/db';
 import { Button } from '@/components/ui/button';
 import { Input } from '@/components/ui/input';
@@ -33,6 +33,9 @@ interface NuevaFacturaModalProps {
 export default function NuevaFacturaModal({ open, onClose, onSuccess }: NuevaFacturaModalProps) {
   const [searchTerm, setSearchTerm] = useState('');
   const [cart, setCart] = useState<POSCartItem[]>([]);
+  // Single-use token from pos/validate-code. It authorizes every edited price
+  // of this sale, so the cart keeps the latest one instead of one per line.
+  const [overrideToken, setOverrideToken] = useState<string>();
   const [itemType, setItemType] = useState<'producto' | 'servicio' | 'all'>('all');
   const [selectedCategories, setSelectedCategories] = useState<number[]>([]);
   const [showCategoryModal, setShowCategoryModal] = useState(false);
@@ -120,21 +123,52 @@ export default function NuevaFacturaModal({ open, onClose, onSuccess }: NuevaFac
     setCart(cart.filter((i) => i.id !== id));
   };
 
-  const total = cart.reduce(
-    (sum, item) => sum + (item.overridePrice ?? item.precio) * item.cantidad,
-    0
-  );
+  // The server prices the cart from its catalog (pos/quote); the local sum is
+  // shown only until the quote for the current cart arrives.
+  const [quote, setQuote] = useState<PosQuote | null>(null);
+  useEffect(() => {
+    setQuote(null);
+    if (!cart.length) return;
+    let cancelled = false;
+    const handle = setTimeout(() => {
+      api
+        .posQuote(
+          cart.map((i) => ({
+            productId: i.id,
+            qty: i.cantidad,
+            unit_price: i.overridePrice ?? i.precio,
+            override: Boolean(i.overridePrice),
+            isUsed: false,
+          })),
+          overrideToken
+        )
+        .then((res) => {
+          if (!cancelled) setQuote(res);
+        })
+        .catch(() => {});
+    }, 300);
+    return () => {
+      cancelled = true;
+      clearTimeout(handle);
+    };
+  }, [cart, overrideToken]);
 
-  const handlePriceChange = (id: number, price: number) => {
+  const total = quote
+    ? quote.total
+    : cart.reduce((sum, item) => sum + (item.overridePrice ?? item.precio) * item.cantidad, 0);
+
+  const handlePriceChange = (id: number, price: number, token?: string) => {
     setCart(
       cart.map((it) =>
         it.id === id ? { ...it, overridePrice: price, override: true } : it
       )
     );
+    if (token) setOverrideToken(token);
   };
 
   const clearCart = () => {
     setCart([]);
+    setOverrideToken(undefined);
   };
 
   const handleCategoryFilter = (categories: number[]) => {
@@ -153,6 +187,7 @@ export default function NuevaFacturaModal({ open, onClose, onSuccess }: NuevaFac
 
   const handleClose = () => {
     setCart([]);
+    setOverrideToken(undefined);
     setSearchTerm('');
     setItemType('all');
     setSelectedCategories([]);
@@ -169,6 +204,7 @@ export default function NuevaFacturaModal({ open, onClose, onSuccess }: NuevaFac
           }}
           items={cart}
           total={total}
+          overrideToken={overrideToken}
           onCloseParent={() => {
             // Cerrar el modal de Nueva Factura cuando se muestra la confirmación
             // para que no se vea por detrás
@@ -179,6 +215,7 @@ export default function NuevaFacturaModal({ open, onClose, onSuccess }: NuevaFac
             // Cuando el checkout es exitoso, pasar los datos de la venta al callback
             // Limpiar el estado
             setCart([]);
+            setOverrideToken(undefined);
             setSearchTerm('');
             setItemType('all');
             setSelectedCategories([]);
@@ -427,6 +464,11 @@ export default function NuevaFacturaModal({ open, onClose, onSuccess }: NuevaFac
                 </div>
                 <div className="pt-3 border-t flex justify-end flex-shrink-0">
                   <div className="text-right">
+                    {quote && (
+                      <div className="text-xs text-muted-foreground">
+                        Subtotal ${quote.subtotal.toFixed(2)} · IVA {quote.iva_porcentaje}% ${quote.iva_monto.toFixed(2)}
+                      </div>
+                    )}
                     <span className="text-sm text-muted-foreground">Total: </span>
                     <span className="text-lg font-bold text-primary">${total.toFixed(2)}</span>
                   </div>
@@ -18,7 +18,7 @@ export interface POSCartItem {
 interface CartItemProps {
   item: POSCartItem;
   onRemove: (id: number) => void;
-  onPriceChange: (id: number, price: number) => void;
+  onPriceChange: (id: number, price: number, overrideToken?: string) => void;
 }
 
 export default function CartItem({ item, onRemove, onPriceChange }: CartItemProps) {
@@ -71,8 +71,8 @@ export default function CartItem({ item, onRemove, onPriceChange }: CartItemProp
           item={item}
           open={open}
           onClose={() => setOpen(false)}
-          onApply={(price) => {
-            onPriceChange(item.id, price);
+          onApply={(price, overrideToken) => {
+            onPriceChange(item.id, price, overrideToken);
             setOpen(false);
           }}
         />
@@ -11,7 +11,7 @@ interface Props {
   open: boolean;
   onClose: () => void;
   item: POSCartItem;
-  onApply: (price: number) => void;
+  onApply: (price: number, overrideToken?: string) => void;
 }
 
 export default function ChangePriceModal({ open, onClose, item, onApply }: Props) {
@@ -63,7 +63,7 @@ export default function ChangePriceModal({ open, onClose, item, onApply }: Props
     try {
       const res = await api.validateOverrideCode(code);
       if (res.ok) {
-        onApply(numPrice);
+        onApply(numPrice, res.override_token);
         toast({ title: 'Precio actualizado' });
         onClose();
         return;
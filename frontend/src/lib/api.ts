@@ -185,6 +185,7 @@ interface PaginatedResponse<T> {
   total_pages?: number;
   next?: string | null;
   previous?: string | null;
+  next_cursor?: string | null;
   results: T[];
 }
 
@@ -200,6 +201,15 @@ export interface HistorialMovimiento {
   venta_numero?: string | null;
 }
 interface CheckoutItem { productId: number; qty: number; unit_price: number; override?: boolean; isUsed: boolean }
+// Respuesta de pos/quote: precios del catálogo del servidor y desglose de IVA.
+export interface PosQuote {
+  items: Array<{ productId: number; qty: number; precio: number; unit_price: number; subtotal: number; override: boolean }>;
+  subtotal: number;
+  iva_porcentaje: number;
+  iva_monto: number;
+  total: number;
+  override_authorized: boolean;
+}
 interface CheckoutTotals { total: number }
 interface CheckoutPayload {
   saleType: 'DIRECT' | 'CREDIT'
@@ -211,6 +221,16 @@ interface CheckoutPayload {
   changeDue: number
   reference?: string
   observaciones?: string
+  overrideToken?: string
+}
+const CHECKOUT_TIMEOUT_MS = 8000;
+const CHECKOUT_MAX_ATTEMPTS = 3;
+
+function newIdempotencyKey() {
+  if (typeof crypto !== 'undefined' && typeof crypto.randomUUID === 'function') {
+    return crypto.randomUUID();
+  }
+  return `${Date.now().toString(36)}-${Math.random().toString(36).slice(2)}`;
 }
 export async function searchClientes(q: string, signal?: AbortSignal) {
   const apiBase = getApiBaseUrl();
@@ -286,6 +306,7 @@ export const api = {
     end?: string;
     page?: number;
     page_size?: number;
+    cursor?: string;
     q?: string;
   } = {}): Promise<PaginatedResponse<HistorialMovimiento>> => {
     const params = new URLSearchParams();
@@ -296,6 +317,7 @@ export const api = {
     if (opts.end) params.set('end', opts.end);
     if (opts.page) params.set('page', String(opts.page));
     if (opts.page_size) params.set('page_size', String(opts.page_size));
+    if (opts.cursor) params.set('cursor', opts.cursor);
     if (opts.q) params.set('q', opts.q);
     const q = params.toString();
     return request(`/historial-ventas/${q ? `?${q}` : ''}`);
@@ -355,6 +377,28 @@ export const api = {
   // Reportes
   getReportesDashboard: (section: 'new' | 'used' | 'all' = 'all') =>
     request(`/reportes/dashboard/?section=${section}`),
+  getReportesDashboardStats: (section: 'new' | 'used' | 'all' = 'all') =>
+    request(`/reportes/dashboard/stats/?section=${section}`),
+  getReportesDashboardChart: (
+    section: 'new' | 'used' | 'all' = 'all',
+    period: 'diario' | 'quincenal' | 'mensual' | 'todos' = 'diario'
+  ) => request(`/reportes/dashboard/chart/?section=${section}&period=${period}`),
+  getReportesDashboardTopProducts: (section: 'new' | 'used' | 'all' = 'all') =>
+    request(`/reportes/dashboard/top-products/?section=${section}`),
+  getReportesDashboardRecent: (section: 'new' | 'used' | 'all' = 'all') =>
+    request(`/reportes/dashboard/recent/?section=${section}`),
+  getProductosVelocidad: (
+    params: { desde?: string; hasta?: string; section?: 'new' | 'used' | 'all'; producto?: number; limit?: number } = {}
+  ) => {
+    const queryParams = new URLSearchParams();
+    if (params.desde) queryParams.set('desde', params.desde);
+    if (params.hasta) queryParams.set('hasta', params.hasta);
+    if (params.section) queryParams.set('section', params.section);
+    if (params.producto) queryParams.set('producto', String(params.producto));
+    if (params.limit) queryParams.set('limit', String(params.limit));
+    const q = queryParams.toString();
+    return request(`/reportes/productos/velocidad/${q ? `?${q}` : ''}`);
+  },
   getVentasTotal: (start?: string, end?: string) => {
     const params = new URLSearchParams();
     if (start) params.set('start', start);
@@ -387,6 +431,7 @@ export const api = {
     return request(`/ventas/search/?${params.toString()}`);
   },
   createDevolucion: (data: unknown) => csrfRequest('/devoluciones/', 'POST', data),
+  previewDevolucion: (data: unknown) => csrfRequest('/devoluciones/preview/', 'POST', data),
   exportDevoluciones: async (
     format: 'pdf' | 'xlsx' | 'docx',
     mode: 'daily' | 'monthly' | 'quincenal' | 'all' | 'range',
@@ -683,24 +728,61 @@ export const api = {
   // Health
   health: () => request("/health/"),
   // POS Checkout
-  posCheckout: async (data: CheckoutPayload) => {
+  posCheckout: async (data: CheckoutPayload, idempotencyKey: string = newIdempotencyKey()) => {
     const csrftoken = getCookie("csrftoken");
     const apiBase = getApiBaseUrl();
-    const res = await fetch(`${apiBase}/pos/checkout`, {
-      method: "POST",
-      credentials: "include",
-      headers: {
-        "Content-Type": "application/json",
-        "X-CSRFToken": csrftoken,
-      },
-      body: JSON.stringify(data),
-    });
-    if (!res.ok) {
-      const err = await res.json().catch(() => ({ detail: res.statusText }));
+    // El mismo Idempotency-Key en cada reintento: el backend devuelve la venta
+    // original en lugar de crear un duplicado si el primer intento sí llegó.
+    let res: Response | null = null;
+    for (let attempt = 1; attempt <= CHECKOUT_MAX_ATTEMPTS; attempt++) {
+      const controller = new AbortController();
+      const timer = setTimeout(() => controller.abort(), CHECKOUT_TIMEOUT_MS);
+      try {
+        res = await fetch(`${apiBase}/pos/checkout`, {
+          method: "POST",
+          credentials: "include",
+          headers: {
+            "Content-Type": "application/json",
+            "X-CSRFToken": csrftoken,
+            "Idempotency-Key": idempotencyKey,
+          },
+          body: JSON.stringify(data),
+          signal: controller.signal,
+        });
+        if (res.status < 500 || attempt === CHECKOUT_MAX_ATTEMPTS) break;
+      } catch (err) {
+        if (attempt === CHECKOUT_MAX_ATTEMPTS) throw err;
+      } finally {
+        clearTimeout(timer);
+      }
+    }
+    if (!res) throw new Error("Request failed");
+    const response = res;
+    if (!response.ok) {
+      const err = await response.json().catch(() => ({ detail: response.statusText }));
       throw new Error(err.detail || "Request failed");
     }
-    return res.json();
+    return response.json();
   },
+  // Reenvío de ventas encoladas sin conexión; cada venta lleva su idempotencyKey.
+  posCheckoutBatch: (sales: Array<CheckoutPayload & { idempotencyKey: string; soldAt?: string }>) =>
+    request('/pos/checkout/batch', {
+      method: 'POST',
+      headers: {
+        'Content-Type': 'application/json',
+        'X-CSRFToken': getCookie('csrftoken'),
+      },
+      body: JSON.stringify({ sales }),
+    }),
+  posQuote: (items: CheckoutItem[], overrideToken?: string): Promise<PosQuote> =>
+    request('/pos/quote', {
+      method: 'POST',
+      headers: {
+        'Content-Type': 'application/json',
+        'X-CSRFToken': getCookie('csrftoken'),
+      },
+      body: JSON.stringify({ items, overrideToken }),
+    }),
   validateOverrideCode: async (code: string) => {
     const apiBase = getApiBaseUrl();
     await fetch(`${apiBase}/csrf/`, { credentials: 'include' });
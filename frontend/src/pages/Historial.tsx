@@ -1,4 +1,4 @@
-import { useState, useEffect } from 'react';
+import { useState, useEffect, useRef } from 'react';
 import { api, type HistorialMovimiento } from '@/lib/api';
 import { Input } from '@/components/ui/input';
 import { Table, TableBody, TableCell, TableHead, TableHeader, TableRow } from '@/components/ui/table';
@@ -34,6 +34,8 @@ export default function Historial() {
   const pageSize = 30;
   const [totalPages, setTotalPages] = useState(1);
   const [totalCount, setTotalCount] = useState(0);
+  // Cursor for each page reached by next_cursor, for the current filters.
+  const cursors = useRef<{ key: string; pages: Record<number, string> }>({ key: '', pages: {} });
 
   const modeMap: Record<QuickRange | 'rango', 'daily' | 'quincenal' | 'monthly' | 'all' | 'range'> = {
     diario: 'daily',
@@ -56,7 +58,11 @@ export default function Historial() {
         if (range.end) params.end = format(range.end, 'yyyy-MM-dd');
       }
       if (searchTerm.trim()) params.q = searchTerm.trim();
+      const key = [params.mode, params.start, params.end, params.q].join('|');
+      if (cursors.current.key !== key) cursors.current = { key, pages: {} };
+      if (cursors.current.pages[page]) params.cursor = cursors.current.pages[page];
       const data = await api.getHistorialVentas(params);
+      if (data.next_cursor) cursors.current.pages[page + 1] = data.next_cursor;
       setVentas(data.results);
       const totalPagesCalc = data.total_pages ?? Math.max(1, Math.ceil(data.count / data.page_size));
       setTotalPages(totalPagesCalc);
@@ -1,5 +1,6 @@
 import { useState, useEffect, useMemo } from 'react';
 import { useSearchParams } from 'react-router-dom';
+import { useQuery } from '@tanstack/react-query';
 import { Card, CardContent, CardHeader, CardTitle } from '@/components/ui/card';
 import { Button } from '@/components/ui/button';
 import { Tabs, TabsList, TabsTrigger } from '@/components/ui/tabs';
@@ -57,71 +58,82 @@ export default function Reportes() {
     }
   }, [filterOptions, activeFilter]);
 
-  const [salesData, setSalesData] = useState<Record<FilterType, any[]>>({
-    diario: [],
-    quincenal: [],
-    mensual: [],
-    todos: [],
-  });
-  const [summaryStats, setSummaryStats] = useState<SummaryStat[]>([]);
-  const [recentSales, setRecentSales] = useState<any[]>([]);
-  const [lowStockItems, setLowStockItems] = useState<any[]>([]);
-  const [categoryData, setCategoryData] = useState<any[]>([]);
-  const [topProducts, setTopProducts] = useState<any[]>([]);
-
   useEffect(() => {
     setSearchParams({ section }, { replace: true });
-    api.getReportesDashboard(section)
-      .then(data => {
-        setSalesData(data.sales_chart);
-        const statsData: SummaryStat[] = [
-          {
-            key: 'totalProductos',
-            title: 'Total Productos',
-            value: String(data.stats.total_productos),
-            change: '',
-            icon: Package,
-            changeType: 'neutral',
-            iconClassName: 'text-primary',
-          },
-          {
-            key: 'creditosPendientes',
-            title: 'Créditos Pendientes',
-            value: Number(data.stats.creditos_pendientes).toLocaleString('en-US', { style: 'currency', currency: 'USD' }),
-            change: '',
-            icon: ShoppingBag,
-            changeType: 'neutral',
-            iconClassName: 'text-primary',
-          },
-          {
-            key: 'valorInventario',
-            title: 'Valor Inventario',
-            value: Number(data.stats.valor_inventario).toLocaleString('en-US', { style: 'currency', currency: 'USD' }),
-            change: '',
-            icon: Package,
-            changeType: 'neutral',
-            iconClassName: 'text-primary',
-          },
-          {
-            key: 'devolucionesMensuales',
-            title: 'Devoluciones Mensuales',
-            value: Number(data.stats.devoluciones_mensuales).toLocaleString('en-US', { style: 'currency', currency: 'USD' }),
-            change: '',
-            icon: RotateCcw,
-            changeType: 'neutral',
-            iconClassName: 'text-warning',
-          },
-        ];
-        setSummaryStats(statsData);
-        setRecentSales(data.recent_sales);
-        setLowStockItems(data.low_stock_items);
-        const colors = ['#00D9FF', '#0099CC', '#007399', '#004D66', '#002633'];
-        setCategoryData(data.category_data.map((c: any, idx: number) => ({ ...c, color: colors[idx % colors.length] })));
-        setTopProducts(data.top_products);
-      })
-      .catch(err => console.error(err));
   }, [section, setSearchParams]);
 
+  // Each part of the dashboard has its own endpoint and cache, so they load
+  // in parallel and every card renders as soon as its data arrives.
+  const { data: statsData } = useQuery({
+    queryKey: ['reportes-dashboard', 'stats', section],
+    queryFn: () => api.getReportesDashboardStats(section),
+  });
+  const { data: chartData } = useQuery({
+    queryKey: ['reportes-dashboard', 'chart', section, activeFilter],
+    queryFn: () => api.getReportesDashboardChart(section, activeFilter),
+  });
+  const { data: topData } = useQuery({
+    queryKey: ['reportes-dashboard', 'top-products', section],
+    queryFn: () => api.getReportesDashboardTopProducts(section),
+  });
+  const { data: recentData } = useQuery({
+    queryKey: ['reportes-dashboard', 'recent', section],
+    queryFn: () => api.getReportesDashboardRecent(section),
+  });
+
+  const salesData: any[] = chartData?.data ?? [];
+  const recentSales: any[] = recentData?.recent_sales ?? [];
+  const lowStockItems: any[] = statsData?.low_stock_items ?? [];
+  const topProducts: any[] = topData?.top_products ?? [];
+
+  const categoryData = useMemo(() => {
+    const colors = ['#00D9FF', '#0099CC', '#007399', '#004D66', '#002633'];
+    return (statsData?.category_data ?? []).map((c: any, idx: number) => ({ ...c, color: colors[idx % colors.length] }));
+  }, [statsData]);
+
+  const summaryStats = useMemo<SummaryStat[]>(() => {
+    if (!statsData) return [];
+    const stats = statsData.stats;
+    return [
+      {
+        key: 'totalProductos',
+        title: 'Total Productos',
+        value: String(stats.total_productos),
+        change: '',
+        icon: Package,
+        changeType: 'neutral',
+        iconClassName: 'text-primary',
+      },
+      {
+        key: 'creditosPendientes',
+        title: 'Créditos Pendientes',
+        value: Number(stats.creditos_pendientes).toLocaleString('en-US', { style: 'currency', currency: 'USD' }),
+        change: '',
+        icon: ShoppingBag,
+        changeType: 'neutral',
+        iconClassName: 'text-primary',
+      },
+      {
+        key: 'valorInventario',
+        title: 'Valor Inventario',
+        value: Number(stats.valor_inventario).toLocaleString('en-US', { style: 'currency', currency: 'USD' }),
+        change: '',
+        icon: Package,
+        changeType: 'neutral',
+        iconClassName: 'text-primary',
+      },
+      {
+        key: 'devolucionesMensuales',
+        title: 'Devoluciones Mensuales',
+        value: Number(stats.devoluciones_mensuales).toLocaleString('en-US', { style: 'currency', currency: 'USD' }),
+        change: '',
+        icon: RotateCcw,
+        changeType: 'neutral',
+        iconClassName: 'text-warning',
+      },
+    ];
+  }, [statsData]);
+
   const getFilterTitle = (filter: FilterType) => {
     const titles = {
       diario: 'Ventas Diarias (Esta Semana)',
@@ -297,7 +309,7 @@ export default function Reportes() {
           <CardContent>
             <div className="h-64 md:h-80">
               <ResponsiveContainer width="100%" height="100%">
-                <BarChart data={salesData[activeFilter]}>
+                <BarChart data={salesData}>
                   <CartesianGrid strokeDasharray="3 3" stroke="hsl(var(--border))" />
                   <XAxis 
                     dataKey="periodo" 
@@ -339,7 +351,7 @@ export default function Reportes() {
             <CardContent>
               <div className="h-64 md:h-80">
                 <ResponsiveContainer width="100%" height="100%">
-                  <BarChart data={salesData[activeFilter]}>
+                  <BarChart data={salesData}>
                     <CartesianGrid strokeDasharray="3 3" stroke="hsl(var(--border))" />
                     <XAxis 
                       dataKey="periodo" 
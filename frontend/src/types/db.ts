@@ -20,6 +20,7 @@ export interface Cliente {
   contribuyente_iva?: boolean;
   observaciones?: string | null;
   fecha_ultima_compra?: string | null;
+  compras_count?: number;
 }
 
 export interface Categoria {